@@ -1,5 +1,6 @@
-import inspect
 from hrc.dev import Character
+from hrc.rule.BaseRule.CharacterCard import CardSchema
+from hrc.rule.BaseRule.Template import compile_template
 from typing import Literal, Union, Optional
 
 
@@ -649,12 +650,60 @@ class BRPCharacter(Character):
     def t_equipment(self) -> Equipment: ...
 
 
-brp = BRPCharacter()
+# 批量生成角色卡：每一列属性一次掷完，衍生属性按列计算
+BRP_CARD_ROLLS = {
+    "STR": "3D6",
+    "CON": "3D6",
+    "SIZ": "2D6+6",
+    "INT": "2D6+6",
+    "POW": "3D6",
+    "DEX": "3D6",
+    "APP": "3D6",
+}
+
+
+def _brp_damage_bonus(cards):
+    import numpy as np
+
+    total = cards["STR"] + cards["SIZ"]
+    return np.select(
+        [total <= 12, total <= 16, total <= 24, total <= 32, total <= 40],
+        ["-1D6", "-1D4", "", "+1D4", "+1D6"],
+        "+2D6",
+    )
+
+
+BRP_CARD_DERIVED = {
+    "MOV": lambda cards: 10,
+    "HP": lambda cards: (cards["CON"] + cards["SIZ"] + 1) // 2,
+    "PP": lambda cards: cards["POW"],
+    "DB": _brp_damage_bonus,
+    "STRENGTH_CHECK": lambda cards: cards["STR"] * 5,
+    "ENDURANCE_CHECK": lambda cards: cards["CON"] * 5,
+    "INSPIRATION_CHECK": lambda cards: cards["INT"] * 5,
+    "LUCK_CHECK": lambda cards: cards["POW"] * 5,
+    "DEXTERITY_CHECK": lambda cards: cards["DEX"] * 5,
+    "CHARM_CHECK": lambda cards: cards["APP"] * 5,
+}
+
+
+# 模板只解析一次：字段、类型、可选值和说明都来自编译好的模式（并缓存到磁盘）
+BRP_SKILLS = compile_template(Skills)
+
+# 紧凑存储：每个属性和技能占一个固定位置，数值保存在一个 16 位整数数组里
+BRP_CARD_SCHEMA = CardSchema(
+    [*BRP_CARD_ROLLS, *(field.name for field in BRP_SKILLS.fields)]
+)
+
+
+def generate_brp_cards(n, seed=None):
+    from hrc.rule.BaseRule.CharacterCard import generate_cards
+
+    return generate_cards(n, BRP_CARD_ROLLS, BRP_CARD_DERIVED, seed=seed)
+
 
 class_docstring = BRPCharacter.__doc__
 print(f"{class_docstring}")
 
-for name, method in inspect.getmembers(brp, predicate=inspect.ismethod):
-    if name.startswith("t_"):
-        print(f"{method.__doc__}")
-        print(f"{inspect.signature(method).return_annotation.__doc__}")
+for template in (Identity, Attributes, AttributesCheck, Skills):
+    print(compile_template(template).render_help())
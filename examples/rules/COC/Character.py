@@ -4,8 +4,10 @@ import math
 from typing import Union
 from dataclasses import dataclass
 
+from hrc.core import Core
+from hrc.dependencies import Depends
 from hrc.rule import Rule
-from hrc.rule.BaseRule import CharacterCard
+from hrc.rule.BaseRule import CardStore, CharacterCard
 
 aliases = Rule.aliases
 
@@ -37,7 +39,7 @@ class Attributes(CharacterCard.Attribute):
 
     @aliases(["HitPoints", "生命值", "生命"], ignore_case=True)
     def HP(self) -> Union[str, int, None]:
-        return self.MAX_HP
+        return self.MAX_HP()
 
     @aliases(["最大生命值", "HitPointTotal", "总生命值"], ignore_case=True)
     def MAX_HP(self) -> Union[str, int, None]:
@@ -130,3 +132,82 @@ class Attributes(CharacterCard.Attribute):
     @aliases(["动物驯养", "驯兽", "AnimalHandling"], ignore_case=True)
     def ANIMAL_HANDLING(self) -> Union[str, int, None]:
         return 1
+
+
+# Bulk generation: every attribute column is rolled at once, derived
+# attributes are computed column by column like the methods above
+CARD_ROLLS = {
+    "STR": "3d6*5",
+    "CON": "3d6*5",
+    "SIZ": "(2d6+6)*5",
+    "DEX": "3d6*5",
+    "APP": "3d6*5",
+    "INT": "(2d6+6)*5",
+    "POW": "3d6*5",
+    "EDU": "(2d6+6)*5",
+    "LUCK": "3d6*5",
+}
+
+
+def _damage_bonus(cards):
+    import numpy as np
+
+    total = cards["STR"] + cards["SIZ"]
+    extra = np.char.add(np.ceil((total - 164) / 80).astype(int).astype(str), "D6")
+    return np.select(
+        [total > 164, total > 124, total > 84, total > 64],
+        [extra, "1D4", "0", "-1"],
+        "-2",
+    )
+
+
+def _build(cards):
+    import numpy as np
+
+    total = cards["STR"] + cards["SIZ"]
+    return np.select(
+        [total > 164, total > 124, total > 84, total > 64],
+        [np.ceil((total - 84) / 80).astype(int), 1, 0, -1],
+        -2,
+    )
+
+
+def _mov(cards):
+    mov = (
+        8
+        + ((cards["STR"] > cards["SIZ"]) & (cards["DEX"] > cards["SIZ"]))
+        - ((cards["SIZ"] > cards["STR"]) & (cards["SIZ"] > cards["DEX"]))
+    )
+    if "AGE" in cards:
+        mov = mov - (cards["AGE"] >= 40) * (cards["AGE"] // 10 - 3)
+    return mov
+
+
+CARD_DERIVED = {
+    "MAX_HP": lambda cards: (cards["CON"] + cards["SIZ"]) // 10,
+    "HP": lambda cards: cards["MAX_HP"],
+    "SAN": lambda cards: cards["POW"],
+    "MP": lambda cards: cards["POW"] // 5,
+    "DB": _damage_bonus,
+    "BUILD": _build,
+    "MOV": _mov,
+    "PI": lambda cards: cards["INT"] * 2,
+    "DODGE": lambda cards: cards["DEX"] // 2,
+}
+
+
+def generate_cards(n, seed=None):
+    return CharacterCard.generate_cards(n, CARD_ROLLS, CARD_DERIVED, seed=seed)
+
+
+CARD_SCHEMA = CharacterCard.CardSchema([*CARD_ROLLS, "AGE", "HP", "SAN", "MP"])
+
+
+class Cards(CardStore.CardStore):
+    """All investigators, found by user id and group id."""
+
+    core: Core = Depends(Core)
+
+    def __init__(self):
+        super().__init__(CARD_SCHEMA, indexes=["SAN", "HP"])
+        self.core.register_card_store("coc", self)
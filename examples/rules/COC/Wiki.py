@@ -1,3 +1,12 @@
 # MyRule
+from hrc.rule.BaseRule import Wiki as BaseWiki
 
-class Wiki(): ...
\ No newline at end of file
+
+class Wiki(BaseWiki.Wiki):
+    """Built with ``python -m hrc.rule.BaseRule.Wiki``.
+
+    The COC character templates define no terms, so ``suggest`` offers the
+    words of the books.
+    """
+
+    books = {"BRP": "rule_book/BRP SRD 1.0 CHN.wiki"}
@@ -4,7 +4,7 @@ from hrc.core import Core
 from hrc.rule import Rule, BaseRule  # noqa: F401
 from hrc.dependencies import Depends
 
-from .Character import Attributes
+from .Character import Attributes, Cards
 from .Wiki import Wiki
 from .Command import Command
 
@@ -13,20 +13,43 @@ core = Core()
 class COC7(Rule):
 
     # 规则、指令、词条，必须至少实现任意一个
-    attr: Attributes = Depends()  # CharacterCard.Attribute
-    wiki: Wiki = Depends()  # Wiki
-    cmd: Command = Depends()  # Command  # noqa: F821
+    attr: Attributes = Depends(scope="session")  # CharacterCard.Attribute
+    wiki: Wiki = Depends(scope="app")  # Wiki
+    cmd: Command = Depends(scope="app")  # Command  # noqa: F821
+    cards: Cards = Depends(scope="app")
+
+    @property
+    def pc(self):
+        """The card of the sender in the current group."""
+        return self.cards.get(
+            self.event.get_sender_id(), getattr(self.event, "group_id", None)
+        )
     
     async def handle(self): ...
     
     async def rule(self): ...
 
+    @Rule.command("wiki")
+    async def lookup(self, query: str):
+        hits = self.wiki.search(query, limit=3)
+        if not hits:
+            suggestions = self.wiki.suggest(query, limit=3)
+            await self.event.reply(
+                f"未找到：{query}"
+                + ("，你要找的是不是：" if suggestions else "")
+                + "、".join(match.term for match in suggestions)
+            )
+            return
+        await self.event.reply(
+            "\n".join(f"[{book} p{hit.page}] {hit.snippet}" for book, hit in hits)
+        )
+
     @core.event_postprocessor_hook
     async def auto_card(self):
         if self.session and self.session.gid and self.ac:
             if hasattr(self.pc.trans, "生命") or hasattr(self.pc.trans, "理智"):
                 self.event.call_back(
-                    "set_group_card", self.pc.gid, f"card#{self.pc.uid}", await self.overview_card()
+                    "set_group_card", self.pc.group, f"card#{self.pc.owner}", await self.overview_card()
                 )
 
     async def overview_card(self):
@@ -0,0 +1,706 @@
+//! Dice expressions: parsing, compiling to a small stack program and rolling.
+//!
+//! Grammar, whitespace is ignored and letters are case-insensitive:
+//!
+//! ```text
+//! expr  := term (('+' | '-') term)*
+//! term  := unary (('*' | 'x' | '×' | '/') unary)*
+//! unary := '-' unary | atom
+//! atom  := NUMBER | NUMBER? 'd' NUMBER? keep? | ('b' | 'p') NUMBER? | '(' expr ')'
+//! keep  := 'k' ('h' | 'l')? NUMBER
+//! ```
+//!
+//! `d` without sides rolls a d100, `4d6k3` keeps the three highest dice and
+//! `4d6kl1` the lowest one. `b2` and `p1` are the d100 with two bonus dice
+//! and one penalty die of Call of Cthulhu. Division rounds towards negative
+//! infinity, like `//` in Python.
+
+use rand::Rng;
+use std::fmt;
+
+/// Maximum number of dice rolled by a single `NdM`.
+pub const MAX_DICE: u32 = 1000;
+/// Maximum number of sides of a die.
+pub const MAX_SIDES: u32 = 1_000_000;
+/// Maximum number of bonus or penalty dice.
+pub const MAX_BONUS: u32 = 10;
+
+const DEFAULT_SIDES: u32 = 100;
+
+#[derive(Debug, Clone, PartialEq, Eq)]
+pub enum DiceError {
+    /// The expression is malformed, `pos` is a character offset in the
+    /// expression with whitespace removed.
+    Syntax { pos: usize, message: String },
+    /// The expression exceeds one of the limits.
+    Limit(String),
+    DivisionByZero,
+    Overflow,
+}
+
+impl fmt::Display for DiceError {
+    fn fmt(&self, f: &mut fmt::Formatter<'_>) -> fmt::Result {
+        match self {
+            DiceError::Syntax { pos, message } => write!(f, "{} at position {}", message, pos),
+            DiceError::Limit(message) => f.write_str(message),
+            DiceError::DivisionByZero => f.write_str("division by zero"),
+            DiceError::Overflow => f.write_str("dice result overflow"),
+        }
+    }
+}
+
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum Keep {
+    All,
+    Highest(u32),
+    Lowest(u32),
+}
+
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum Op {
+    Const(i64),
+    Roll { count: u32, sides: u32, keep: Keep },
+    Bonus { dice: u32, penalty: bool },
+    Add,
+    Sub,
+    Mul,
+    Div,
+    Neg,
+}
+
+/// A compiled dice expression, rolled any number of times.
+#[derive(Debug, Clone)]
+pub struct Program {
+    pub source: String,
+    pub ops: Vec<Op>,
+    depth: usize,
+    max_dice: usize,
+}
+
+impl Program {
+    pub fn compile(source: &str) -> Result<Program, DiceError> {
+        let chars: Vec<char> = source
+            .chars()
+            .filter(|c| !c.is_whitespace())
+            .flat_map(char::to_lowercase)
+            .collect();
+        let mut parser = Parser { chars: &chars, pos: 0, ops: Vec::new() };
+        parser.expr()?;
+        if parser.pos < chars.len() {
+            return Err(parser.error("unexpected character"));
+        }
+        let ops = parser.ops;
+
+        let (mut depth, mut max_depth, mut max_dice) = (0usize, 0usize, 0usize);
+        for op in &ops {
+            match op {
+                Op::Const(_) | Op::Bonus { .. } => depth += 1,
+                Op::Roll { count, keep, .. } => {
+                    depth += 1;
+                    if *keep != Keep::All {
+                        max_dice = max_dice.max(*count as usize);
+                    }
+                }
+                Op::Add | Op::Sub | Op::Mul | Op::Div => depth -= 1,
+                Op::Neg => {}
+            }
+            max_depth = max_depth.max(depth);
+        }
+        Ok(Program { source: source.to_string(), ops, depth: max_depth, max_dice })
+    }
+
+    /// Roll once.
+    pub fn roll<R: Rng>(&self, rng: &mut R) -> Result<i64, DiceError> {
+        let mut stack = Vec::with_capacity(self.depth);
+        let mut dice = Vec::with_capacity(self.max_dice);
+        self.eval(rng, &mut stack, &mut dice)
+    }
+
+    /// Roll `n` times, reusing the evaluation buffers.
+    pub fn roll_many<R: Rng>(&self, rng: &mut R, n: usize) -> Result<Vec<i64>, DiceError> {
+        let mut out = Vec::with_capacity(n);
+        let mut stack = Vec::with_capacity(self.depth);
+        let mut dice = Vec::with_capacity(self.max_dice);
+        for _ in 0..n {
+            out.push(self.eval(rng, &mut stack, &mut dice)?);
+        }
+        Ok(out)
+    }
+
+    fn eval<R: Rng>(
+        &self,
+        rng: &mut R,
+        stack: &mut Vec<i64>,
+        dice: &mut Vec<u32>,
+    ) -> Result<i64, DiceError> {
+        stack.clear();
+        for op in &self.ops {
+            match *op {
+                Op::Const(value) => stack.push(value),
+                Op::Roll { count, sides, keep } => stack.push(roll_dice(rng, count, sides, keep, dice)),
+                Op::Bonus { dice: n, penalty } => stack.push(roll_bonus(rng, n, penalty)),
+                Op::Neg => {
+                    let value = stack.pop().unwrap();
+                    stack.push(value.checked_neg().ok_or(DiceError::Overflow)?);
+                }
+                _ => {
+                    let rhs = stack.pop().unwrap();
+                    let lhs = stack.pop().unwrap();
+                    let value = match *op {
+                        Op::Add => lhs.checked_add(rhs),
+                        Op::Sub => lhs.checked_sub(rhs),
+                        Op::Mul => lhs.checked_mul(rhs),
+                        _ => {
+                            if rhs == 0 {
+                                return Err(DiceError::DivisionByZero);
+                            }
+                            lhs.checked_div(rhs).map(|q| {
+                                // Integer division truncates, round negative
+                                // inexact quotients down
+                                if lhs % rhs != 0 && (lhs < 0) != (rhs < 0) { q - 1 } else { q }
+                            })
+                        }
+                    };
+                    stack.push(value.ok_or(DiceError::Overflow)?);
+                }
+            }
+        }
+        Ok(stack.pop().unwrap())
+    }
+}
+
+fn roll_dice<R: Rng>(rng: &mut R, count: u32, sides: u32, keep: Keep, dice: &mut Vec<u32>) -> i64 {
+    match keep {
+        Keep::All => (0..count).map(|_| rng.gen_range(1..=sides) as i64).sum(),
+        Keep::Highest(k) | Keep::Lowest(k) => {
+            dice.clear();
+            dice.extend((0..count).map(|_| rng.gen_range(1..=sides)));
+            dice.sort_unstable();
+            let kept = if let Keep::Highest(_) = keep {
+                &dice[dice.len() - k as usize..]
+            } else {
+                &dice[..k as usize]
+            };
+            kept.iter().map(|&x| x as i64).sum()
+        }
+    }
+}
+
+fn roll_bonus<R: Rng>(rng: &mut R, n: u32, penalty: bool) -> i64 {
+    let units = rng.gen_range(0..10u32);
+    let tens = (0..=n).map(|_| rng.gen_range(0..10u32));
+    // A 0 on both the tens and the units die reads 100, so with a 0 units
+    // die the tens 0 is the worst result instead of the best
+    let score = |t: u32| if t == 0 && units == 0 { 100 } else { t * 10 + units };
+    let scores = tens.map(score);
+    (if penalty { scores.max() } else { scores.min() }).unwrap() as i64
+}
+
+struct Parser<'a> {
+    chars: &'a [char],
+    pos: usize,
+    ops: Vec<Op>,
+}
+
+impl<'a> Parser<'a> {
+    fn error(&self, message: &str) -> DiceError {
+        DiceError::Syntax { pos: self.pos, message: message.to_string() }
+    }
+
+    fn peek(&self) -> Option<char> {
+        self.chars.get(self.pos).copied()
+    }
+
+    fn eat(&mut self, c: char) -> bool {
+        if self.peek() == Some(c) {
+            self.pos += 1;
+            true
+        } else {
+            false
+        }
+    }
+
+    fn expr(&mut self) -> Result<(), DiceError> {
+        self.term()?;
+        loop {
+            let op = match self.peek() {
+                Some('+') => Op::Add,
+                Some('-') => Op::Sub,
+                _ => return Ok(()),
+            };
+            self.pos += 1;
+            self.term()?;
+            self.ops.push(op);
+        }
+    }
+
+    fn term(&mut self) -> Result<(), DiceError> {
+        self.unary()?;
+        loop {
+            let op = match self.peek() {
+                Some('*') | Some('x') | Some('×') => Op::Mul,
+                Some('/') => Op::Div,
+                _ => return Ok(()),
+            };
+            self.pos += 1;
+            self.unary()?;
+            self.ops.push(op);
+        }
+    }
+
+    fn unary(&mut self) -> Result<(), DiceError> {
+        if self.eat('-') {
+            self.unary()?;
+            self.ops.push(Op::Neg);
+            Ok(())
+        } else {
+            self.atom()
+        }
+    }
+
+    fn atom(&mut self) -> Result<(), DiceError> {
+        if self.eat('(') {
+            self.expr()?;
+            if !self.eat(')') {
+                return Err(self.error("expected ')'"));
+            }
+            return Ok(());
+        }
+        if let Some(c @ ('b' | 'p')) = self.peek() {
+            self.pos += 1;
+            let dice = self.number()?.unwrap_or(1);
+            if dice > MAX_BONUS as u64 {
+                return Err(DiceError::Limit(format!("at most {} bonus or penalty dice", MAX_BONUS)));
+            }
+            self.ops.push(Op::Bonus { dice: dice as u32, penalty: c == 'p' });
+            return Ok(());
+        }
+        let start = self.pos;
+        let count = self.number()?;
+        if !self.eat('d') {
+            return match count {
+                Some(value) => {
+                    self.ops.push(Op::Const(value as i64));
+                    Ok(())
+                }
+                None => {
+                    self.pos = start;
+                    Err(self.error(if self.peek().is_none() { "unexpected end" } else { "unexpected character" }))
+                }
+            };
+        }
+        let count = count.unwrap_or(1);
+        let sides = self.number()?.unwrap_or(DEFAULT_SIDES as u64);
+        if count == 0 || count > MAX_DICE as u64 {
+            return Err(DiceError::Limit(format!("dice count must be between 1 and {}", MAX_DICE)));
+        }
+        if sides == 0 || sides > MAX_SIDES as u64 {
+            return Err(DiceError::Limit(format!("dice sides must be between 1 and {}", MAX_SIDES)));
+        }
+        let keep = if self.eat('k') {
+            let lowest = self.eat('l');
+            if !lowest {
+                self.eat('h');
+            }
+            let kept = self.number()?.ok_or_else(|| self.error("expected number of dice to keep"))?;
+            if kept == 0 {
+                return Err(self.error("must keep at least one die"));
+            }
+            match (kept >= count, lowest) {
+                (true, _) => Keep::All,
+                (false, true) => Keep::Lowest(kept as u32),
+                (false, false) => Keep::Highest(kept as u32),
+            }
+        } else {
+            Keep::All
+        };
+        self.ops.push(Op::Roll { count: count as u32, sides: sides as u32, keep });
+        Ok(())
+    }
+
+    fn number(&mut self) -> Result<Option<u64>, DiceError> {
+        let start = self.pos;
+        let mut value: u64 = 0;
+        while let Some(digit) = self.peek().and_then(|c| c.to_digit(10)) {
+            value = value
+                .checked_mul(10)
+                .and_then(|v| v.checked_add(digit as u64))
+                .filter(|&v| v <= i64::MAX as u64)
+                .ok_or(DiceError::Overflow)?;
+            self.pos += 1;
+        }
+        Ok(if self.pos > start { Some(value) } else { None })
+    }
+}
+
+/// Maximum number of values a distribution may span.
+pub const MAX_SUPPORT: usize = 1_000_000;
+/// Maximum number of multiply-adds spent on a single combination step.
+const MAX_WORK: usize = 100_000_000;
+
+/// The exact distribution of a dice expression.
+#[derive(Debug, Clone, PartialEq)]
+pub struct Distribution {
+    /// The smallest possible value.
+    pub min: i64,
+    /// `pmf[i]` is the probability of `min + i`.
+    pub pmf: Vec<f64>,
+}
+
+impl Distribution {
+    fn constant(value: i64) -> Distribution {
+        Distribution { min: value, pmf: vec![1.0] }
+    }
+
+    fn max(&self) -> i64 {
+        self.min + self.pmf.len() as i64 - 1
+    }
+
+    fn check(len: usize, work: usize) -> Result<(), DiceError> {
+        if len > MAX_SUPPORT || work > MAX_WORK {
+            return Err(DiceError::Limit("distribution is too large to compute".to_string()));
+        }
+        Ok(())
+    }
+
+    /// Product of work estimates, saturating instead of overflowing so that
+    /// huge inputs fail the limit check.
+    fn work(factors: &[usize]) -> usize {
+        factors.iter().fold(1, |acc: usize, &x| acc.saturating_mul(x))
+    }
+
+    /// The indexes of the first and last values with a non-zero probability.
+    fn support(&self) -> Option<(usize, usize)> {
+        let first = self.pmf.iter().position(|&q| q != 0.0)?;
+        let last = self.pmf.iter().rposition(|&q| q != 0.0)?;
+        Some((first, last))
+    }
+
+    /// `lhs / rhs` rounded towards negative infinity.
+    fn floor_div(lhs: i64, rhs: i64) -> Result<i64, DiceError> {
+        if rhs == 0 {
+            return Err(DiceError::DivisionByZero);
+        }
+        let q = lhs.checked_div(rhs).ok_or(DiceError::Overflow)?;
+        Ok(if lhs % rhs != 0 && (lhs < 0) != (rhs < 0) { q - 1 } else { q })
+    }
+
+    /// Sum of `count` dice with `sides` sides, each convolution with a die is
+    /// a sliding window sum.
+    fn dice(count: u32, sides: u32) -> Result<Distribution, DiceError> {
+        let (count, sides) = (count as usize, sides as usize);
+        Self::check(count * (sides - 1) + 1, Self::work(&[count, count, sides]))?;
+        let p = 1.0 / sides as f64;
+        let mut pmf = vec![1.0];
+        for _ in 0..count {
+            let mut next = vec![0.0; pmf.len() + sides - 1];
+            let mut window = 0.0;
+            for (i, slot) in next.iter_mut().enumerate() {
+                if i < pmf.len() {
+                    window += pmf[i];
+                }
+                if i >= sides {
+                    window -= pmf[i - sides];
+                }
+                *slot = window * p;
+            }
+            pmf = next;
+        }
+        Ok(Distribution { min: count as i64, pmf })
+    }
+
+    /// Sum of the `keep` highest (or lowest) of `count` dice.
+    ///
+    /// Faces are visited from the best to the worst one. The state is the
+    /// number of dice already placed and the number of them kept, the value
+    /// is the distribution of the kept sum. Placing `c` dice on a face has
+    /// `C(remaining, c) / sides^c` weight.
+    fn keep(count: u32, sides: u32, keep: u32, highest: bool) -> Result<Distribution, DiceError> {
+        let (n, m, k) = (count as usize, sides as usize, keep as usize);
+        let width = Self::work(&[k, m]).saturating_add(1);
+        Self::check(width, Self::work(&[m, n + 1, n + 1, k + 1, width]))?;
+        let p = 1.0 / m as f64;
+        let mut binomial = vec![vec![1.0f64; n + 1]; n + 1];
+        for i in 1..=n {
+            for j in 1..i {
+                binomial[i][j] = binomial[i - 1][j - 1] + binomial[i - 1][j];
+            }
+        }
+        let index = |used: usize, kept: usize| used * (k + 1) + kept;
+        let mut states = vec![Vec::new(); (n + 1) * (k + 1)];
+        states[index(0, 0)] = vec![1.0; 1];
+        let faces: Vec<usize> = if highest { (1..=m).rev().collect() } else { (1..=m).collect() };
+        for face in faces {
+            let mut next = vec![Vec::new(); states.len()];
+            for used in 0..=n {
+                for kept in 0..=k {
+                    let sums: &Vec<f64> = &states[index(used, kept)];
+                    if sums.is_empty() {
+                        continue;
+                    }
+                    let mut weight = 1.0;
+                    for c in 0..=n - used {
+                        let taken = c.min(k - kept);
+                        let target: &mut Vec<f64> = &mut next[index(used + c, kept + taken)];
+                        if target.len() < width {
+                            target.resize(width, 0.0);
+                        }
+                        let w = binomial[n - used][c] * weight;
+                        let shift = taken * face;
+                        for (s, &q) in sums.iter().enumerate() {
+                            if q != 0.0 {
+                                target[s + shift] += q * w;
+                            }
+                        }
+                        weight *= p;
+                    }
+                }
+            }
+            states = next;
+        }
+        let mut pmf = states.swap_remove(index(n, k));
+        let min = pmf.iter().position(|&q| q != 0.0).unwrap_or(0);
+        pmf.drain(..min);
+        while pmf.last() == Some(&0.0) {
+            pmf.pop();
+        }
+        Ok(Distribution { min: min as i64, pmf })
+    }
+
+    fn bonus(dice: u32, penalty: bool) -> Distribution {
+        let mut pmf = vec![0.0; 100];
+        let m = dice as i32 + 1;
+        for units in 0..10u32 {
+            let mut scores: Vec<u32> =
+                (0..10).map(|t| if t == 0 && units == 0 { 100 } else { t * 10 + units }).collect();
+            scores.sort_unstable();
+            if penalty {
+                scores.reverse();
+            }
+            // The best of m tens dice is the i-th best score when all of
+            // them are no better than it and not all are worse
+            for (i, score) in scores.into_iter().enumerate() {
+                let q = ((10 - i) as f64 / 10.0).powi(m) - ((9 - i) as f64 / 10.0).powi(m);
+                pmf[score as usize - 1] += q / 10.0;
+            }
+        }
+        Distribution { min: 1, pmf }
+    }
+
+    fn negate(self) -> Distribution {
+        let min = -self.max();
+        let mut pmf = self.pmf;
+        pmf.reverse();
+        Distribution { min, pmf }
+    }
+
+    fn combine(
+        &self,
+        other: &Distribution,
+        op: Op,
+    ) -> Result<Distribution, DiceError> {
+        if let Op::Add | Op::Sub = op {
+            let other = if op == Op::Sub { other.clone().negate() } else { other.clone() };
+            let len = self.pmf.len() + other.pmf.len() - 1;
+            Self::check(len, self.pmf.len() * other.pmf.len())?;
+            let mut pmf = vec![0.0; len];
+            for (i, &a) in self.pmf.iter().enumerate() {
+                if a != 0.0 {
+                    for (j, &b) in other.pmf.iter().enumerate() {
+                        pmf[i + j] += a * b;
+                    }
+                }
+            }
+            let min = self.min.checked_add(other.min).ok_or(DiceError::Overflow)?;
+            return Ok(Distribution { min, pmf });
+        }
+        Self::check(0, Self::work(&[self.pmf.len(), other.pmf.len()]))?;
+        let (Some((a0, a1)), Some((b0, b1))) = (self.support(), other.support()) else {
+            return Ok(Distribution::constant(0));
+        };
+        let (lhs_min, lhs_max) = (self.min + a0 as i64, self.min + a1 as i64);
+        // Bound the result from the extreme operands before computing it: a
+        // product is extreme at the corners, a quotient at the corners of
+        // each sign of the divisor, on the values closest to and furthest
+        // from zero.
+        let mut rhs_values = vec![other.min + b0 as i64, other.min + b1 as i64];
+        if op == Op::Div {
+            let value = |j: usize| other.min + j as i64;
+            let nonzero = |j: &usize| other.pmf[*j] != 0.0;
+            let negative = (b0..=b1).filter(nonzero).filter(|&j| value(j) < 0);
+            let positive = (b0..=b1).filter(nonzero).filter(|&j| value(j) > 0);
+            if (b0..=b1).filter(nonzero).any(|j| value(j) == 0) {
+                return Err(DiceError::DivisionByZero);
+            }
+            rhs_values = negative.clone().take(1).chain(negative.last()).map(value).collect();
+            rhs_values.extend(positive.clone().take(1).chain(positive.last()).map(value));
+        }
+        let apply = |lhs: i64, rhs: i64| -> Result<i64, DiceError> {
+            if op == Op::Mul {
+                lhs.checked_mul(rhs).ok_or(DiceError::Overflow)
+            } else {
+                Self::floor_div(lhs, rhs)
+            }
+        };
+        let (mut min, mut max) = (i64::MAX, i64::MIN);
+        for &lhs in &[lhs_min, lhs_max] {
+            for &rhs in &rhs_values {
+                let value = apply(lhs, rhs)?;
+                min = min.min(value);
+                max = max.max(value);
+            }
+        }
+        let len = usize::try_from(max.abs_diff(min)).ok().and_then(|x| x.checked_add(1)).unwrap_or(usize::MAX);
+        Self::check(len, 0)?;
+        let mut pmf = vec![0.0; len];
+        for i in a0..=a1 {
+            let a = self.pmf[i];
+            if a == 0.0 {
+                continue;
+            }
+            for j in b0..=b1 {
+                let b = other.pmf[j];
+                if b != 0.0 {
+                    let value = apply(self.min + i as i64, other.min + j as i64)?;
+                    pmf[(value - min) as usize] += a * b;
+                }
+            }
+        }
+        Ok(Distribution { min, pmf })
+    }
+}
+
+impl Program {
+    /// The exact distribution of the expression, dice are combined by
+    /// convolution.
+    pub fn distribution(&self) -> Result<Distribution, DiceError> {
+        let mut stack: Vec<Distribution> = Vec::with_capacity(self.depth);
+        for op in &self.ops {
+            let value = match *op {
+                Op::Const(value) => Distribution::constant(value),
+                Op::Roll { count, sides, keep: Keep::All } => Distribution::dice(count, sides)?,
+                Op::Roll { count, sides, keep: Keep::Highest(k) } => {
+                    Distribution::keep(count, sides, k, true)?
+                }
+                Op::Roll { count, sides, keep: Keep::Lowest(k) } => {
+                    Distribution::keep(count, sides, k, false)?
+                }
+                Op::Bonus { dice, penalty } => Distribution::bonus(dice, penalty),
+                Op::Neg => stack.pop().unwrap().negate(),
+                _ => {
+                    let rhs = stack.pop().unwrap();
+                    let lhs = stack.pop().unwrap();
+                    lhs.combine(&rhs, *op)?
+                }
+            };
+            stack.push(value);
+        }
+        Ok(stack.pop().unwrap())
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use rand::rngs::StdRng;
+    use rand::SeedableRng;
+
+    fn bounds(source: &str) -> (i64, i64) {
+        let program = Program::compile(source).unwrap();
+        let values = program.roll_many(&mut StdRng::seed_from_u64(7), 20000).unwrap();
+        (*values.iter().min().unwrap(), *values.iter().max().unwrap())
+    }
+
+    #[test]
+    fn compiles_to_postfix() {
+        let program = Program::compile("2d6 + 6").unwrap();
+        assert_eq!(
+            program.ops,
+            vec![Op::Roll { count: 2, sides: 6, keep: Keep::All }, Op::Const(6), Op::Add]
+        );
+        assert_eq!(Program::compile("D").unwrap().ops[0], Op::Roll { count: 1, sides: 100, keep: Keep::All });
+        assert_eq!(Program::compile("3d6k5").unwrap().ops[0], Op::Roll { count: 3, sides: 6, keep: Keep::All });
+    }
+
+    #[test]
+    fn rolls_stay_in_bounds() {
+        assert_eq!(bounds("3d6"), (3, 18));
+        assert_eq!(bounds("2d6+6"), (8, 18));
+        assert_eq!(bounds("1d100"), (1, 100));
+        assert_eq!(bounds("4d6kh3"), (3, 18));
+        assert_eq!(bounds("4d6kl1"), (1, 6));
+        assert_eq!(bounds("b2"), (1, 100));
+        assert_eq!(bounds("p1"), (1, 100));
+        assert_eq!(bounds("(2d6+6)*5"), (40, 90));
+        assert_eq!(bounds("-7/2"), (-4, -4));
+        assert_eq!(bounds("7/-2"), (-4, -4));
+    }
+
+    #[test]
+    fn bonus_dice_lower_the_mean() {
+        let mean = |source: &str| {
+            let program = Program::compile(source).unwrap();
+            let values = program.roll_many(&mut StdRng::seed_from_u64(7), 20000).unwrap();
+            values.iter().sum::<i64>() as f64 / values.len() as f64
+        };
+        assert!(mean("b1") < mean("d100") - 10.0);
+        assert!(mean("p1") > mean("d100") + 10.0);
+    }
+
+    #[test]
+    fn rejects_bad_expressions() {
+        for source in ["", "d6+", "(1d6", "1d6)", "4d6k", "4d6k0", "0d6", "1d0", "1001d6", "b11", "3e6"] {
+            assert!(Program::compile(source).is_err(), "{}", source);
+        }
+        let program = Program::compile("1/(1d1-1)").unwrap();
+        assert_eq!(program.roll(&mut StdRng::seed_from_u64(7)), Err(DiceError::DivisionByZero));
+    }
+
+    fn assert_matches_rolls(source: &str) {
+        let program = Program::compile(source).unwrap();
+        let dist = program.distribution().unwrap();
+        assert!((dist.pmf.iter().sum::<f64>() - 1.0).abs() < 1e-9, "{}", source);
+        let n = 200_000;
+        let values = program.roll_many(&mut StdRng::seed_from_u64(11), n).unwrap();
+        let mut counts = vec![0usize; dist.pmf.len()];
+        for value in values {
+            counts[(value - dist.min) as usize] += 1;
+        }
+        for (i, &q) in dist.pmf.iter().enumerate() {
+            let observed = counts[i] as f64 / n as f64;
+            assert!((observed - q).abs() < 0.005, "{} at {}: {} vs {}", source, dist.min + i as i64, observed, q);
+        }
+    }
+
+    #[test]
+    fn distribution_is_exact() {
+        let dist = Program::compile("3d6").unwrap().distribution().unwrap();
+        assert_eq!((dist.min, dist.pmf.len()), (3, 16));
+        assert!((dist.pmf[12 - 3] - 25.0 / 216.0).abs() < 1e-12);
+        let dist = Program::compile("2d6+6").unwrap().distribution().unwrap();
+        assert_eq!((dist.min, dist.pmf.len()), (8, 11));
+        let dist = Program::compile("4d6k3").unwrap().distribution().unwrap();
+        assert!((dist.pmf[18 - 3] - 21.0 / 1296.0).abs() < 1e-12);
+        assert!((dist.pmf[0] - 1.0 / 1296.0).abs() < 1e-12);
+    }
+
+    #[test]
+    fn distribution_matches_rolls() {
+        for source in ["3d6*5", "4d6kh3", "5d6kl2", "b2", "p1", "1d100", "-1d6/2", "1d6-1d4", "(1d4)x(1d4)"] {
+            assert_matches_rolls(source);
+        }
+        // The divisor is -3, -1, 1 or 3, the largest quotients are not at its ends
+        assert_matches_rolls("(1d6-3)/(1d4*2-5)");
+        assert_matches_rolls("(1d6-4)*(1d3-2)");
+    }
+
+    #[test]
+    fn distribution_limits_are_errors() {
+        for source in ["1000d1000000k500", "60d100*60d100", "1000d1000000/1d6"] {
+            let result = Program::compile(source).unwrap().distribution();
+            assert!(matches!(result, Err(DiceError::Limit(_))), "{}", source);
+        }
+        let result = Program::compile("1d6/(1d2-1)").unwrap().distribution();
+        assert_eq!(result, Err(DiceError::DivisionByZero));
+    }
+}
@@ -1,4 +1,47 @@
+from array import array
+from typing import Optional, Tuple
+
+
 class LibCore(object):
     """Core library for hydro roll"""
 
-    def __init__(self, name: str = ""): ...
\ No newline at end of file
+    def __init__(self, name: str = ""): ...
+
+def sum_as_string(a: int, b: int) -> str: ...
+
+class DiceExpr:
+    """A compiled dice expression such as ``3d6``, ``2d6+6``, ``4d6k3`` or ``b1``.
+
+    ``d`` without sides rolls a d100, ``k``/``kh`` keeps the highest dice and
+    ``kl`` the lowest ones, ``b``/``p`` are the bonus and penalty dice of Call
+    of Cthulhu. Division rounds down like ``//``.
+
+    Raises:
+        ValueError: The expression is malformed or rolls too many dice.
+    """
+
+    def __init__(self, expression: str) -> None: ...
+    @property
+    def expression(self) -> str: ...
+    def roll(self, seed: Optional[int] = None) -> int:
+        """Roll once."""
+    def roll_many(self, n: int, seed: Optional[int] = None) -> "array[int]":
+        """Roll ``n`` times without holding the GIL.
+
+        Returns:
+            The results as an ``array.array`` of type code ``q``.
+        """
+    def pmf(self) -> Tuple[int, "array[float]"]:
+        """The exact distribution, dice are combined by convolution.
+
+        Returns:
+            The smallest possible value and the probability of each value
+            from it on, as an ``array.array`` of type code ``d``.
+
+        Raises:
+            ValueError: The distribution spans too many values.
+            ZeroDivisionError: The divisor can be zero.
+        """
+
+def compile_dice(expression: str) -> DiceExpr:
+    """Parse and compile a dice expression."""
@@ -1,4 +1,4 @@
-from typing import Literal, Optional, Set, Union
+from typing import Literal, Optional, Set, Tuple, Union
 
 from pydantic import BaseModel, ConfigDict, DirectoryPath, Field
 
@@ -18,11 +18,137 @@ class ServiceConfig(ConfigModel):
     """Service configuration."""
 
 
+class EventQueueConfig(ConfigModel):
+    """Inbound event queue configuration.
+
+    Attributes:
+        workers: Number of workers, events of the same session always go to
+            the same worker and are handled in order.
+        max_size: Maximum number of pending events per worker.
+        overflow: What to do when a worker queue is full. ``block`` makes the
+            service wait for free space, ``drop_oldest`` discards the oldest
+            pending event and ``reject`` discards the incoming event.
+    """
+
+    workers: int = Field(default=4, ge=1)
+    max_size: int = Field(default=1000, ge=1)
+    overflow: Literal["block", "drop_oldest", "reject"] = "block"
+
+
+class DependencyConfig(ConfigModel):
+    """Dependency injection configuration.
+
+    Attributes:
+        session_ttl: Seconds after which an unused session scope is closed.
+        max_sessions: Maximum number of open session scopes, the least
+            recently used one is closed first.
+    """
+
+    session_ttl: float = Field(default=600, gt=0)
+    max_sessions: int = Field(default=1024, ge=1)
+
+
+class SnapshotConfig(ConfigModel):
+    """Snapshot configuration.
+
+    Attributes:
+        path: Snapshot file of the registered card stores and the rule state,
+            snapshots are disabled if not set.
+        interval: Seconds between two snapshots, only the changes are written
+            in between full snapshots.
+    """
+
+    path: Optional[str] = None
+    interval: float = Field(default=60, gt=0)
+
+
+class StateConfig(ConfigModel):
+    """Rule state configuration.
+
+    Attributes:
+        backend: Where rule state is kept, ``memory`` keeps it in the process
+            (it is saved in snapshots), ``sqlite`` in a SQLite database and
+            ``mmap`` in a memory-mapped key/value file.
+        path: The file of the ``sqlite`` and ``mmap`` backends, defaults to
+            ``state.sqlite3`` and ``state.kv``.
+        max_size: Maximum number of rules whose state is kept in memory. The
+            ``memory`` backend drops the least recently used state, the
+            others keep it in their file only.
+        ttl: Seconds after which unused state is dropped by the ``memory``
+            backend.
+        flush_interval: Seconds between two writes of changed state.
+        max_pending: Number of changed states that triggers a write.
+    """
+
+    backend: Literal["memory", "sqlite", "mmap"] = "memory"
+    path: Optional[str] = None
+    max_size: Optional[int] = Field(default=None, ge=1)
+    ttl: Optional[float] = Field(default=None, gt=0)
+    flush_interval: float = Field(default=1, gt=0)
+    max_pending: int = Field(default=100, ge=1)
+
+
+class ReconnectConfig(ConfigModel):
+    """Reconnection policy of services keeping a connection open.
+
+    Attributes:
+        initial_delay: Seconds before the first reconnection attempt.
+        max_delay: Maximum seconds between two attempts.
+        multiplier: Factor the delay grows by after each failed attempt.
+        jitter: Random fraction taken off each delay, so that many clients do
+            not reconnect in lock-step.
+        stable_after: Seconds a connection must stay up to reset the delay.
+        failure_threshold: Consecutive failures that open the circuit
+            breaker, it never opens if ``None``.
+        open_timeout: Seconds the circuit stays open before another attempt.
+        heartbeat_interval: Seconds between two pings, no pings if ``None``.
+        heartbeat_timeout: Seconds to wait for any frame after a ping before
+            the connection is considered dead and closed.
+    """
+
+    initial_delay: float = Field(default=1, gt=0)
+    max_delay: float = Field(default=60, gt=0)
+    multiplier: float = Field(default=2, ge=1)
+    jitter: float = Field(default=0.5, ge=0, le=1)
+    stable_after: float = Field(default=30, ge=0)
+    failure_threshold: Optional[int] = Field(default=10, ge=1)
+    open_timeout: float = Field(default=300, gt=0)
+    heartbeat_interval: Optional[float] = Field(default=30, gt=0)
+    heartbeat_timeout: float = Field(default=10, gt=0)
+
+
+class HttpClientConfig(ConfigModel):
+    """HTTP client connection pool shared by the services.
+
+    Attributes:
+        limit: Maximum number of open connections, unlimited if 0.
+        limit_per_host: Maximum number of open connections to one host,
+            unlimited if 0.
+        keepalive_timeout: Seconds an idle connection is kept for reuse.
+        ttl_dns_cache: Seconds DNS lookups are cached, forever if ``None``.
+        timeout: Seconds a request may take, services may set their own.
+        connect_timeout: Seconds to get a connection, from the pool or new.
+    """
+
+    limit: int = Field(default=100, ge=0)
+    limit_per_host: int = Field(default=10, ge=0)
+    keepalive_timeout: float = Field(default=30, gt=0)
+    ttl_dns_cache: Optional[int] = Field(default=300, ge=0)
+    timeout: Optional[float] = Field(default=60, gt=0)
+    connect_timeout: Optional[float] = Field(default=10, gt=0)
+
+
 class CoreConfig(ConfigModel):
     rules: Set[str] = Field(default_factory=set)
     rule_dirs: Set[DirectoryPath] = Field(default_factory=set)
     log: LogConfig = LogConfig()
     services: Set[str] = Field(default_factory=set)
+    event_queue: EventQueueConfig = EventQueueConfig()
+    dependency: DependencyConfig = DependencyConfig()
+    command_prefixes: Tuple[str, ...] = (".", "。")
+    snapshot: SnapshotConfig = SnapshotConfig()
+    state: StateConfig = StateConfig()
+    http_client: HttpClientConfig = HttpClientConfig()
 
 class RuleConfig(ConfigModel):
     """Rule configuration."""
@@ -0,0 +1,1467 @@
+"""HydroRoll Core.
+
+The ``Core`` class loads rules and services, dispatches events to rules and
+manages the lifecycle of the whole program.
+"""
+
+import asyncio
+import heapq
+import json
+import pkgutil
+import signal
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import AsyncExitStack
+from contextvars import ContextVar
+from itertools import chain, count
+from pathlib import Path
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+    overload,
+)
+
+from pydantic import ValidationError, create_model
+
+from hrc.config import ConfigModel, MainConfig, RuleConfig, ServiceConfig
+from hrc.dependencies import (
+    DependencyScope,
+    Scope,
+    invalidate_injection_plans,
+    solve_dependencies,
+)
+from hrc.event import Event, MessageEvent
+from hrc.exceptions import (
+    GetEventTimeout,
+    LoadModuleError,
+    SkipException,
+    StopException,
+)
+from hrc.log import error_or_exception, logger
+from hrc.rule import Rule, RuleLoadType
+from hrc.rule.BaseRule.CardStore import CardStore
+from hrc.rule.aliases import AliasIndex
+from hrc.rule.router import CommandMatch, CommandRouter
+from hrc.service import Service
+from hrc.service.pool import HttpClientPool
+from hrc.snapshot import Snapshot, SnapshotError, SnapshotWriter, load_snapshot
+from hrc.state import MemoryStateBackend, StateBackend, create_state_backend
+from hrc.typing import CoreHook, EventHook, EventT, ServiceHook
+from hrc.utils import (
+    ModulePathFinder,
+    get_classes_from_module_name,
+    is_config_class,
+    samefile,
+    wrap_get_func,
+)
+
+if sys.version_info >= (3, 11):  # pragma: no cover
+    import tomllib
+else:  # pragma: no cover
+    import tomli as tomllib
+
+__all__ = ["Core"]
+
+HANDLED_SIGNALS = (
+    signal.SIGINT,  # Unix signal 2. Sent by Ctrl+C.
+    signal.SIGTERM,  # Unix signal 15. Sent by `kill <pid>`.
+)
+
+# Set by an event queue worker while it waits for the event being handled,
+# ``get()`` uses it to let the worker move on to the next event.
+_worker_released: ContextVar[Optional[asyncio.Event]] = ContextVar(
+    "_worker_released", default=None
+)
+
+# (service type, event type, session id) a ``get()`` call waits on,
+# ``None`` matches anything
+_WaiterKey = Tuple[
+    Optional[Type[Service[Any, Any]]],
+    Optional[Type[Event[Any]]],
+    Union[None, int, str],
+]
+
+
+class _Waiter:
+    """A pending ``get()`` call."""
+
+    __slots__ = (
+        "future",
+        "func",
+        "key",
+        "seq",
+        "max_try_times",
+        "try_times",
+        "deadline",
+    )
+
+    def __init__(
+        self,
+        future: "asyncio.Future[Event[Any]]",
+        func: Callable[[Any], Awaitable[bool]],
+        key: _WaiterKey,
+        seq: int,
+        max_try_times: Optional[int],
+        deadline: Optional[float],
+    ) -> None:
+        self.future = future
+        self.func = func
+        self.key = key
+        self.seq = seq
+        self.max_try_times = max_try_times
+        self.try_times = 0
+        self.deadline = deadline
+
+
+class Core:
+    """HydroRoll Core object, defines the core behavior.
+
+    Attributes:
+        config: core configuration.
+        should_exit: Whether the core should exit.
+        services: List of all loaded services.
+        rules_priority_dict: Rule priority dictionary, the key is the priority
+            and the value is the list of rule classes with that priority.
+        alias_index: Aliases of the methods of all loaded rules.
+        command_router: Commands of all loaded rules.
+        rule_state: Rule state, kept by the backend chosen in ``core.state``.
+        global_state: Global state.
+        card_stores: Card stores saved in snapshots, by name.
+        http_client: HTTP client connection pool shared by the services,
+            configured by ``core.http_client`` and closed when the core stops.
+        dropped_events: Number of queued events dropped by the ``drop_oldest``
+            overflow policy.
+        rejected_events: Number of incoming events rejected by the ``reject``
+            overflow policy.
+    """
+
+    config: MainConfig
+    should_exit: asyncio.Event
+    services: List[Service[Any, Any]]
+    rules_priority_dict: Dict[int, List[Type[Rule[Any, Any, Any]]]]
+    alias_index: AliasIndex
+    command_router: CommandRouter
+    rule_state: StateBackend
+    global_state: Dict[Any, Any]
+    card_stores: Dict[str, CardStore]
+    http_client: HttpClientPool
+
+    dropped_events: int
+    rejected_events: int
+
+    _waiters: Dict[_WaiterKey, Dict[int, "_Waiter"]]
+    _waiter_types: Counter[Optional[type]]
+    _waiter_deadlines: List[Tuple[float, int, "_Waiter"]]
+    _waiter_timer: Optional[asyncio.TimerHandle]
+    _waiter_seq: Iterator[int]
+    _event_queues: List["asyncio.Queue[Tuple[Event[Any], bool]]"]
+    _event_workers: List["asyncio.Task[None]"]
+    _app_scope: Optional[DependencyScope]
+    _session_scopes: "OrderedDict[Tuple[str, Any], DependencyScope]"
+    _rule_buckets: List[Tuple[int, Tuple[Type[Rule[Any, Any, Any]], ...]]]
+    _snapshot: Optional[Snapshot]
+    _snapshot_writer: Optional[SnapshotWriter]
+
+    _restart_flag: bool
+    _module_path_finder: ModulePathFinder
+    _raw_config_dict: Dict[str, Any]
+    _handle_event_tasks: Set["asyncio.Task[None]"]
+    _service_tasks: Set["asyncio.Task[None]"]
+
+    _config_file: Optional[str]
+    _config_dict: Optional[Dict[str, Any]]
+    _hot_reload: bool
+
+    _extend_rules: List[Union[Type[Rule[Any, Any, Any]], str, Path]]
+    _extend_rule_dirs: List[Path]
+    _extend_services: List[Union[Type[Service[Any, Any]], str]]
+
+    _core_run_hooks: List[CoreHook]
+    _core_exit_hooks: List[CoreHook]
+    _service_startup_hooks: List[ServiceHook]
+    _service_run_hooks: List[ServiceHook]
+    _service_shutdown_hooks: List[ServiceHook]
+    _event_preprocessor_hooks: List[EventHook]
+    _event_postprocessor_hooks: List[EventHook]
+
+    def __init__(
+        self,
+        *,
+        config_file: Optional[str] = "config.toml",
+        config_dict: Optional[Dict[str, Any]] = None,
+        hot_reload: bool = False,
+    ) -> None:
+        """Initialize the core, read configuration files and load services.
+
+        Args:
+            config_file: Configuration file, if not specified, ``config.toml``
+                in the current working directory is used.
+            config_dict: Configuration dictionary, when specified, the
+                configuration file will be ignored.
+            hot_reload: Whether to enable hot reloading of rules.
+        """
+        self.config = MainConfig()
+        self.services = []
+        self.rules_priority_dict = defaultdict(list)
+        self.alias_index = AliasIndex()
+        self.command_router = CommandRouter()
+        self.rule_state = MemoryStateBackend()
+        self.global_state = {}
+        self.card_stores = {}
+        self.http_client = HttpClientPool(self.config.core.http_client)
+        self.dropped_events = 0
+        self.rejected_events = 0
+
+        self._waiters = {}
+        self._waiter_types = Counter()
+        self._waiter_deadlines = []
+        self._waiter_timer = None
+        self._waiter_seq = count()
+        self._event_queues = []
+        self._event_workers = []
+        self._app_scope = None
+        self._session_scopes = OrderedDict()
+        self._rule_buckets = []
+        self._snapshot = None
+        self._snapshot_writer = None
+        self._restart_flag = False
+        self._module_path_finder = ModulePathFinder()
+        self._raw_config_dict = {}
+        self._handle_event_tasks = set()
+        self._service_tasks = set()
+
+        self._config_file = config_file
+        self._config_dict = config_dict
+        self._hot_reload = hot_reload
+
+        self._extend_rules = []
+        self._extend_rule_dirs = []
+        self._extend_services = []
+
+        self._core_run_hooks = []
+        self._core_exit_hooks = []
+        self._service_startup_hooks = []
+        self._service_run_hooks = []
+        self._service_shutdown_hooks = []
+        self._event_preprocessor_hooks = []
+        self._event_postprocessor_hooks = []
+
+        sys.meta_path.insert(0, self._module_path_finder)
+
+    @property
+    def rules(self) -> List[Type[Rule[Any, Any, Any]]]:
+        """List of currently loaded rules, in dispatch order."""
+        return list(chain.from_iterable(rules for _, rules in self._rule_buckets))
+
+    def run(self) -> None:
+        """Start running the core."""
+        self._restart_flag = True
+        while self._restart_flag:
+            self._restart_flag = False
+            asyncio.run(self._run())
+            if self._restart_flag:
+                self._load_rules_from_dirs(*self._extend_rule_dirs)
+                self._load_rules(*self._extend_rules)
+                self._load_services(*self._extend_services)
+
+    def restart(self) -> None:
+        """Exit and rerun the core."""
+        logger.info("Restarting HydroRoll Core...")
+        self._restart_flag = True
+        self.should_exit.set()
+
+    async def _run(self) -> None:
+        """Run the core asynchronously."""
+        self.should_exit = asyncio.Event()
+
+        # Monitor and intercept system exit signals to complete some finishing
+        # work before closing the program
+        if threading.current_thread() is threading.main_thread():  # pragma: no cover
+            # Signals can only be processed in the main thread
+            try:
+                loop = asyncio.get_running_loop()
+                for sig in HANDLED_SIGNALS:
+                    loop.add_signal_handler(sig, self._handle_exit)
+            except NotImplementedError:
+                # add_signal_handler is only available under Unix
+                for sig in HANDLED_SIGNALS:
+                    signal.signal(sig, self._handle_exit)
+
+        # Load configuration file
+        self._reload_config_dict()
+
+        self._load_rules_from_dirs(*self.config.core.rule_dirs)
+        self._load_rules(*self.config.core.rules)
+        self._load_services(*self.config.core.services)
+        self._update_config()
+        self.http_client = HttpClientPool(self.config.core.http_client)
+        await self._open_state_backend()
+        self._load_snapshot()
+
+        logger.info("Running HydroRoll Core...")
+
+        hot_reload_task = None
+        if self._hot_reload:  # pragma: no cover
+            hot_reload_task = asyncio.create_task(self._run_hot_reload())
+
+        for core_run_hook_func in self._core_run_hooks:
+            await core_run_hook_func(self)
+
+        self._start_event_workers()
+
+        snapshot_task = None
+        if self._snapshot_writer is not None:
+            snapshot_task = asyncio.create_task(self._run_snapshots())
+        state_task = None
+        if self.rule_state.persistent:
+            state_task = asyncio.create_task(self._run_state_flush())
+
+        try:
+            for _service in self.services:
+                for service_startup_hook_func in self._service_startup_hooks:
+                    await service_startup_hook_func(_service)
+                try:
+                    await _service.startup()
+                except Exception as e:
+                    self.error_or_exception(
+                        f"Startup service {_service!r} failed:", e
+                    )
+
+            for _service in self.services:
+                for service_run_hook_func in self._service_run_hooks:
+                    await service_run_hook_func(_service)
+                _service_task = asyncio.create_task(_service.safe_run())
+                self._service_tasks.add(_service_task)
+                _service_task.add_done_callback(self._service_tasks.discard)
+
+            await self.should_exit.wait()
+
+            if hot_reload_task is not None:  # pragma: no cover
+                await hot_reload_task
+        finally:
+            self._cancel_waiters()
+
+            await self._stop_event_workers()
+            while self._handle_event_tasks:
+                await asyncio.gather(*self._handle_event_tasks)
+
+            # Replies queued by the handlers are sent before the services stop
+            for _service in self.services:
+                await _service.outbox.flush()
+                for service_shutdown_hook_func in self._service_shutdown_hooks:
+                    await service_shutdown_hook_func(_service)
+                await _service.shutdown()
+                await _service.outbox.close()
+
+            while self._service_tasks:
+                await asyncio.gather(*self._service_tasks)
+            await self.http_client.close()
+
+            if snapshot_task is not None:
+                snapshot_task.cancel()
+                await asyncio.gather(snapshot_task, return_exceptions=True)
+                await self.save_snapshot()
+            if state_task is not None:
+                state_task.cancel()
+                await asyncio.gather(state_task, return_exceptions=True)
+            try:
+                await self.rule_state.close()
+            except Exception as e:
+                self.error_or_exception("Close rule state failed:", e)
+
+            await self._close_dependency_scopes()
+
+            for core_exit_hook_func in self._core_exit_hooks:
+                await core_exit_hook_func(self)
+
+            self.services.clear()
+            self.rules_priority_dict.clear()
+            self._rule_buckets.clear()
+            self.alias_index.clear()
+            self.command_router.clear()
+            self.card_stores.clear()
+            self._snapshot = self._snapshot_writer = None
+            self._module_path_finder.path.clear()
+
+    def _load_snapshot(self) -> None:
+        """Load the snapshot file and restore the rule state from it."""
+        path = self.config.core.snapshot.path
+        if path is None:
+            return
+        try:
+            self._snapshot = load_snapshot(path)
+        except (OSError, SnapshotError) as e:
+            # Do not overwrite a file that cannot be read
+            self.error_or_exception(f'Load snapshot "{path}" failed:', e)
+            return
+        if self._snapshot is not None:
+            if not self.rule_state.persistent:
+                self.rule_state.update(self._snapshot.state)
+            elif self._snapshot.state and not any(True for _ in self.rule_state):
+                # Moving from the memory backend, the snapshot has the state
+                self.rule_state.update(self._snapshot.state)
+                logger.info(
+                    f"Imported the state of {len(self._snapshot.state)} rules "
+                    f'from snapshot "{path}"'
+                )
+            logger.info(f'Loaded snapshot "{path}"')
+        self._snapshot_writer = SnapshotWriter(path, self._snapshot)
+
+    async def _open_state_backend(self) -> None:
+        """Open the rule state backend chosen by the configuration.
+
+        In-memory state is kept across restarts.
+        """
+        config = self.config.core.state
+        if config.backend == "memory" and isinstance(
+            self.rule_state, MemoryStateBackend
+        ):
+            self.rule_state.max_size = config.max_size
+            self.rule_state.ttl = config.ttl
+        else:
+            self.rule_state = create_state_backend(config)
+        await self.rule_state.open()
+
+    async def _run_state_flush(self) -> None:
+        """Write changed rule state in batches."""
+        while True:
+            await self.rule_state.wait_for_flush(self.config.core.state.flush_interval)
+            try:
+                await self.rule_state.flush()
+            except Exception as e:
+                self.error_or_exception("Flush rule state failed:", e)
+
+    async def _run_snapshots(self) -> None:
+        """Save a snapshot periodically."""
+        while True:
+            await asyncio.sleep(self.config.core.snapshot.interval)
+            await self.save_snapshot()
+
+    async def save_snapshot(self, *, full: bool = False) -> None:
+        """Save the card stores and the rule state.
+
+        The records are encoded in the event loop, so that no store changes
+        while it is read, and written to the file in a thread.
+
+        Args:
+            full: Whether to write a full snapshot instead of the changes.
+        """
+        writer = self._snapshot_writer
+        if writer is None:
+            return
+        try:
+            if isinstance(self.rule_state, MemoryStateBackend):
+                state = self.rule_state.copy()
+            else:
+                # The backend keeps the state, the snapshot keeps what it had
+                state = {} if self._snapshot is None else self._snapshot.state
+            records, full = writer.prepare(self.card_stores, state, full=full)
+            await asyncio.to_thread(writer.commit, records, full)
+        except Exception as e:
+            self.error_or_exception("Save snapshot failed:", e)
+
+    def register_card_store(self, name: str, store: CardStore) -> None:
+        """Save a card store in snapshots, restoring it from the loaded one.
+
+        Args:
+            name: The name of the store in snapshots.
+            store: The store.
+        """
+        self.card_stores[name] = store
+        if self._snapshot is not None and self._snapshot.restore_store(name, store):
+            logger.info(f'Restored {len(store)} cards of "{name}" from snapshot')
+
+    def _remove_rule_by_path(
+        self, file: Path
+    ) -> List[Type[Rule[Any, Any, Any]]]:  # pragma: no cover
+        """Remove rules based on their file path."""
+        removed_rules: List[Type[Rule[Any, Any, Any]]] = []
+        for rules in self.rules_priority_dict.values():
+            for _rule in rules[:]:
+                if _rule.__rule_load_type__ != RuleLoadType.CLASS and samefile(
+                    _rule.__rule_file_path__, file
+                ):
+                    removed_rules.append(_rule)
+                    rules.remove(_rule)
+                    self.alias_index.remove_rule(_rule)
+                    self.command_router.remove_rule(_rule)
+                    logger.info(
+                        "Succeeded to remove rule "
+                        f'"{_rule.__name__}" from file "{file}"'
+                    )
+        self._build_rule_buckets()
+        return removed_rules
+
+    async def _run_hot_reload(self) -> None:  # pragma: no cover
+        """Hot reload."""
+        try:
+            from watchfiles import Change, awatch
+        except ImportError:
+            logger.warning(
+                'Hot reload needs to install "watchfiles", '
+                'try "pip install watchfiles"'
+            )
+            return
+
+        logger.info("Hot reload is working!")
+        async for changes in awatch(
+            *(
+                x.resolve()
+                for x in set(self._extend_rule_dirs)
+                .union(self.config.core.rule_dirs)
+                .union(
+                    {Path(self._config_file)}
+                    if self._config_dict is None and self._config_file is not None
+                    else set()
+                )
+            ),
+            stop_event=self.should_exit,
+        ):
+            # Processed in the order of Change.deleted, Change.modified,
+            # Change.added to ensure that when renaming occurs, the deletion
+            # operation is performed first and then the addition operation
+            for change_type, file_ in sorted(changes, key=lambda x: x[0], reverse=True):
+                file = Path(file_)
+                # Change configuration file
+                if (
+                    self._config_file is not None
+                    and samefile(self._config_file, file)
+                    and change_type == change_type.modified
+                ):
+                    logger.info(f'Reload config file "{self._config_file}"')
+                    old_config = self.config
+                    self._reload_config_dict()
+                    if (
+                        self.config.core != old_config.core
+                        or self.config.service != old_config.service
+                    ):
+                        self.restart()
+                    continue
+
+                # Change rule folder
+                if change_type == Change.deleted:
+                    # Special handling for deletion operations
+                    if file.suffix != ".py":
+                        file = file / "__init__.py"
+                else:
+                    if file.is_dir() and (file / "__init__.py").is_file():
+                        # When a new directory is added and this directory
+                        # contains the ``__init__.py`` file, it means that a
+                        # new Python package has been added, and
+                        # ``__init__.py`` of this package is processed.
+                        file = file / "__init__.py"
+                    if not (file.is_file() and file.suffix == ".py"):
+                        continue
+
+                if change_type == Change.added:
+                    logger.info(f"Hot reload: Added file: {file}")
+                    self._load_rules(
+                        Path(file), rule_load_type=RuleLoadType.DIR, reload=True
+                    )
+                    self._update_config()
+                    continue
+                if change_type == Change.deleted:
+                    logger.info(f"Hot reload: Deleted file: {file}")
+                    self._remove_rule_by_path(file)
+                    self._update_config()
+                elif change_type == Change.modified:
+                    logger.info(f"Hot reload: Modified file: {file}")
+                    self._remove_rule_by_path(file)
+                    self._load_rules(
+                        Path(file), rule_load_type=RuleLoadType.DIR, reload=True
+                    )
+                    self._update_config()
+
+    def _update_config(self) -> None:
+        """Update the config, merging the Config of rules and services into
+        the core configuration model."""
+
+        def update_config(
+            source: Union[List[Type[Rule[Any, Any, Any]]], List[Service[Any, Any]]],
+            name: str,
+            base: Type[ConfigModel],
+        ) -> Tuple[Type[ConfigModel], ConfigModel]:
+            config_update_dict: Dict[str, Any] = {}
+            for i in source:
+                config_class = getattr(i, "Config", None)
+                if is_config_class(config_class):
+                    default_value: Any
+                    try:
+                        default_value = config_class()
+                    except ValidationError:
+                        default_value = ...
+                    config_update_dict[config_class.__config_name__] = (
+                        config_class,
+                        default_value,
+                    )
+            return create_model(
+                name, **config_update_dict, __base__=base
+            ), base()  # type: ignore
+
+        self.config = create_model(  # type: ignore
+            "Config",
+            rule=update_config(self.rules, "RuleConfig", RuleConfig),
+            service=update_config(self.services, "ServiceConfig", ServiceConfig),
+            __base__=MainConfig,
+        )(**self._raw_config_dict)
+        # Update log level
+        logger.remove()
+        logger.add(sys.stderr, level=self.config.core.log.level)
+
+    def _reload_config_dict(self) -> None:
+        """Reload the configuration file."""
+        self._raw_config_dict = {}
+
+        if self._config_dict is not None:
+            self._raw_config_dict = self._config_dict
+        elif self._config_file is not None:
+            try:
+                with Path(self._config_file).open("rb") as f:
+                    if self._config_file.endswith(".json"):
+                        self._raw_config_dict = json.load(f)
+                    elif self._config_file.endswith(".toml"):
+                        self._raw_config_dict = tomllib.load(f)
+                    else:
+                        self.error_or_exception(
+                            "Read config file failed:",
+                            OSError("Unable to determine config file type"),
+                        )
+            except OSError as e:
+                self.error_or_exception("Can not open config file:", e)
+            except (ValueError, json.JSONDecodeError, tomllib.TOMLDecodeError) as e:
+                self.error_or_exception("Read config file failed:", e)
+
+        try:
+            self.config = MainConfig(**self._raw_config_dict)
+        except ValidationError as e:
+            self.config = MainConfig()
+            self.error_or_exception("Config dict parse error:", e)
+        self.command_router.prefixes = self.config.core.command_prefixes
+        self._update_config()
+
+    def _handle_exit(self, *_args: Any) -> None:  # pragma: no cover
+        """When the robot receives the exit signal, it will handle it according
+        to the situation."""
+        logger.info("Stopping HydroRoll Core...")
+        if self.should_exit.is_set():
+            logger.warning("Force Exit HydroRoll Core...")
+            sys.exit()
+        else:
+            self.should_exit.set()
+
+    async def handle_event(
+        self,
+        current_event: Event[Any],
+        *,
+        handle_get: bool = True,
+        show_log: bool = True,
+    ) -> None:
+        """Called by the service. Put the event into the inbound event queue.
+
+        Events are partitioned by session, see ``Event.get_session_id()``.
+        Events of the same session are handled in the order they are received
+        while different sessions are handled in parallel. When the queue of the
+        session is full, the ``core.event_queue.overflow`` policy applies.
+
+        Args:
+            current_event: current event.
+            handle_get: Whether the event can be captured by the ``get()`` method.
+            show_log: Whether to display logs when processing events.
+        """
+        if show_log:
+            logger.info(
+                f"Service {current_event.service.name} received: {current_event!r}"
+            )
+
+        queue = self._event_queues[
+            hash(self._get_session_key(current_event)) % len(self._event_queues)
+        ]
+        overflow = self.config.core.event_queue.overflow
+        if queue.full() and overflow == "drop_oldest":
+            dropped_event, _ = queue.get_nowait()
+            queue.task_done()
+            self.dropped_events += 1
+            logger.warning(f"Event queue is full, dropped event: {dropped_event!r}")
+        elif queue.full() and overflow == "reject":
+            self.rejected_events += 1
+            logger.warning(f"Event queue is full, rejected event: {current_event!r}")
+            return
+        await queue.put((current_event, handle_get))
+
+    @property
+    def event_queue_depth(self) -> int:
+        """Number of events waiting in the inbound event queue."""
+        return sum(queue.qsize() for queue in self._event_queues)
+
+    def _start_event_workers(self) -> None:
+        """Create the inbound event queues and their workers."""
+        queue_config = self.config.core.event_queue
+        self._event_queues = [
+            asyncio.Queue(maxsize=queue_config.max_size)
+            for _ in range(queue_config.workers)
+        ]
+        self._event_workers = [
+            asyncio.create_task(self._event_worker(queue))
+            for queue in self._event_queues
+        ]
+
+    async def _stop_event_workers(self) -> None:
+        """Wait for the queued events to be picked up and stop the workers."""
+        await asyncio.gather(*(queue.join() for queue in self._event_queues))
+        for worker in self._event_workers:
+            worker.cancel()
+        await asyncio.gather(*self._event_workers, return_exceptions=True)
+        self._event_workers.clear()
+
+    async def _event_worker(
+        self, queue: "asyncio.Queue[Tuple[Event[Any], bool]]"
+    ) -> None:
+        """Handle the events of one queue one after another.
+
+        The worker moves on to the next event once the current one is handled,
+        or as soon as a rule handling it waits for a further event with
+        ``get()``, since that event may be in the same queue.
+        """
+        while True:
+            current_event, handle_get = await queue.get()
+            released = asyncio.Event()
+            token = _worker_released.set(released)
+            try:
+                _handle_event_task = await self._dispatch_event(
+                    current_event, handle_get=handle_get
+                )
+            except Exception as e:
+                self.error_or_exception("Dispatch event failed:", e)
+                _handle_event_task = None
+            finally:
+                _worker_released.reset(token)
+            if _handle_event_task is not None:
+                _handle_event_task.add_done_callback(lambda _: released.set())
+                await released.wait()
+            queue.task_done()
+
+    async def _dispatch_event(
+        self, current_event: Event[Any], *, handle_get: bool
+    ) -> Optional["asyncio.Task[None]"]:
+        """Offer the event to ``get()`` waiters, then hand it to the rules.
+
+        Returns:
+            The task handling the event, ``None`` if the event was captured by
+            a ``get()`` call.
+        """
+        if handle_get and self._waiters and await self._offer_to_waiters(
+            current_event
+        ):
+            return None
+
+        _handle_event_task = asyncio.create_task(self._handle_event(current_event))
+        self._handle_event_tasks.add(_handle_event_task)
+        _handle_event_task.add_done_callback(self._handle_event_tasks.discard)
+        return _handle_event_task
+
+    async def _handle_event(self, current_event: Event[Any]) -> None:
+        """Dispatch an event to the loaded rules.
+
+        Rules are visited bucket by bucket in ascending priority order. All
+        rules in the same bucket run concurrently; propagation stops after a
+        bucket in which a blocking rule handled the event or a rule raised
+        ``StopException``.
+
+        A message invoking a command is handed to the command handler of the
+        rule owning it only, the other rules owning commands are skipped while
+        the rules without commands see it as usual. Events that are not
+        commands are offered to every rule defining ``rule``.
+        """
+        for _hook_func in self._event_preprocessor_hooks:
+            await _hook_func(current_event)
+
+        command = None
+        if isinstance(current_event, MessageEvent) and len(self.command_router):
+            command = self.command_router.match(current_event.get_plain_text())
+
+        scopes = await self._get_dependency_scopes(current_event)
+        try:
+            for rule_priority, rules in self._rule_buckets:
+                logger.debug(
+                    f"Checking for matching rules with priority {rule_priority!r}"
+                )
+                stop_flags = await asyncio.gather(
+                    *(
+                        self._run_rule(_rule, current_event, scopes, command)
+                        for _rule in rules
+                        if _rule not in self.command_router
+                        or (
+                            command.rule is _rule
+                            if command is not None
+                            else hasattr(_rule, "rule")
+                        )
+                    )
+                )
+                if any(stop_flags):
+                    break
+        finally:
+            self._release_dependency_scopes(scopes)
+
+        for _hook_func in self._event_postprocessor_hooks:
+            await _hook_func(current_event)
+
+        logger.info("Event Finished")
+
+    async def _run_rule(
+        self,
+        rule_class: Type[Rule[Any, Any, Any]],
+        current_event: Event[Any],
+        scopes: Dict[Scope, DependencyScope],
+        command: Optional[CommandMatch] = None,
+    ) -> bool:
+        """Run a single rule against the event.
+
+        The command handler is called instead of ``rule`` and ``handle`` if
+        the rule owns the command.
+
+        Returns:
+            Whether the propagation of the event should stop after the current
+            priority bucket.
+        """
+        stop = False
+        try:
+            async with AsyncExitStack() as stack:
+                rule_instance = await solve_dependencies(
+                    rule_class,
+                    use_cache=True,
+                    stack=stack,
+                    dependency_cache={
+                        Core: self,
+                        Event: current_event,
+                    },
+                    scopes=scopes,
+                )
+                if rule_instance.name not in self.rule_state:
+                    rule_state = rule_instance.__init_state__()
+                    if rule_state is not None:
+                        self.rule_state[rule_instance.name] = rule_state
+                if command is not None and command.rule is rule_class:
+                    logger.info(
+                        f"Command {command.command!r} will be handled by "
+                        f"{rule_class!r}"
+                    )
+                    try:
+                        await getattr(rule_instance, command.handler)(command.args)
+                    finally:
+                        if rule_instance.block:
+                            stop = True
+                elif await rule_instance.rule():
+                    logger.info(f"Event will be handled by {rule_class!r}")
+                    try:
+                        await rule_instance.handle()
+                    finally:
+                        if rule_instance.block:
+                            stop = True
+        except SkipException:
+            # The rule requires skipping itself and continuing the current
+            # event propagation
+            pass
+        except StopException:
+            # The rule requires stopping current event propagation
+            stop = True
+        except Exception as e:
+            self.error_or_exception(f'Exception in rule "{rule_class}":', e)
+        return stop
+
+    @staticmethod
+    def _get_session_key(current_event: Event[Any]) -> Tuple[str, Any]:
+        """Key of the session an event belongs to."""
+        return current_event.service.name, current_event.get_session_id()
+
+    async def _get_dependency_scopes(
+        self, current_event: Event[Any]
+    ) -> Dict[Scope, DependencyScope]:
+        """Get the ``app`` and ``session`` dependency scopes of an event.
+
+        The session scope is marked in use until ``_release_dependency_scopes``
+        is called. Idle session scopes unused for
+        ``core.dependency.session_ttl`` seconds or beyond
+        ``core.dependency.max_sessions`` are closed, least recently used first.
+        Scopes in use are never closed, so there may temporarily be more than
+        ``max_sessions`` of them.
+        """
+        if self._app_scope is None:
+            self._app_scope = DependencyScope({Core: self})
+
+        now = time.monotonic()
+        session_key = self._get_session_key(current_event)
+        session_scope = self._session_scopes.get(session_key)
+        if session_scope is None:
+            session_scope = self._session_scopes[session_key] = DependencyScope(
+                {Core: self}
+            )
+        else:
+            self._session_scopes.move_to_end(session_key)
+        session_scope.last_used = now
+        session_scope.in_use += 1
+
+        dependency_config = self.config.core.dependency
+        closing: List[DependencyScope] = []
+        for key, scope in list(self._session_scopes.items()):
+            if scope.in_use:
+                continue
+            if (
+                now - scope.last_used <= dependency_config.session_ttl
+                and len(self._session_scopes) <= dependency_config.max_sessions
+            ):
+                break
+            del self._session_scopes[key]
+            closing.append(scope)
+
+        for scope in closing:
+            await self._close_dependency_scope(scope)
+        return {"app": self._app_scope, "session": session_scope}
+
+    @staticmethod
+    def _release_dependency_scopes(scopes: Dict[Scope, DependencyScope]) -> None:
+        """Mark the scopes got by ``_get_dependency_scopes`` no longer in use."""
+        scopes["session"].in_use -= 1
+
+    async def _close_dependency_scope(self, scope: DependencyScope) -> None:
+        """Close a dependency scope, logging errors raised while closing."""
+        try:
+            await scope.aclose()
+        except Exception as e:
+            self.error_or_exception("Close dependency scope failed:", e)
+
+    async def _close_dependency_scopes(self) -> None:
+        """Close all session scopes and then the app scope."""
+        while self._session_scopes:
+            await self._close_dependency_scope(
+                self._session_scopes.popitem(last=False)[1]
+            )
+        if self._app_scope is not None:
+            await self._close_dependency_scope(self._app_scope)
+            self._app_scope = None
+
+    @overload
+    async def get(
+        self,
+        func: Optional[Callable[[Event[Any]], Union[bool, Awaitable[bool]]]] = None,
+        *,
+        event_type: None = None,
+        server_type: None = None,
+        session_id: Union[None, int, str] = None,
+        max_try_times: Optional[int] = None,
+        timeout: Optional[Union[int, float]] = None,
+    ) -> Event[Any]: ...
+
+    @overload
+    async def get(
+        self,
+        func: Optional[Callable[[EventT], Union[bool, Awaitable[bool]]]] = None,
+        *,
+        event_type: None = None,
+        server_type: Type[Service[EventT, Any]],
+        session_id: Union[None, int, str] = None,
+        max_try_times: Optional[int] = None,
+        timeout: Optional[Union[int, float]] = None,
+    ) -> EventT: ...
+
+    @overload
+    async def get(
+        self,
+        func: Optional[Callable[[EventT], Union[bool, Awaitable[bool]]]] = None,
+        *,
+        event_type: Type[EventT],
+        server_type: Optional[Type[Service[Any, Any]]] = None,
+        session_id: Union[None, int, str] = None,
+        max_try_times: Optional[int] = None,
+        timeout: Optional[Union[int, float]] = None,
+    ) -> EventT: ...
+
+    async def get(
+        self,
+        func: Optional[Callable[[Any], Union[bool, Awaitable[bool]]]] = None,
+        *,
+        event_type: Optional[Type[Event[Any]]] = None,
+        server_type: Optional[Type[Service[Any, Any]]] = None,
+        session_id: Union[None, int, str] = None,
+        max_try_times: Optional[int] = None,
+        timeout: Optional[Union[int, float]] = None,
+    ) -> Event[Any]:
+        """Get events that meet the specified conditions. The coroutine will
+        wait until the service receives events that meet the conditions,
+        exceeds the maximum number of events, or times out.
+
+        Args:
+            func: Coroutine or function, the function will be automatically
+                wrapped as a coroutine for execution. Requires an event to be
+                accepted as a parameter and returns a Boolean value. Returns the
+                current event when the coroutine returns ``True``. When ``None``
+                is equivalent to the input coroutine returning true for any
+                event, that is, returning the next event received by the service.
+            event_type: When specified, only events of the specified type are
+                accepted, taking effect before the func condition.
+            server_type: When specified, only events generated by the specified
+                service are accepted, taking effect before the func condition.
+            session_id: When specified, only events of the specified session
+                are accepted, taking effect before the func condition.
+            max_try_times: Maximum number of events of the specified type,
+                service and session to try with ``func``.
+            timeout: timeout period.
+
+        Returns:
+            Returns events that satisfy the condition of ``func``.
+
+        Raises:
+            GetEventTimeout: Maximum number of events exceeded or timeout.
+        """
+        if self.should_exit.is_set():
+            raise GetEventTimeout
+
+        released = _worker_released.get()
+        if released is not None:
+            released.set()
+
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(
+            loop.create_future(),
+            wrap_get_func(func),
+            (server_type, event_type, session_id),
+            next(self._waiter_seq),
+            max_try_times,
+            None if timeout is None else loop.time() + timeout,
+        )
+        self._add_waiter(waiter)
+        try:
+            return await waiter.future
+        finally:
+            self._remove_waiter(waiter)
+
+    def _add_waiter(self, waiter: "_Waiter") -> None:
+        """Index a pending ``get()`` call and schedule its timeout."""
+        server_type, event_type, _ = waiter.key
+        self._waiters.setdefault(waiter.key, {})[waiter.seq] = waiter
+        self._waiter_types[server_type] += 1
+        self._waiter_types[event_type] += 1
+        if waiter.deadline is not None:
+            heapq.heappush(
+                self._waiter_deadlines, (waiter.deadline, waiter.seq, waiter)
+            )
+            if self._waiter_deadlines[0][2] is waiter:
+                self._schedule_waiter_timer()
+
+    def _remove_waiter(self, waiter: "_Waiter") -> None:
+        """Remove a ``get()`` call from the index.
+
+        Its entry in the deadline heap is dropped lazily by the timer.
+        """
+        waiters = self._waiters.get(waiter.key)
+        if waiters is None or waiters.pop(waiter.seq, None) is None:
+            return
+        if not waiters:
+            del self._waiters[waiter.key]
+        server_type, event_type, _ = waiter.key
+        for waiter_type in (server_type, event_type):
+            self._waiter_types[waiter_type] -= 1
+            if not self._waiter_types[waiter_type]:
+                del self._waiter_types[waiter_type]
+
+    async def _offer_to_waiters(self, current_event: Event[Any]) -> bool:
+        """Offer an event to the pending ``get()`` calls that could accept it.
+
+        Only the waiters indexed under the service type, event type and session
+        of the event are tested, in the order they started waiting.
+
+        Returns:
+            Whether a waiter took the event.
+        """
+        server_types = [None] + [
+            x for x in type(current_event.service).__mro__ if x in self._waiter_types
+        ]
+        event_types = [None] + [
+            x for x in type(current_event).__mro__ if x in self._waiter_types
+        ]
+        session_ids = {None, current_event.get_session_id()}
+        candidates = sorted(
+            (
+                waiter
+                for server_type in server_types
+                for event_type in event_types
+                for session_id in session_ids
+                for waiter in self._waiters.get(
+                    (server_type, event_type, session_id), {}
+                ).values()
+            ),
+            key=lambda x: x.seq,
+        )
+        for waiter in candidates:
+            if waiter.future.done():
+                continue
+            matched = await waiter.func(current_event)
+            if waiter.future.done():
+                # Timed out or took another event while ``func`` was running
+                continue
+            if matched:
+                current_event.__handled__ = True
+                waiter.future.set_result(current_event)
+                self._remove_waiter(waiter)
+                return True
+            waiter.try_times += 1
+            if waiter.max_try_times is not None and (
+                waiter.try_times > waiter.max_try_times
+            ):
+                waiter.future.set_exception(GetEventTimeout())
+                self._remove_waiter(waiter)
+        return False
+
+    def _schedule_waiter_timer(self) -> None:
+        """Arm the shared timer for the earliest ``get()`` deadline."""
+        if self._waiter_timer is not None:
+            self._waiter_timer.cancel()
+            self._waiter_timer = None
+        if self._waiter_deadlines:
+            self._waiter_timer = asyncio.get_running_loop().call_at(
+                self._waiter_deadlines[0][0], self._expire_waiters
+            )
+
+    def _expire_waiters(self) -> None:
+        """Fail the ``get()`` calls whose deadline has passed."""
+        self._waiter_timer = None
+        now = asyncio.get_running_loop().time()
+        while self._waiter_deadlines and self._waiter_deadlines[0][0] <= now:
+            _, _, waiter = heapq.heappop(self._waiter_deadlines)
+            if not waiter.future.done():
+                waiter.future.set_exception(GetEventTimeout())
+            self._remove_waiter(waiter)
+        # Skip the entries of waiters that are already done
+        while self._waiter_deadlines and self._waiter_deadlines[0][2].future.done():
+            heapq.heappop(self._waiter_deadlines)
+        self._schedule_waiter_timer()
+
+    def _cancel_waiters(self) -> None:
+        """Fail all pending ``get()`` calls, used when the core exits."""
+        for waiters in list(self._waiters.values()):
+            for waiter in list(waiters.values()):
+                if not waiter.future.done():
+                    waiter.future.set_exception(GetEventTimeout())
+                self._remove_waiter(waiter)
+        self._waiter_deadlines.clear()
+        if self._waiter_timer is not None:
+            self._waiter_timer.cancel()
+            self._waiter_timer = None
+
+    def _build_rule_buckets(self) -> None:
+        """Pre-sort the loaded rules into priority buckets.
+
+        Called whenever the set of loaded rules changes, so that dispatching
+        an event does not have to sort the priorities again.
+        """
+        for priority in [k for k, v in self.rules_priority_dict.items() if not v]:
+            del self.rules_priority_dict[priority]
+        self._rule_buckets = [
+            (priority, tuple(self.rules_priority_dict[priority]))
+            for priority in sorted(self.rules_priority_dict)
+        ]
+
+    def _load_rule_class(
+        self,
+        rule_class: Type[Rule[Any, Any, Any]],
+        rule_load_type: RuleLoadType,
+        rule_file_path: Optional[str],
+    ) -> None:
+        """Load a rule class."""
+        priority = getattr(rule_class, "priority", None)
+        if isinstance(priority, int) and priority >= 0:
+            for _rule in self.rules:
+                if _rule.__name__ == rule_class.__name__:
+                    logger.warning(
+                        f'Already have a same name rule "{_rule.__name__}"'
+                    )
+            rule_class.__rule_load_type__ = rule_load_type
+            rule_class.__rule_file_path__ = rule_file_path
+            self.rules_priority_dict[priority].append(rule_class)
+            self._build_rule_buckets()
+            self.alias_index.add_rule(rule_class)
+            self.command_router.add_rule(rule_class)
+            logger.info(
+                f'Succeeded to load rule "{rule_class.__name__}" '
+                f'from class "{rule_class!r}"'
+            )
+        else:
+            self.error_or_exception(
+                f'Load rule from class "{rule_class!r}" failed:',
+                LoadModuleError(
+                    f'Rule priority incorrect in the class "{rule_class!r}"'
+                ),
+            )
+
+    def _load_rules_from_module_name(
+        self,
+        module_name: str,
+        *,
+        rule_load_type: RuleLoadType,
+        reload: bool = False,
+    ) -> None:
+        """Load rules from the given module."""
+        if reload:
+            invalidate_injection_plans(module_name)
+        try:
+            rule_classes = get_classes_from_module_name(
+                module_name, Rule, reload=reload
+            )
+        except ImportError as e:
+            self.error_or_exception(f'Import module "{module_name}" failed:', e)
+        else:
+            for rule_class, module in rule_classes:
+                self._load_rule_class(
+                    rule_class,  # type: ignore
+                    rule_load_type,
+                    module.__file__,
+                )
+
+    def _load_rules(
+        self,
+        *rules: Union[Type[Rule[Any, Any, Any]], str, Path],
+        rule_load_type: Optional[RuleLoadType] = None,
+        reload: bool = False,
+    ) -> None:
+        """Load rules.
+
+        Args:
+            *rules: rule class, rule module name or rule module file path.
+                Type can be ``Type[Rule]``, ``str`` or ``pathlib.Path``.
+                If it is ``Type[Rule]``, it will be loaded as a rule class.
+                If it is of type ``str``, it will be loaded as the rule module
+                name, and the format is the same as the Python ``import``
+                statement. For example: ``path.of.rule``.
+                If it is of type ``pathlib.Path``, it will be loaded as the
+                rule module file path. For example: ``pathlib.Path("path/of/rule")``.
+            rule_load_type: rule loading type, if it is ``None``, it will be
+                automatically determined, otherwise the specified type will be used.
+            reload: Whether to reload the module.
+        """
+        for rule_ in rules:
+            try:
+                if isinstance(rule_, type) and issubclass(rule_, Rule):
+                    self._load_rule_class(
+                        rule_, rule_load_type or RuleLoadType.CLASS, None
+                    )
+                elif isinstance(rule_, str):
+                    logger.info(f'Loading rules from module "{rule_}"')
+                    self._load_rules_from_module_name(
+                        rule_,
+                        rule_load_type=rule_load_type or RuleLoadType.NAME,
+                        reload=reload,
+                    )
+                elif isinstance(rule_, Path):
+                    logger.info(f'Loading rules from path "{rule_}"')
+                    if not rule_.is_file():
+                        raise LoadModuleError(  # noqa: TRY301
+                            f'The rule path "{rule_}" must be a file'
+                        )
+
+                    if rule_.suffix != ".py":
+                        raise LoadModuleError(  # noqa: TRY301
+                            f'The path "{rule_}" must endswith ".py"'
+                        )
+
+                    rule_module_name = None
+                    for path in self._module_path_finder.path:
+                        try:
+                            if rule_.stem == "__init__":
+                                if rule_.resolve().parent.parent.samefile(Path(path)):
+                                    rule_module_name = rule_.resolve().parent.name
+                                    break
+                            elif rule_.resolve().parent.samefile(Path(path)):
+                                rule_module_name = rule_.stem
+                                break
+                        except OSError:
+                            continue
+                    if rule_module_name is None:
+                        rel_path = rule_.resolve().relative_to(Path().resolve())
+                        if rel_path.stem == "__init__":
+                            rule_module_name = ".".join(rel_path.parts[:-1])
+                        else:
+                            rule_module_name = ".".join(
+                                rel_path.parts[:-1] + (rel_path.stem,)
+                            )
+
+                    self._load_rules_from_module_name(
+                        rule_module_name,
+                        rule_load_type=rule_load_type or RuleLoadType.FILE,
+                        reload=reload,
+                    )
+                else:
+                    raise TypeError(  # noqa: TRY301
+                        f"{rule_} can not be loaded as rule"
+                    )
+            except Exception as e:
+                self.error_or_exception(f'Load rule "{rule_}" failed:', e)
+
+    def load_rules(
+        self, *rules: Union[Type[Rule[Any, Any, Any]], str, Path]
+    ) -> None:
+        """Load rules.
+
+        Args:
+            *rules: rule class, rule module name or rule module file path.
+                Type can be ``Type[Rule]``, ``str`` or ``pathlib.Path``.
+        """
+        self._extend_rules.extend(rules)
+        return self._load_rules(*rules)
+
+    def _load_rules_from_dirs(self, *dirs: Path) -> None:
+        """Load rules from directories."""
+        dir_list = [str(x.resolve()) for x in dirs]
+        logger.info(f'Loading rules from dirs "{", ".join(map(str, dir_list))}"')
+        self._module_path_finder.path.extend(dir_list)
+        for module_info in pkgutil.iter_modules(dir_list):
+            if not module_info.name.startswith("_"):
+                self._load_rules_from_module_name(
+                    module_info.name, rule_load_type=RuleLoadType.DIR
+                )
+
+    def load_rules_from_dirs(self, *dirs: Path) -> None:
+        """Load rules from directories, names starting with ``_`` are ignored.
+
+        Args:
+            *dirs: A list of directories where rules are stored.
+        """
+        self._extend_rule_dirs.extend(dirs)
+        self._load_rules_from_dirs(*dirs)
+
+    def _load_services(self, *services: Union[Type[Service[Any, Any]], str]) -> None:
+        """Load services.
+
+        Args:
+            *services: service class or service module name.
+        """
+        for service_ in services:
+            service_object: Service[Any, Any]
+            try:
+                if isinstance(service_, type) and issubclass(service_, Service):
+                    service_object = service_(self)
+                elif isinstance(service_, str):
+                    service_classes = get_classes_from_module_name(service_, Service)
+                    if not service_classes:
+                        raise LoadModuleError(  # noqa: TRY301
+                            f"Can not find Service class in the {service_} module"
+                        )
+                    if len(service_classes) > 1:
+                        raise LoadModuleError(  # noqa: TRY301
+                            f"More then one Service class in the {service_} module"
+                        )
+                    service_object = service_classes[0][0](self)  # type: ignore
+                else:
+                    raise TypeError(  # noqa: TRY301
+                        f"{service_} can not be loaded as service"
+                    )
+            except Exception as e:
+                self.error_or_exception(f'Load service "{service_}" failed:', e)
+            else:
+                self.services.append(service_object)
+                logger.info(
+                    f'Succeeded to load service "{service_object.__class__.__name__}" '
+                    f'from "{service_}"'
+                )
+
+    def load_services(self, *services: Union[Type[Service[Any, Any]], str]) -> None:
+        """Load services.
+
+        Args:
+            *services: service class or service module name.
+        """
+        self._extend_services.extend(services)
+        self._load_services(*services)
+
+    def get_service(self, service: Union[str, Type[Service[Any, Any]]]) -> Any:
+        """Get a loaded service by name or class.
+
+        Args:
+            service: service name or class.
+
+        Returns:
+            Service object.
+
+        Raises:
+            LookupError: The service with the given name or type was not found.
+        """
+        for _service in self.services:
+            if isinstance(service, str):
+                if _service.name == service:
+                    return _service
+            elif isinstance(_service, service):
+                return _service
+        raise LookupError(f'Can not find service named "{service}"')
+
+    def get_rule(self, name: str) -> Type[Rule[Any, Any, Any]]:
+        """Get a loaded rule class by name.
+
+        Args:
+            name: rule name, the name of the rule class.
+
+        Returns:
+            The rule class.
+
+        Raises:
+            LookupError: The rule with the given name was not found.
+        """
+        for _rule in self.rules:
+            if _rule.__name__ == name:
+                return _rule
+        raise LookupError(f'Can not find rule named "{name}"')
+
+    def error_or_exception(
+        self, message: str, exception: Exception
+    ) -> None:  # pragma: no cover
+        """Output error or exception logs depending on whether
+        ``verbose_exception`` is configured.
+
+        Args:
+            message: message.
+            exception: exception.
+        """
+        error_or_exception(message, exception, self.config.core.log.verbose_exception)
+
+    def core_run_hook(self, func: CoreHook) -> CoreHook:
+        """Register a hook function that runs when the core starts."""
+        self._core_run_hooks.append(func)
+        return func
+
+    def core_exit_hook(self, func: CoreHook) -> CoreHook:
+        """Register a hook function that runs when the core exits."""
+        self._core_exit_hooks.append(func)
+        return func
+
+    def service_startup_hook(self, func: ServiceHook) -> ServiceHook:
+        """Register a hook function that runs when a service starts up."""
+        self._service_startup_hooks.append(func)
+        return func
+
+    def service_run_hook(self, func: ServiceHook) -> ServiceHook:
+        """Register a hook function that runs when a service runs."""
+        self._service_run_hooks.append(func)
+        return func
+
+    def service_shutdown_hook(self, func: ServiceHook) -> ServiceHook:
+        """Register a hook function that runs when a service shuts down."""
+        self._service_shutdown_hooks.append(func)
+        return func
+
+    def event_preprocessor_hook(self, func: EventHook) -> EventHook:
+        """Register a hook function that runs before an event is dispatched."""
+        self._event_preprocessor_hooks.append(func)
+        return func
+
+    def event_postprocessor_hook(self, func: EventHook) -> EventHook:
+        """Register a hook function that runs after an event is dispatched."""
+        self._event_postprocessor_hooks.append(func)
+        return func
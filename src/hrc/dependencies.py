@@ -1,5 +1,13 @@
+import asyncio
 import inspect
-from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
+import time
+from contextlib import (
+    AbstractAsyncContextManager,
+    AbstractContextManager,
+    AsyncExitStack,
+    asynccontextmanager,
+    contextmanager,
+)
 from typing import (
     Any,
     AsyncContextManager,
@@ -8,13 +16,19 @@ from typing import (
     ContextManager,
     Dict,
     Generator,
+    List,
+    Literal,
+    NamedTuple,
     Optional,
+    Tuple,
     Type,
     TypeVar,
     Union,
     cast,
 )
 
+from hrc.event import Event
+from hrc.exceptions import DependencyScopeError
 from hrc.utils import get_annotations, sync_ctx_manager_wrapper
 
 _T = TypeVar("_T")
@@ -27,28 +41,194 @@ Dependency = Union[
 ]
 
 
+Scope = Literal["app", "session", "event"]
+
 __all__ = ["Depends"]
 
+# From the longest to the shortest lived
+_SCOPES: Tuple[Scope, ...] = ("app", "session", "event")
+
 
 class InnerDepends:
 
     dependency: Optional[Dependency[Any]]
     use_cache: bool
+    scope: Scope
 
     def __init__(
-        self, dependency: Optional[Dependency[Any]] = None, *, use_cache: bool = True
+        self,
+        dependency: Optional[Dependency[Any]] = None,
+        *,
+        use_cache: bool = True,
+        scope: Scope = "event",
     ) -> None:
+        if scope not in _SCOPES:
+            raise ValueError(f"scope must be one of {_SCOPES}, not {scope!r}")
         self.dependency = dependency
         self.use_cache = use_cache
+        self.scope = scope
 
     def __repr__(self) -> str:
         attr = getattr(self.dependency, "__name__", type(self.dependency).__name__)
         cache = "" if self.use_cache else ", use_cache=False"
-        return f"InnerDepends({attr}{cache})"
-        
-        
-def Depends(dependency: Optional[Dependency[_T]] = None, *, use_cache: bool = True) -> _T:
-    return InnerDepends(dependency=dependency, use_cache=use_cache)  # type: ignore
+        scope = "" if self.scope == "event" else f", scope={self.scope!r}"
+        return f"InnerDepends({attr}{cache}{scope})"
+
+
+def Depends(
+    dependency: Optional[Dependency[_T]] = None,
+    *,
+    use_cache: bool = True,
+    scope: Scope = "event",
+) -> _T:
+    """Declare a dependency of a rule or of another dependency.
+
+    Args:
+        dependency: dependency class or generator function, if ``None``, the
+            annotation of the attribute is used.
+        use_cache: Whether to reuse the value already built in the same scope.
+        scope: Lifetime of the value. ``event`` values are built for every
+            event. ``session`` values are shared by the events of one session
+            until the session expires. ``app`` values are built once and
+            closed when the core shuts down. A dependency can only depend on
+            values of its own or a longer lived scope, ``event`` dependencies
+            of an ``app`` or ``session`` dependency are built in its scope.
+            The event itself is only available in the ``event`` scope.
+    """
+    return InnerDepends(  # type: ignore
+        dependency=dependency, use_cache=use_cache, scope=scope
+    )
+
+
+class DependencyScope:
+    """Dependencies shared by all events of one scope.
+
+    Attributes:
+        stack: Exit stack of the context managers entered in this scope.
+        dependency_cache: Dependencies built in this scope.
+        lock: Held while a dependency is built in this scope, so that
+            concurrent events do not build the same dependency twice.
+        last_used: ``time.monotonic()`` of the last time the scope was used.
+        in_use: Number of events being handled with this scope, a scope in use
+            must not be closed.
+    """
+
+    stack: AsyncExitStack
+    dependency_cache: Dict[Dependency[Any], Any]
+    lock: asyncio.Lock
+    last_used: float
+    in_use: int
+
+    def __init__(
+        self, dependency_cache: Optional[Dict[Dependency[Any], Any]] = None
+    ) -> None:
+        self.stack = AsyncExitStack()
+        self.dependency_cache = dict(dependency_cache or {})
+        self.last_used = time.monotonic()
+        self.in_use = 0
+        self.lock = asyncio.Lock()
+
+    async def aclose(self) -> None:
+        """Close the context managers entered in this scope."""
+        self.dependency_cache.clear()
+        await self.stack.aclose()
+
+
+class InjectionPlan(NamedTuple):
+    """Precomputed recipe for building a dependency.
+
+    Attributes:
+        kind: ``class``, ``async_generator`` or ``generator``.
+        context: For classes, whether instances are ``async`` or ``sync``
+            context managers, ``None`` if they are plain objects.
+        attributes: ``(name, dependency, use_cache, scope)`` of every
+            attribute declared with ``Depends()``.
+    """
+
+    kind: Literal["class", "async_generator", "generator"]
+    context: Optional[Literal["async", "sync"]]
+    attributes: Tuple[Tuple[str, Dependency[Any], bool, Scope], ...]
+
+    @property
+    def concurrent(self) -> bool:
+        """Whether building the dependency may wait on I/O, so it is worth
+        resolving concurrently with its siblings."""
+        return self.kind == "async_generator" or (
+            self.kind == "class"
+            and (self.context == "async" or bool(self.attributes))
+        )
+
+
+_injection_plans: Dict[Dependency[Any], InjectionPlan] = {}
+
+
+def compile_injection_plan(dependent: Dependency[Any]) -> InjectionPlan:
+    """Inspect a dependency and build its injection plan.
+
+    Args:
+        dependent: dependency class or generator function.
+
+    Returns:
+        The injection plan of the dependency.
+
+    Raises:
+        TypeError: The dependency can not be solved.
+    """
+    if isinstance(dependent, type):
+        ann: Dict[str, Any] = {}
+        for klass in reversed(dependent.__mro__):
+            ann.update(get_annotations(klass))
+        attributes: List[Tuple[str, Dependency[Any], bool, Scope]] = []
+        for name, sub_dependent in inspect.getmembers(
+            dependent, lambda x: isinstance(x, InnerDepends)
+        ):
+            assert isinstance(sub_dependent, InnerDepends)
+            dependency = sub_dependent.dependency
+            if dependency is None:
+                dependency = ann.get(name, None)
+                if dependency is None:
+                    raise TypeError("can not solve dependent")
+            attributes.append(
+                (name, dependency, sub_dependent.use_cache, sub_dependent.scope)
+            )
+        context: Optional[Literal["async", "sync"]] = None
+        if issubclass(dependent, AbstractAsyncContextManager):
+            context = "async"
+        elif issubclass(dependent, AbstractContextManager):
+            context = "sync"
+        return InjectionPlan("class", context, tuple(attributes))
+    if inspect.isasyncgenfunction(dependent):
+        return InjectionPlan("async_generator", None, ())
+    if inspect.isgeneratorfunction(dependent):
+        return InjectionPlan("generator", None, ())
+    raise TypeError("dependent is not a class or generator function")
+
+
+def get_injection_plan(dependent: Dependency[Any]) -> InjectionPlan:
+    """Get the injection plan of a dependency, compiling it on first use."""
+    try:
+        return _injection_plans[dependent]
+    except KeyError:
+        plan = _injection_plans[dependent] = compile_injection_plan(dependent)
+        return plan
+
+
+def invalidate_injection_plans(module_name: Optional[str] = None) -> None:
+    """Drop cached injection plans.
+
+    Args:
+        module_name: Only drop the plans of dependencies defined in this module
+            or its submodules, drop all plans if ``None``.
+    """
+    if module_name is None:
+        _injection_plans.clear()
+        return
+    for dependent in list(_injection_plans):
+        dependent_module = getattr(dependent, "__module__", None) or ""
+        if dependent_module == module_name or dependent_module.startswith(
+            module_name + "."
+        ):
+            del _injection_plans[dependent]
 
 
 async def solve_dependencies(
@@ -57,29 +237,215 @@ async def solve_dependencies(
     use_cache: bool,
     stack: AsyncExitStack,
     dependency_cache: Dict[Dependency[Any], Any],
+    scopes: Optional[Dict[Scope, DependencyScope]] = None,
 ) -> _T:
-    if use_cache and dependent in dependency_cache:
-        return dependency_cache[dependent]
+    """Solve a dependency and its sub-dependencies.
 
-    if isinstance(dependent, type):
+    Independent sub-dependencies that may wait on I/O are resolved
+    concurrently. Context managers are entered on ``stack`` as soon as they
+    are ready, so they are exited in the reverse order of their setup and
+    never before the dependencies that were built from them.
+
+    Args:
+        dependent: dependency class or generator function.
+        use_cache: Whether to reuse a value already in ``dependency_cache``.
+        stack: Exit stack that owns the entered context managers.
+        dependency_cache: Cache of solved dependencies.
+        scopes: The ``app`` and ``session`` scopes sub-dependencies declared
+            with these scopes are solved in. Missing scopes fall back to the
+            event scope, i.e. ``stack`` and ``dependency_cache``.
+
+    Returns:
+        The solved dependency.
+    """
+    return await _solve_dependencies(
+        dependent,
+        use_cache=use_cache,
+        stack=stack,
+        dependency_cache=dependency_cache,
+        in_flight=None,
+        scopes=scopes or {},
+    )
+
+
+async def _solve_dependencies(
+    dependent: Dependency[_T],
+    *,
+    use_cache: bool,
+    stack: AsyncExitStack,
+    dependency_cache: Dict[Dependency[Any], Any],
+    in_flight: Optional[Dict[Dependency[Any], "asyncio.Future[Any]"]],
+    scopes: Dict[Scope, DependencyScope],
+    scope_name: Scope = "event",
+) -> _T:
+    if use_cache:
+        if dependent in dependency_cache:
+            return dependency_cache[dependent]
+        if in_flight is not None:
+            # Concurrent branches are running, share the dependencies they build
+            if dependent in in_flight:
+                return await asyncio.shield(in_flight[dependent])
+            future = in_flight[dependent] = asyncio.get_running_loop().create_future()
+            try:
+                depend = await _build_dependency(
+                    dependent,
+                    stack=stack,
+                    dependency_cache=dependency_cache,
+                    in_flight=in_flight,
+                    scopes=scopes,
+                    scope_name=scope_name,
+                )
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except BaseException as e:
+                future.set_exception(e)
+                future.exception()  # Retrieved by the branch that raises it
+                raise
+            future.set_result(depend)
+            return depend
+    return await _build_dependency(
+        dependent,
+        stack=stack,
+        dependency_cache=dependency_cache,
+        in_flight=in_flight,
+        scopes=scopes,
+        scope_name=scope_name,
+    )
+
+
+async def _solve_scoped_dependency(
+    dependent: Dependency[_T],
+    *,
+    use_cache: bool,
+    scope_name: Scope,
+    scopes: Dict[Scope, DependencyScope],
+) -> _T:
+    """Solve a dependency in a longer lived scope."""
+    scope = scopes[scope_name]
+    scope.last_used = time.monotonic()
+    if use_cache and dependent in scope.dependency_cache:
+        return scope.dependency_cache[dependent]
+    async with scope.lock:
+        return await _solve_dependencies(
+            dependent,
+            use_cache=use_cache,
+            stack=scope.stack,
+            dependency_cache=scope.dependency_cache,
+            in_flight=None,
+            # Only the scopes that live longer are visible from this one
+            scopes={
+                k: v
+                for k, v in scopes.items()
+                if _SCOPES.index(k) < _SCOPES.index(scope_name)
+            },
+            scope_name=scope_name,
+        )
+
+
+def _check_scope(
+    dependent: Dependency[Any],
+    scope_name: Scope,
+    sub_dependency: Dependency[Any],
+    sub_scope: Scope,
+) -> None:
+    """Check that a dependency of the ``scope_name`` scope may use a
+    sub-dependency of the ``sub_scope`` scope.
+
+    Raises:
+        DependencyScopeError: The sub-dependency does not live long enough.
+    """
+    if sub_scope != "event" and _SCOPES.index(sub_scope) > _SCOPES.index(
+        scope_name
+    ):
+        raise DependencyScopeError(
+            f"{dependent!r} of the {scope_name!r} scope can not depend on "
+            f"{sub_dependency!r} of the shorter lived {sub_scope!r} scope"
+        )
+    if (
+        scope_name != "event"
+        and isinstance(sub_dependency, type)
+        and issubclass(sub_dependency, Event)
+    ):
+        raise DependencyScopeError(
+            f"{dependent!r} of the {scope_name!r} scope can not depend on the "
+            "event, it is only available in the 'event' scope"
+        )
+
+
+async def _build_dependency(
+    dependent: Dependency[_T],
+    *,
+    stack: AsyncExitStack,
+    dependency_cache: Dict[Dependency[Any], Any],
+    in_flight: Optional[Dict[Dependency[Any], "asyncio.Future[Any]"]],
+    scopes: Dict[Scope, DependencyScope],
+    scope_name: Scope = "event",
+) -> _T:
+    plan = get_injection_plan(dependent)
+    if plan.kind == "class":
         # type of dependent is Type[T]
         values: Dict[str, Any] = {}
-        ann = get_annotations(dependent)
-        for name, sub_dependent in inspect.getmembers(
-            dependent, lambda x: isinstance(x, InnerDepends)
-        ):
-            assert isinstance(sub_dependent, InnerDepends)
-            if sub_dependent.dependency is None:
-                dependent_ann = ann.get(name, None)
-                if dependent_ann is None:
-                    raise TypeError("can not solve dependent")
-                sub_dependent.dependency = dependent_ann
-            values[name] = await solve_dependencies(
-                sub_dependent.dependency,
-                use_cache=sub_dependent.use_cache,
+        concurrent: List[Tuple[str, Dependency[Any], bool]] = []
+        for name, sub_dependency, sub_use_cache, sub_scope in plan.attributes:
+            _check_scope(dependent, scope_name, sub_dependency, sub_scope)
+            if sub_scope != scope_name and sub_scope in scopes:
+                values[name] = await _solve_scoped_dependency(
+                    sub_dependency,
+                    use_cache=sub_use_cache,
+                    scope_name=sub_scope,
+                    scopes=scopes,
+                )
+            elif sub_use_cache and sub_dependency in dependency_cache:
+                values[name] = dependency_cache[sub_dependency]
+            elif get_injection_plan(sub_dependency).concurrent:
+                concurrent.append((name, sub_dependency, sub_use_cache))
+            else:
+                values[name] = await _solve_dependencies(
+                    sub_dependency,
+                    use_cache=sub_use_cache,
+                    stack=stack,
+                    dependency_cache=dependency_cache,
+                    in_flight=in_flight,
+                    scopes=scopes,
+                    scope_name=scope_name,
+                )
+        if len(concurrent) == 1:
+            name, sub_dependency, sub_use_cache = concurrent[0]
+            values[name] = await _solve_dependencies(
+                sub_dependency,
+                use_cache=sub_use_cache,
                 stack=stack,
                 dependency_cache=dependency_cache,
+                in_flight=in_flight,
+                scopes=scopes,
+                scope_name=scope_name,
+            )
+        elif concurrent:
+            if in_flight is None:
+                in_flight = {}
+            # Wait for every branch even if one fails, so that all entered
+            # context managers are on the stack before it is unwound
+            results = await asyncio.gather(
+                *(
+                    _solve_dependencies(
+                        sub_dependency,
+                        use_cache=sub_use_cache,
+                        stack=stack,
+                        dependency_cache=dependency_cache,
+                        in_flight=in_flight,
+                        scopes=scopes,
+                        scope_name=scope_name,
+                    )
+                    for _, sub_dependency, sub_use_cache in concurrent
+                ),
+                return_exceptions=True,
             )
+            for (name, _, _), result in zip(concurrent, results):
+                if isinstance(result, BaseException):
+                    raise result
+                values[name] = result
+
         depend_obj = cast(
             Union[_T, AsyncContextManager[_T], ContextManager[_T]],
             dependent.__new__(dependent),  # pyright: ignore[reportGeneralTypeIssues]
@@ -88,11 +454,11 @@ async def solve_dependencies(
             setattr(depend_obj, key, value)
         depend_obj.__init__()  # type: ignore[misc] # pylint: disable=unnecessary-dunder-call
 
-        if isinstance(depend_obj, AsyncContextManager):
+        if plan.context == "async":
             depend = await stack.enter_async_context(
                 depend_obj  # pyright: ignore[reportUnknownArgumentType]
             )
-        elif isinstance(depend_obj, ContextManager):
+        elif plan.context == "sync":
             depend = await stack.enter_async_context(
                 sync_ctx_manager_wrapper(
                     depend_obj  # pyright: ignore[reportUnknownArgumentType]
@@ -100,16 +466,14 @@ async def solve_dependencies(
             )
         else:
             depend = depend_obj
-    elif inspect.isasyncgenfunction(dependent):
+    elif plan.kind == "async_generator":
         # type of dependent is Callable[[], AsyncGenerator[T, None]]
         cm = asynccontextmanager(dependent)()
         depend = cast(_T, await stack.enter_async_context(cm))
-    elif inspect.isgeneratorfunction(dependent):
+    else:
         # type of dependent is Callable[[], Generator[T, None, None]]
         cm = sync_ctx_manager_wrapper(contextmanager(dependent)())
         depend = cast(_T, await stack.enter_async_context(cm))
-    else:
-        raise TypeError("dependent is not a class or generator function")
 
     dependency_cache[dependent] = depend
-    return depend
\ No newline at end of file
+    return depend
@@ -0,0 +1,97 @@
+"""Dice expressions and their exact probability distributions."""
+
+from array import array
+from functools import lru_cache
+from itertools import accumulate
+
+from hrc._core import DiceExpr, compile_dice
+
+__all__ = ["DiceExpr", "Distribution", "compile_dice", "distribution"]
+
+
+class Distribution:
+    """The exact distribution of a dice expression.
+
+    Queries are index lookups into the precomputed PMF and CDF.
+
+    Attributes:
+        minimum: The smallest possible value.
+        maximum: The largest possible value.
+        pmf: The probability of each value from ``minimum`` to ``maximum``.
+        cdf: The probability of each value or less.
+    """
+
+    __slots__ = ("minimum", "maximum", "pmf", "cdf")
+
+    minimum: int
+    maximum: int
+    pmf: "array[float]"
+    cdf: "array[float]"
+
+    def __init__(self, minimum: int, pmf: "array[float]") -> None:
+        self.minimum = minimum
+        self.maximum = minimum + len(pmf) - 1
+        self.pmf = pmf
+        self.cdf = array("d", accumulate(pmf))
+
+    def __repr__(self) -> str:
+        return f"Distribution(minimum={self.minimum}, maximum={self.maximum})"
+
+    @property
+    def mean(self) -> float:
+        """The expected value."""
+        return sum(p * (self.minimum + i) for i, p in enumerate(self.pmf))
+
+    def probability(self, value: int) -> float:
+        """The probability of exactly ``value``."""
+        if self.minimum <= value <= self.maximum:
+            return self.pmf[value - self.minimum]
+        return 0.0
+
+    def at_most(self, value: int) -> float:
+        """The probability of ``value`` or less."""
+        if value < self.minimum:
+            return 0.0
+        if value >= self.maximum:
+            return 1.0
+        return self.cdf[value - self.minimum]
+
+    def at_least(self, value: int) -> float:
+        """The probability of ``value`` or more."""
+        return 1.0 - self.at_most(value - 1)
+
+
+def normalize(expression: str) -> str:
+    """Normalize a dice expression, whitespace and letter case do not matter.
+
+    Args:
+        expression: The dice expression.
+
+    Returns:
+        The normalized expression.
+    """
+    return "".join(expression.split()).lower()
+
+
+@lru_cache(maxsize=1024)
+def _distribution(expression: str) -> Distribution:
+    return Distribution(*compile_dice(expression).pmf())
+
+
+def distribution(expression: str) -> Distribution:
+    """Get the exact distribution of a dice expression.
+
+    The distributions of the most recently used expressions are cached, so
+    asking for the odds of a check again costs a dictionary lookup.
+
+    Args:
+        expression: The dice expression, such as ``3d6`` or ``p2``.
+
+    Returns:
+        The distribution.
+
+    Raises:
+        ValueError: The expression is malformed or spans too many values.
+        ZeroDivisionError: The expression may divide by zero.
+    """
+    return _distribution(normalize(expression))
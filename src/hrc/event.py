@@ -22,10 +22,31 @@ class Event(ABC, BaseModel, Generic[RuleT]):
     def __repr__(self) -> str:
         return self.__str__()
 
+    def get_session_id(self) -> Union[None, int, str]:
+        """Get the identifier of the session this event belongs to.
+
+        Events of the same session are handled by the core in the order they
+        are received, while events of different sessions may be handled in
+        parallel.
+
+        Returns:
+            Session identifier, ``None`` means all events of the service
+            belong to one session.
+        """
+        return None
+
 
 class MessageEvent(Event[RuleT], Generic[RuleT]):
     """Base class for general message event classes."""
 
+    @abstractmethod
+    def get_sender_id(self) -> Union[None, int, str]:
+        """Get the unique identifier of the sender of the message.
+
+        Returns:
+            The unique identifier of the sender of the message.
+        """
+
     @abstractmethod
     def get_plain_text(self) -> str:
         """Get the plain text content of the message.
@@ -56,6 +77,10 @@ class MessageEvent(Event[RuleT], Generic[RuleT]):
             Is it the same sender?
         """
 
+    def get_session_id(self) -> Union[None, int, str]:
+        """Messages are grouped into sessions by sender by default."""
+        return self.get_sender_id()
+
     async def get(
         self,
         *,
@@ -63,9 +88,10 @@ class MessageEvent(Event[RuleT], Generic[RuleT]):
         timeout: Optional[Union[int, float]] = None,
     ) -> Self:
 
-        return await self.rule.get(
+        return await self.service.get(
             self.is_same_sender,
             event_type=type(self),
+            session_id=self.get_session_id(),
             max_try_times=max_try_times,
             timeout=timeout,
         )
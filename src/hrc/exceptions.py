@@ -20,3 +20,7 @@ class GetEventTimeout(CoreException):
 
 class LoadModuleError(CoreException):
     ...
+
+
+class DependencyScopeError(CoreException):
+    ...
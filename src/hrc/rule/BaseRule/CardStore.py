@@ -0,0 +1,430 @@
+"""Character cards of one schema kept in columns."""
+
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import MutableMapping
+from itertools import count
+from typing import (
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    MutableSequence,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+from .CharacterCard import CardSchema
+
+__all__ = ["CardStore", "StoredCard"]
+
+_tokens = count(1)
+
+
+class StoredCard(MutableMapping):  # type: ignore[type-arg]
+    """A row of a ``CardStore``, reads and writes go to the columns.
+
+    The card is bound to the row as long as it holds this card: once the
+    card is removed, or all cards are replaced by ``CardStore.restore``,
+    using it raises ``ReferenceError`` instead of reaching another card
+    stored in the same row.
+
+    Attributes:
+        store: The store.
+        row: The row of the card in the store.
+
+    Raises:
+        KeyError: Reading an unset attribute or a name not in the schema.
+        OverflowError: Storing a value that does not fit the schema type.
+        ReferenceError: Using a card no longer in the store.
+    """
+
+    __slots__ = ("store", "row", "_generation")
+
+    store: "CardStore"
+    row: int
+
+    def __init__(self, store: "CardStore", row: int) -> None:
+        self.store = store
+        self.row = row
+        self._generation = store._generations[row]  # noqa: SLF001
+
+    def _check(self) -> int:
+        if self.store._generations[self.row] != self._generation:  # noqa: SLF001
+            raise ReferenceError("the card was removed from the store")
+        return self.row
+
+    @property
+    def owner(self) -> Hashable:
+        """The id of the owner of the card."""
+        return self.store._owners[self._check()]  # noqa: SLF001
+
+    @property
+    def group(self) -> Hashable:
+        """The id of the group the card is used in."""
+        return self.store._groups[self._check()]  # noqa: SLF001
+
+    def __getitem__(self, name: str) -> int:
+        value = self.store.column(name)[self._check()]
+        if value == self.store.schema.unset:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name: str, value: int) -> None:
+        if value == self.store.schema.unset:
+            raise OverflowError(f"{value} is reserved for unset slots")
+        self.store.update(name, (self._check(),), value)
+
+    def __delitem__(self, name: str) -> None:
+        if name not in self:
+            raise KeyError(name)
+        self.store.update(name, (self.row,), self.store.schema.unset)
+
+    def __contains__(self, name: object) -> bool:
+        slot = self.store.schema.slots.get(name)  # type: ignore[arg-type]
+        row = self._check()
+        return (
+            slot is not None
+            and self.store._columns[slot][row] != self.store.schema.unset  # noqa: SLF001
+        )
+
+    def __iter__(self) -> Iterator[str]:
+        self._check()
+        return (name for name in self.store.schema.names if name in self)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"StoredCard(owner={self.owner!r}, group={self.group!r}, {dict(self)!r})"
+
+
+class CardStore:
+    """Cards of one schema kept in columns, with secondary indexes.
+
+    Every slot of the schema is a typed ``array`` column and a card is a row.
+    Cards are found in constant time by owner, by group or by both through
+    hash indexes. Attributes passed as ``indexes`` also keep a sorted index
+    of ``(value, row)`` pairs for range queries; unset values are not
+    indexed. Rows of removed cards are reused.
+
+    Columns may also be read-write views of a memory-mapped snapshot, see
+    ``restore``; they are copied into arrays the first time the store grows
+    or by ``detach``. Rows changed since the last ``pop_changes`` are tracked
+    so snapshots can append only them.
+
+    Attributes:
+        schema: The slot layout of the cards.
+        token: Unique to this store and changed by ``restore``, so that
+            snapshots know when the changed rows do not tell everything.
+    """
+
+    schema: CardSchema
+    token: int
+
+    def __init__(self, schema: CardSchema, indexes: Iterable[str] = ()) -> None:
+        self.schema = schema
+        self.token = next(_tokens)
+        self._columns: List[MutableSequence[int]] = [
+            array(schema.typecode) for _ in schema.names
+        ]
+        self._owners: List[Hashable] = []
+        self._groups: List[Hashable] = []
+        self._free: List[int] = []
+        # Changes when the card of a row is removed, see StoredCard
+        self._generations: List[int] = []
+        self._next_generation = 1
+        self._by_owner: Dict[Hashable, Set[int]] = {}
+        self._by_group: Dict[Hashable, Set[int]] = {}
+        self._by_key: Dict[Tuple[Hashable, Hashable], int] = {}
+        self._sorted: Dict[str, List[Tuple[int, int]]] = {}
+        self._changed: Set[int] = set()
+        for name in indexes:
+            if name not in schema:
+                raise KeyError(name)
+            self._sorted[name] = []
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def __contains__(self, key: Tuple[Hashable, Hashable]) -> bool:
+        return key in self._by_key
+
+    def __iter__(self) -> Iterator[StoredCard]:
+        return (StoredCard(self, row) for row in sorted(self._by_key.values()))
+
+    @property
+    def owners(self) -> Sequence[Hashable]:
+        """The owner of every row, ``None`` for free rows."""
+        return self._owners
+
+    @property
+    def groups(self) -> Sequence[Hashable]:
+        """The group of every row, ``None`` for free rows."""
+        return self._groups
+
+    @property
+    def free_rows(self) -> Sequence[int]:
+        """The rows of removed cards, waiting to be reused."""
+        return self._free
+
+    def column(self, name: str) -> MutableSequence[int]:
+        """The column of an attribute, indexed by row.
+
+        Rows of removed cards and unset values hold ``schema.unset``.
+        """
+        return self._columns[self.schema.slots[name]]
+
+    def add(
+        self,
+        owner: Hashable,
+        group: Hashable = None,
+        values: Optional[Mapping[str, int]] = None,
+    ) -> StoredCard:
+        """Add a card, replacing the card of the owner in the group.
+
+        Args:
+            owner: The id of the owner, such as a user id.
+            group: The id of the group the card is used in.
+            values: The values of the card.
+
+        Returns:
+            The card.
+
+        Raises:
+            KeyError: A name is not in the schema.
+            OverflowError: A value does not fit the schema type.
+        """
+        # Nothing changes if a value is rejected
+        items = list((values or {}).items())
+        for name, _ in items:
+            if name not in self.schema:
+                raise KeyError(name)
+        checked = array(self.schema.typecode, [value for _, value in items])
+
+        self.remove(owner, group)
+        unset = self.schema.unset
+        if self._free:
+            row = self._free.pop()
+            self._owners[row], self._groups[row] = owner, group
+            # Free rows are not indexed, the values left there are cleared
+            for column in self._columns:
+                column[row] = unset
+        else:
+            row = len(self._owners)
+            self.detach()
+            self._owners.append(owner)
+            self._groups.append(group)
+            self._generations.append(0)
+            for column in self._columns:
+                column.append(unset)
+        self._generations[row] = self._next_generation
+        self._next_generation += 1
+        self._by_owner.setdefault(owner, set()).add(row)
+        self._by_group.setdefault(group, set()).add(row)
+        self._by_key[(owner, group)] = row
+        self._changed.add(row)
+        for (name, _), value in zip(items, checked):
+            self._write(name, [row], [value])
+        return StoredCard(self, row)
+
+    def remove(self, owner: Hashable, group: Hashable = None) -> bool:
+        """Remove the card of an owner in a group.
+
+        Returns:
+            Whether there was such a card.
+        """
+        row = self._by_key.pop((owner, group), None)
+        if row is None:
+            return False
+        unset = self.schema.unset
+        for name in self._sorted:
+            self._write(name, [row], [unset])
+        for column in self._columns:
+            column[row] = unset
+        self._discard(self._by_owner, owner, row)
+        self._discard(self._by_group, group, row)
+        self._owners[row] = self._groups[row] = None
+        self._generations[row] = 0
+        self._free.append(row)
+        self._changed.add(row)
+        return True
+
+    def get(self, owner: Hashable, group: Hashable = None) -> Optional[StoredCard]:
+        """The card of an owner in a group, ``None`` if there is none."""
+        row = self._by_key.get((owner, group))
+        return None if row is None else StoredCard(self, row)
+
+    def by_owner(self, owner: Hashable) -> List[StoredCard]:
+        """All cards of an owner."""
+        return self.cards(self._by_owner.get(owner, ()))
+
+    def by_group(self, group: Hashable) -> List[StoredCard]:
+        """All cards used in a group."""
+        return self.cards(self._by_group.get(group, ()))
+
+    def cards(self, rows: Iterable[int]) -> List[StoredCard]:
+        """The cards at some rows, in row order."""
+        return [StoredCard(self, row) for row in sorted(rows)]
+
+    def range(
+        self,
+        name: str,
+        low: Optional[int] = None,
+        high: Optional[int] = None,
+    ) -> List[int]:
+        """Rows of the cards with a value of an indexed attribute in a range.
+
+        Args:
+            name: The attribute, it must be in the ``indexes`` of the store.
+            low: The smallest value included, no lower bound if ``None``.
+            high: The largest value included, no upper bound if ``None``.
+
+        Returns:
+            The rows, ordered by value.
+        """
+        index = self._sorted[name]
+        start = 0 if low is None else bisect_left(index, (low, -1))
+        end = (
+            len(index)
+            if high is None
+            else bisect_right(index, (high, len(self._owners)))
+        )
+        return [row for _, row in index[start:end]]
+
+    def update(
+        self,
+        name: str,
+        rows: Iterable[int],
+        value: Union[int, Iterable[int], Callable[[int], int]],
+    ) -> None:
+        """Set an attribute of many cards at once.
+
+        Args:
+            name: The attribute.
+            rows: The rows of the cards.
+            value: One value for all cards, one value per row, or a function
+                of the current value returning the new one. ``schema.unset``
+                unsets the attribute.
+
+        Raises:
+            KeyError: The attribute is not in the schema.
+            ValueError: A row holds no card, or the number of values does not
+                match the number of rows.
+            OverflowError: A value does not fit the schema type.
+        """
+        column = self.column(name)
+        rows = list(rows)
+        for row in rows:
+            if not 0 <= row < len(self._generations) or not self._generations[row]:
+                raise ValueError(f"row {row} holds no card")
+        if callable(value):
+            values: Sequence[int] = [value(column[row]) for row in rows]
+        elif isinstance(value, int):
+            values = [value] * len(rows)
+        else:
+            values = list(value)
+            if len(values) != len(rows):
+                raise ValueError("one value per row is required")
+        # Validated before the column or its index changes
+        self._write(name, rows, array(self.schema.typecode, values))
+
+    def _write(self, name: str, rows: List[int], values: Sequence[int]) -> None:
+        """Write checked values to the rows of a column and its index."""
+        column = self.column(name)
+        self._changed.update(rows)
+        index = self._sorted.get(name)
+        unset = self.schema.unset
+        if index is not None and len(rows) * 8 > len(column):
+            # Rebuilding is cheaper than moving many entries one by one
+            for row, new in zip(rows, values):
+                column[row] = new
+            generations = self._generations
+            index[:] = sorted(
+                (x, row)
+                for row, x in enumerate(column)
+                if x != unset and generations[row]
+            )
+            return
+        for row, new in zip(rows, values):
+            if index is not None:
+                old = column[row]
+                if old != unset:
+                    del index[bisect_left(index, (old, row))]
+                if new != unset:
+                    insort(index, (new, row))
+            column[row] = new
+
+    def detach(self) -> None:
+        """Copy columns that are views of a snapshot into arrays."""
+        if self._columns and not isinstance(self._columns[0], array):
+            self._columns = [
+                array(self.schema.typecode, column) for column in self._columns
+            ]
+
+    def pop_changes(self) -> Set[int]:
+        """The rows added, removed or updated since the last call."""
+        changed, self._changed = self._changed, set()
+        return changed
+
+    def restore(
+        self,
+        columns: Mapping[str, MutableSequence[int]],
+        owners: Sequence[Hashable],
+        groups: Sequence[Hashable],
+        free_rows: Iterable[int] = (),
+    ) -> None:
+        """Replace all cards, rebuilding the indexes.
+
+        Args:
+            columns: Attribute name to column, one value per row. Columns of
+                the attributes of the schema that are missing are unset.
+            owners: The owner of every row.
+            groups: The group of every row.
+            free_rows: The rows without a card.
+        """
+        unset = self.schema.unset
+        missing = array(self.schema.typecode, [unset]) * len(owners)
+        self._columns = [
+            columns[name] if name in columns else array(self.schema.typecode, missing)
+            for name in self.schema.names
+        ]
+        self._owners = list(owners)
+        self._groups = list(groups)
+        self._free = list(free_rows)
+        free = set(self._free)
+        start = self._next_generation
+        self._next_generation += len(self._owners)
+        self._generations = [
+            0 if row in free else start + row for row in range(len(self._owners))
+        ]
+        self._by_owner.clear()
+        self._by_group.clear()
+        self._by_key.clear()
+        for row, (owner, group) in enumerate(zip(self._owners, self._groups)):
+            if row in free:
+                continue
+            self._by_owner.setdefault(owner, set()).add(row)
+            self._by_group.setdefault(group, set()).add(row)
+            self._by_key[(owner, group)] = row
+        for name, index in self._sorted.items():
+            index[:] = sorted(
+                (x, row)
+                for row, x in enumerate(self.column(name))
+                if x != unset and self._generations[row]
+            )
+        self._changed.clear()
+        self.token = next(_tokens)
+
+    @staticmethod
+    def _discard(index: Dict[Hashable, Set[int]], key: Hashable, row: int) -> None:
+        rows = index[key]
+        rows.discard(row)
+        if not rows:
+            del index[key]
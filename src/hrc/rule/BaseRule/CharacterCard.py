@@ -1,17 +1,336 @@
+import functools
+import inspect
+from array import array
+from collections import defaultdict
+from collections.abc import MutableMapping
 from dataclasses import dataclass
+from typing import (
+    Any,
+    Callable,
+    ClassVar,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from hrc.log import logger
+from hrc.rule.aliases import AliasMeta
 
 
 @dataclass
-class Custom(object):
+class Custom(metaclass=AliasMeta):
     """Docstring for Custom."""
 
-    property: type
+    property: Optional[type] = None
+
+
+class CardSchema:
+    """Fixed slot layout of the cards of a rule.
+
+    Every attribute and skill name gets a slot, the values of a card are a
+    typed ``array`` of one item per slot. The smallest value of the type
+    marks an unset slot.
+
+    Attributes:
+        names: The names in slot order.
+        slots: Name to slot.
+        typecode: The ``array`` type code of the values, ``h`` (16-bit) by
+            default, enough for attributes and skill percentages.
+    """
+
+    __slots__ = ("names", "slots", "typecode", "unset", "_empty")
+
+    names: Tuple[str, ...]
+    slots: Dict[str, int]
+    typecode: str
+    unset: int
+
+    def __init__(self, names: Iterable[str], typecode: str = "h") -> None:
+        self.names = tuple(dict.fromkeys(names))
+        self.slots = {name: i for i, name in enumerate(self.names)}
+        self.typecode = typecode
+        self.unset = -(1 << (array(typecode).itemsize * 8 - 1))
+        self._empty = array(typecode, [self.unset]) * len(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.slots
+
+    def __repr__(self) -> str:
+        return f"CardSchema({list(self.names)!r}, typecode={self.typecode!r})"
+
+    def new(self, values: Optional[Mapping[str, int]] = None) -> "Card":
+        """Create a card.
+
+        Args:
+            values: Initial values.
+
+        Returns:
+            The card, slots without a value are unset.
+        """
+        card = Card(self, self._empty[:])
+        if values:
+            card.update(values)
+        return card
+
+
+class Card(MutableMapping):  # type: ignore[type-arg]
+    """A character card stored as a typed array, a mapping of the set slots.
+
+    Raises:
+        KeyError: Reading an unset slot or a name not in the schema.
+        OverflowError: Storing a value that does not fit the schema type.
+    """
+
+    __slots__ = ("schema", "data")
+
+    schema: CardSchema
+    data: "array[int]"
+
+    def __init__(self, schema: CardSchema, data: "array[int]") -> None:
+        self.schema = schema
+        self.data = data
+
+    def __getitem__(self, name: str) -> int:
+        value = self.data[self.schema.slots[name]]
+        if value == self.schema.unset:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name: str, value: int) -> None:
+        if value == self.schema.unset:
+            raise OverflowError(f"{value} is reserved for unset slots")
+        self.data[self.schema.slots[name]] = value
+
+    def __delitem__(self, name: str) -> None:
+        slot = self.schema.slots[name]
+        if self.data[slot] == self.schema.unset:
+            raise KeyError(name)
+        self.data[slot] = self.schema.unset
+
+    def __contains__(self, name: object) -> bool:
+        slot = self.schema.slots.get(name)  # type: ignore[arg-type]
+        return slot is not None and self.data[slot] != self.schema.unset
+
+    def __iter__(self) -> Iterator[str]:
+        unset = self.schema.unset
+        return (
+            name
+            for name, value in zip(self.schema.names, self.data)
+            if value != unset
+        )
+
+    def __len__(self) -> int:
+        return len(self.data) - self.data.count(self.schema.unset)
+
+    def __repr__(self) -> str:
+        return f"Card({dict(self)!r})"
+
+
+class _AttributeGraph:
+    """Values, memoized derived values and who read what of one card."""
+
+    __slots__ = ("values", "cache", "dependents", "stack")
+
+    def __init__(self, values: Optional[MutableMapping] = None) -> None:  # type: ignore[type-arg]
+        self.values: MutableMapping = {} if values is None else values  # type: ignore[type-arg]
+        self.cache: Dict[str, Any] = {}
+        # Attribute name to the derived attributes that read it
+        self.dependents: Dict[str, Set[str]] = defaultdict(set)
+        self.stack: List[str] = []
+
 
+def _derived(func: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    name = func.__name__
 
-class Attribute(Custom): ...
+    @functools.wraps(func)
+    def wrapper(self: "Attribute") -> Any:
+        return self._read(name, func)
+
+    return wrapper
+
+
+class Attribute(Custom):
+    """Attributes of a character card.
+
+    Base attributes are plain values set with ``card["STR"] = 50`` and read
+    as ``card.STR()`` or ``card["STR"]``. Every public method of a subclass
+    taking no argument is a derived attribute: its value is memoized, and the
+    attributes it reads while computing are recorded. Setting an attribute
+    only forgets the derived values that read it, directly or through other
+    derived attributes. A value set explicitly overrides the method of the
+    same name, like the current ``HP`` of a wounded character.
+
+    With a ``__schema__``, the base values are kept in a compact ``Card``
+    and only names in the schema can be set. ``view`` wraps a stored card
+    without copying it.
+    """
+
+    __schema__: ClassVar[Optional[CardSchema]] = None
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        for name, value in list(vars(cls).items()):
+            if (
+                not name.startswith("_")
+                and inspect.isfunction(value)
+                and len(inspect.signature(value).parameters) == 1
+            ):
+                setattr(cls, name, _derived(value))
+
+    @property
+    def _graph(self) -> _AttributeGraph:
+        graph = self.__dict__.get("_attribute_graph")
+        if graph is None:
+            schema = self.__schema__
+            graph = self.__dict__["_attribute_graph"] = _AttributeGraph(
+                None if schema is None else schema.new()
+            )
+        return graph
+
+    @classmethod
+    def view(cls, card: Card) -> "Attribute":
+        """Read and write a stored card through the derived attributes.
+
+        Args:
+            card: The card, changes made through the view are written to it.
+
+        Returns:
+            The attributes.
+        """
+        attribute = cls()
+        attribute.__dict__["_attribute_graph"] = _AttributeGraph(card)
+        return attribute
+
+    def _track(self, graph: _AttributeGraph, name: str) -> None:
+        if graph.stack:
+            graph.dependents[name].add(graph.stack[-1])
+
+    def _read(self, name: str, func: Callable[[Any], Any]) -> Any:
+        graph = self._graph
+        self._track(graph, name)
+        if name in graph.values:
+            return graph.values[name]
+        if name in graph.cache:
+            return graph.cache[name]
+        if name in graph.stack:
+            raise RecursionError(f'Attribute "{name}" depends on itself')
+        graph.stack.append(name)
+        try:
+            value = func(self)
+        finally:
+            graph.stack.pop()
+        graph.cache[name] = value
+        return value
+
+    def __getattr__(self, name: str) -> Callable[[], Any]:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        graph = self._graph
+        # Recorded even if unset, so `hasattr(self, "CON")` checks are
+        # invalidated once CON is set
+        self._track(graph, name)
+        if name not in graph.values:
+            raise AttributeError(name)
+        value = graph.values[name]
+        return lambda: value
+
+    def __getitem__(self, name: str) -> Any:
+        return getattr(self, name)()
+
+    def __setitem__(self, name: str, value: Any) -> None:
+        self.update({name: value})
+
+    def __delitem__(self, name: str) -> None:
+        del self._graph.values[name]
+        self.invalidate(name)
+
+    def __contains__(self, name: str) -> bool:
+        return hasattr(self, name)
+
+    def update(self, values: Mapping[str, Any]) -> None:
+        """Set several attributes, then invalidate what depends on them.
+
+        Args:
+            values: Attribute name to value.
+        """
+        self._graph.values.update(values)
+        self.invalidate(*values)
+
+    def invalidate(self, *names: str) -> None:
+        """Forget the derived values depending on attributes.
+
+        Args:
+            *names: The attributes that changed.
+        """
+        graph = self._graph
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            graph.cache.pop(name, None)
+            # The edges are recorded again when the dependents are recomputed
+            pending.extend(graph.dependents.pop(name, ()))
 
 
 class Skill(Custom): ...
 
 
 class Information(Custom): ...
+
+
+def generate_cards(
+    n: int,
+    rolls: Mapping[str, str],
+    derived: Optional[Mapping[str, Callable[[Dict[str, Any]], Any]]] = None,
+    *,
+    seed: Optional[int] = None,
+) -> Any:
+    """Generate ``n`` character cards in one pass.
+
+    Every rolled attribute is one column filled by a single
+    ``DiceExpr.roll_many`` call. Derived attributes are then computed column
+    by column with NumPy, in order, so a derived attribute may use the ones
+    before it.
+
+    Args:
+        n: Number of cards.
+        rolls: Attribute name to dice expression, such as ``{"STR": "3d6"}``.
+        derived: Attribute name to a function of the columns computed so far,
+            returning a NumPy array or a scalar.
+        seed: Seed for reproducible cards.
+
+    Returns:
+        A NumPy structured array with one record per card and one field per
+        attribute.
+
+    Raises:
+        ImportError: NumPy is not installed.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        logger.warning('Bulk card generation needs "numpy", try "pip install numpy"')
+        raise
+
+    from hrc.dice import compile_dice
+
+    columns: Dict[str, Any] = {}
+    for i, (name, expression) in enumerate(rolls.items()):
+        values = compile_dice(expression).roll_many(
+            n, None if seed is None else seed + i
+        )
+        columns[name] = np.frombuffer(values, dtype=np.int64)
+    for name, func in (derived or {}).items():
+        columns[name] = np.broadcast_to(np.asarray(func(columns)), (n,))
+
+    cards = np.empty(n, dtype=[(name, x.dtype) for name, x in columns.items()])
+    for name, column in columns.items():
+        cards[name] = column
+    return cards
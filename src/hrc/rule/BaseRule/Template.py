@@ -0,0 +1,353 @@
+"""Schemas of docstring-driven character templates.
+
+A template class declares its fields as ``t_*`` methods, whose docstring is
+the definition (``力量(STR): ...``) and whose return annotation the type
+(``int``, ``Union[int, str]``, ``Optional[Literal["左撇子", "右撇子"]]``).
+A ``t_*`` method with a body computes a derived field. ``d_*`` methods hold
+notes for the help text.
+
+``compile_template`` walks a class once into a frozen ``TemplateSchema``.
+Schemas are cached in memory and on disk, keyed by the hash of the source
+file of the template, so validation and help rendering never inspect the
+class again.
+"""
+
+import dis
+import hashlib
+import inspect
+import json
+import os
+import sys
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Literal,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+    get_args,
+    get_origin,
+    get_type_hints,
+)
+
+from hrc.log import logger
+
+from .Wiki.fuzzy import normalize_term, parse_term
+
+__all__ = [
+    "CACHE_DIR",
+    "FieldSchema",
+    "TemplateSchema",
+    "compile_template",
+]
+
+# Bump when the cached layout changes
+SCHEMA_VERSION = 1
+
+CACHE_DIR = Path(".cache", "hrc", "templates")
+
+
+# Instructions of a function without a body, before and since Python 3.12
+_EMPTY_BODIES = (
+    [("LOAD_CONST", None), ("RETURN_VALUE", None)],
+    [("RETURN_CONST", None)],
+)
+
+
+class FieldSchema(NamedTuple):
+    """A field of a template.
+
+    Attributes:
+        method: The name of the ``t_*`` method.
+        name: The name of the field, such as ``力量``.
+        aliases: Other names, such as ``STR``.
+        help: The description of the field.
+        types: Names of the accepted types, such as ``("int", "str")``.
+        literals: The allowed values, empty if any value of the types is.
+        optional: Whether the field may be left empty.
+        derived: Whether the method computes the value.
+    """
+
+    method: str
+    name: str
+    aliases: Tuple[str, ...]
+    help: str
+    types: Tuple[str, ...]
+    literals: Tuple[Any, ...]
+    optional: bool
+    derived: bool
+
+
+_TYPES: Dict[str, Tuple[type, ...]] = {
+    "int": (int,),
+    "float": (int, float),
+    "str": (str,),
+    "bool": (bool,),
+}
+
+
+class TemplateSchema(NamedTuple):
+    """The compiled schema of a template class.
+
+    Attributes:
+        template: The qualified name of the template class.
+        source_hash: The hash the cached schema is keyed by.
+        title: The first line of the class docstring.
+        fields: The fields, in declaration order.
+        notes: The ``d_*`` notes, in declaration order.
+    """
+
+    template: str
+    source_hash: str
+    title: str
+    fields: Tuple[FieldSchema, ...]
+    notes: Tuple[str, ...]
+
+    def field(self, name: str) -> Optional[FieldSchema]:
+        """Find a field by method suffix, name or alias, ``None`` if none."""
+        return _field_index(self).get(normalize_term(name))
+
+    def derived(self, template: type) -> Dict[str, Callable[[Any], Any]]:
+        """The functions computing the derived fields, by field name.
+
+        Args:
+            template: The template class the schema was compiled from.
+        """
+        return {
+            field.name: getattr(template, field.method)
+            for field in self.fields
+            if field.derived
+        }
+
+    def validate(self, values: Mapping[str, Any], partial: bool = True) -> List[str]:
+        """Check values against the schema.
+
+        Args:
+            values: Field name (or method suffix, or alias) to value.
+            partial: Whether fields may be missing.
+
+        Returns:
+            The errors, empty if the values are valid.
+        """
+        errors = []
+        seen = set()
+        for key, value in values.items():
+            field = self.field(key)
+            if field is None:
+                errors.append(f"未知字段：{key}")
+                continue
+            seen.add(field.name)
+            if value is None:
+                if not field.optional:
+                    errors.append(f"{field.name}不能为空")
+            elif field.literals:
+                if value not in field.literals:
+                    allowed = "、".join(map(str, field.literals))
+                    errors.append(f"{field.name}只能是：{allowed}")
+            elif field.types and not any(
+                isinstance(value, _TYPES.get(t, ())) for t in field.types
+            ):
+                errors.append(f"{field.name}应为：{'/'.join(field.types)}")
+        if not partial:
+            errors.extend(
+                f"缺少字段：{field.name}"
+                for field in self.fields
+                if not field.optional
+                and not field.derived
+                and field.name not in seen
+            )
+        return errors
+
+    def render_help(self, name: Optional[str] = None) -> str:
+        """Render the help text of a field, or of the whole template.
+
+        Args:
+            name: A field name, method suffix or alias; all fields if ``None``.
+
+        Returns:
+            The help text.
+        """
+        if name is not None:
+            field = self.field(name)
+            return "" if field is None else _render_field(field)
+        return "\n".join([self.title, *map(_render_field, self.fields)]).strip()
+
+
+def _render_field(field: FieldSchema) -> str:
+    aliases = f"({'/'.join(field.aliases)})" if field.aliases else ""
+    allowed = f" [{'/'.join(map(str, field.literals))}]" if field.literals else ""
+    return f"{field.name}{aliases}{allowed}: {field.help}"
+
+
+# Normalized lookup keys of each schema, schemas are immutable
+_field_indexes: Dict[Tuple[str, str], Dict[str, FieldSchema]] = {}
+
+
+def _field_index(schema: TemplateSchema) -> Dict[str, FieldSchema]:
+    key = (schema.template, schema.source_hash)
+    index = _field_indexes.get(key)
+    if index is None:
+        index = {}
+        for field in schema.fields:
+            for name in (field.method[2:], field.name, *field.aliases):
+                index.setdefault(normalize_term(name), field)
+        _field_indexes[key] = index
+    return index
+
+
+def _describe(annotation: Any) -> Tuple[Tuple[str, ...], Tuple[Any, ...], bool]:
+    """Types, literals and optionality of a return annotation."""
+    types: List[str] = []
+    literals: List[Any] = []
+    optional = annotation is inspect.Signature.empty
+    pending = [annotation]
+    while pending:
+        current = pending.pop(0)
+        origin = get_origin(current)
+        if current is type(None) or current is None:
+            optional = True
+        elif origin is Union:
+            pending.extend(get_args(current))
+        elif origin is Literal:
+            literals.extend(get_args(current))
+        elif isinstance(current, type):
+            types.append(current.__name__)
+    return tuple(dict.fromkeys(types)), tuple(literals), optional
+
+
+def _has_body(func: Callable[..., Any]) -> bool:
+    """Whether a function does more than return ``None``."""
+    ops = [
+        (instruction.opname, instruction.argval)
+        for instruction in dis.get_instructions(func)
+        if instruction.opname not in ("RESUME", "NOP", "CACHE")
+    ]
+    return ops not in _EMPTY_BODIES
+
+
+def _compile(template: type, source_hash: str) -> TemplateSchema:
+    fields = []
+    notes = []
+    for method, func in vars(template).items():
+        if not inspect.isfunction(func):
+            continue
+        if method.startswith("d_"):
+            notes.append(inspect.cleandoc(func.__doc__ or ""))
+        if not method.startswith("t_"):
+            continue
+        term = parse_term(func.__doc__)
+        name, aliases, text = term or (method[2:], [], (func.__doc__ or "").strip())
+        try:
+            annotation = get_type_hints(func).get("return", inspect.Signature.empty)
+        except Exception:
+            annotation = inspect.Signature.empty
+        types, literals, optional = _describe(annotation)
+        fields.append(
+            FieldSchema(
+                method,
+                name,
+                tuple(aliases),
+                text,
+                types,
+                literals,
+                optional,
+                _has_body(func),
+            )
+        )
+    doc = inspect.cleandoc(template.__doc__ or "")
+    return TemplateSchema(
+        f"{template.__module__}.{template.__qualname__}",
+        source_hash,
+        doc.splitlines()[0] if doc else template.__name__,
+        tuple(fields),
+        tuple(notes),
+    )
+
+
+def _source_hash(template: type) -> str:
+    digest = hashlib.sha256(
+        f"{SCHEMA_VERSION}:{sys.version_info[:2]}:{template.__qualname__}".encode()
+    )
+    try:
+        digest.update(Path(inspect.getfile(template)).read_bytes())
+    except (OSError, TypeError):
+        # Defined interactively, hash the members instead
+        digest.update(repr(sorted(vars(template))).encode())
+    return digest.hexdigest()
+
+
+def _read_cache(path: Path) -> Optional[TemplateSchema]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        fields = tuple(
+            FieldSchema(
+                **{
+                    **field,
+                    "aliases": tuple(field["aliases"]),
+                    "types": tuple(field["types"]),
+                    "literals": tuple(field["literals"]),
+                }
+            )
+            for field in data.pop("fields")
+        )
+        return TemplateSchema(
+            **{**data, "fields": fields, "notes": tuple(data["notes"])}
+        )
+    except FileNotFoundError:
+        return None
+    except (ValueError, TypeError, KeyError) as e:
+        logger.warning(f'Ignoring broken template cache "{path}": {e!r}')
+        return None
+
+
+def _write_cache(path: Path, schema: TemplateSchema) -> None:
+    data = {
+        **schema._asdict(),
+        "fields": [field._asdict() for field in schema.fields],
+    }
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+    except (OSError, TypeError) as e:
+        # Literal values that JSON cannot hold, or a read-only directory
+        logger.warning(f'Cannot cache the schema of "{schema.template}": {e!r}')
+
+
+_schemas: Dict[type, TemplateSchema] = {}
+
+
+def compile_template(
+    template: type, cache_dir: Optional[Union[str, Path]] = CACHE_DIR
+) -> TemplateSchema:
+    """Compile the schema of a template class.
+
+    Args:
+        template: The template class.
+        cache_dir: Directory of the schemas cached on disk, ``None`` to keep
+            them in memory only.
+
+    Returns:
+        The schema.
+    """
+    schema = _schemas.get(template)
+    if schema is not None:
+        return schema
+
+    source_hash = _source_hash(template)
+    path = None
+    if cache_dir is not None:
+        path = Path(cache_dir) / f"{template.__qualname__}-{source_hash[:32]}.json"
+        schema = _read_cache(path)
+    if schema is None or schema.source_hash != source_hash:
+        schema = _compile(template, source_hash)
+        if path is not None:
+            _write_cache(path, schema)
+    _schemas[template] = schema
+    return schema
@@ -0,0 +1,126 @@
+"""Rule book lookup.
+
+Rule books are extracted once, in parallel with ``extract_pdf``, and turned
+into index files with ``build_index`` (``python -m hrc.rule.BaseRule.Wiki
+book.pdf book.wiki`` does both); rules look terms up in the memory-mapped
+indexes without loading the PDF again.
+"""
+
+from pathlib import Path
+from typing import ClassVar, Dict, List, Mapping, Sequence, Tuple, Union
+
+from hrc.log import logger
+
+from .extract import ExtractedPage, extract_pdf, read_extracted
+from .fuzzy import (
+    FuzzyIndex,
+    FuzzyMatch,
+    normalize_term,
+    parse_term,
+    terms_from_template,
+)
+from .index import (
+    WikiHit,
+    WikiIndex,
+    WikiIndexError,
+    build_index,
+    extract_pdf_pages,
+    open_index,
+    tokenize,
+)
+
+__all__ = [
+    "ExtractedPage",
+    "FuzzyIndex",
+    "FuzzyMatch",
+    "Wiki",
+    "WikiHit",
+    "WikiIndex",
+    "WikiIndexError",
+    "build_index",
+    "extract_pdf",
+    "extract_pdf_pages",
+    "normalize_term",
+    "open_index",
+    "parse_term",
+    "read_extracted",
+    "terms_from_template",
+    "tokenize",
+]
+
+
+class Wiki:
+    """The rule books of a rule.
+
+    Subclasses list their index files in ``books``; books whose index has
+    not been built yet are skipped with a warning. The term definitions of
+    the character ``templates`` are looked up with typos tolerated; without
+    any, the words of the books are suggested instead.
+
+    Attributes:
+        books: Book name to index file.
+        templates: Character template classes defining terms in the
+            docstrings of their ``t_*``/``d_*`` methods.
+        indexes: Book name to the opened index.
+        terms: Fuzzy index of the terms of the templates, or of the words
+            of the books if the templates define no terms.
+        definitions: Term to its description.
+    """
+
+    books: ClassVar[Mapping[str, Union[str, Path]]] = {}
+    templates: ClassVar[Sequence[type]] = ()
+
+    indexes: Dict[str, WikiIndex]
+    terms: FuzzyIndex
+    definitions: Dict[str, str]
+
+    def __init__(self) -> None:
+        self.terms = FuzzyIndex()
+        self.definitions = {}
+        for template in self.templates:
+            for name, aliases, text in terms_from_template(template):
+                self.terms.add(name, aliases)
+                self.definitions.setdefault(name, text)
+        self.indexes = {}
+        for name, path in self.books.items():
+            index = open_index(path)
+            if index is None:
+                logger.warning(f'Wiki index of "{name}" not found at "{path}"')
+            else:
+                self.indexes[name] = index
+        if not len(self.terms):
+            for index in self.indexes.values():
+                for term in index.terms():
+                    # Single CJK characters match too much to be suggested
+                    if len(term) > 1:
+                        self.terms.add(term)
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[str, WikiHit]]:
+        """Search all books.
+
+        Args:
+            query: The query.
+            limit: The maximum number of hits.
+
+        Returns:
+            Book name and hit, the best hits first.
+        """
+        hits = [
+            (name, hit)
+            for name, index in self.indexes.items()
+            for hit in index.search(query, limit)
+        ]
+        hits.sort(key=lambda item: -item[1].score)
+        return hits[:limit]
+
+    def suggest(self, query: str, limit: int = 5) -> List[FuzzyMatch]:
+        """Find the terms closest to a possibly misspelled query.
+
+        Args:
+            query: The query, such as ``力亮`` or ``dex``.
+            limit: The maximum number of terms.
+
+        Returns:
+            The closest terms first.
+        """
+        return self.terms.lookup(query, limit)
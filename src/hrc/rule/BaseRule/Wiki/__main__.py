@@ -0,0 +1,28 @@
+"""Build the Wiki index of a rule book: ``python -m hrc.rule.BaseRule.Wiki``."""
+
+import argparse
+
+from .extract import extract_pdf, read_extracted
+from .index import build_index
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the Wiki index of a rule book")
+    parser.add_argument("pdf", help="the rule book")
+    parser.add_argument("index", help="the index file to write")
+    parser.add_argument(
+        "-w", "--workers", type=int, help="number of worker processes to extract with"
+    )
+    args = parser.parse_args()
+
+    # Pages are kept next to the index, an interrupted build resumes from them
+    pages = args.index + ".pages"
+    extract_pdf(args.pdf, pages, workers=args.workers)
+    build_index(
+        ((page.number, page.text) for page in read_extracted(pages)), args.index
+    )
+
+
+# Worker processes import this module again, they must not run it
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Parallel extraction of rule book pages.
+
+Page ranges are extracted in worker processes and the pages are written to a
+JSON Lines file in page order as soon as they are ready, so memory holds only
+the ranges in flight. The first line describes the source, every other line
+is a page::
+
+    {"source": "BRP SRD 1.0 CHN.pdf", "pages": 240}
+    {"page": 1, "text": "...", "boxes": [[x0, y0, x1, y1, "..."], ...]}
+
+An interrupted extraction resumes after the last complete page.
+"""
+
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import (
+    IO,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from hrc.log import logger
+
+__all__ = [
+    "ExtractedPage",
+    "count_pdf_pages",
+    "extract_page_range",
+    "extract_pdf",
+    "read_extracted",
+]
+
+Box = Tuple[float, float, float, float, str]
+
+
+class ExtractedPage(NamedTuple):
+    """The content of a page.
+
+    Attributes:
+        number: The page number, starting at 1.
+        text: The text of the page.
+        boxes: The bounding box ``(x0, y0, x1, y1)`` and text of each text
+            block, in PDF units from the bottom left corner.
+    """
+
+    number: int
+    text: str
+    boxes: List[Box]
+
+
+def _import_pdfminer() -> None:
+    try:
+        import pdfminer  # noqa: F401
+    except ImportError:
+        logger.warning('Wiki index needs "pdfquery", try "pip install pdfquery"')
+        raise
+
+
+def count_pdf_pages(path: Union[str, Path]) -> int:
+    """Count the pages of a PDF file without parsing their content."""
+    _import_pdfminer()
+    from pdfminer.pdfpage import PDFPage
+
+    with Path(path).open("rb") as f:
+        return sum(1 for _ in PDFPage.get_pages(f))
+
+
+def extract_page_range(
+    path: Union[str, Path], start: int, end: int
+) -> List[ExtractedPage]:
+    """Extract the pages from ``start`` to ``end`` (excluded), counted from 0.
+
+    This runs in the worker processes of ``extract_pdf``.
+    """
+    _import_pdfminer()
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTTextContainer
+
+    pages = []
+    for number, layout in enumerate(
+        extract_pages(path, page_numbers=range(start, end)), start=start + 1
+    ):
+        boxes: List[Box] = [
+            (*element.bbox, element.get_text())
+            for element in layout
+            if isinstance(element, LTTextContainer)
+        ]
+        pages.append(
+            ExtractedPage(number, "".join(box[4] for box in boxes), boxes)
+        )
+    return pages
+
+
+def _resume(output: Path, source: str, page_count: int) -> Tuple[IO[str], int]:
+    """Open the output for appending, return it and the pages already there."""
+    header = {"source": source, "pages": page_count}
+    if output.exists():
+        with output.open("r+b") as f:
+            done = 0
+            valid = 0
+            for i, line in enumerate(iter(f.readline, b"")):
+                try:
+                    record = json.loads(line) if line.endswith(b"\n") else None
+                except ValueError:
+                    record = None
+                if record is None:
+                    break
+                if i == 0:
+                    if record != header:
+                        break
+                elif not done < record.get("page", 0) <= page_count:
+                    break
+                else:
+                    done = record["page"]
+                valid = f.tell()
+            if valid:
+                # Drop a page left half-written
+                f.truncate(valid)
+        if valid:
+            logger.info(f"Resuming extraction of {source} after page {done}")
+            return output.open("a", encoding="utf-8", newline="\n"), done
+    f = output.open("w", encoding="utf-8", newline="\n")
+    f.write(json.dumps(header, ensure_ascii=False) + "\n")
+    return f, 0
+
+
+def extract_pdf(
+    path: Union[str, Path],
+    output: Union[str, Path],
+    *,
+    workers: Optional[int] = None,
+    chunk_size: int = 8,
+    extractor: Callable[
+        [Union[str, Path], int, int], List[ExtractedPage]
+    ] = extract_page_range,
+    page_count: Optional[int] = None,
+) -> int:
+    """Extract all pages of a PDF file into a JSON Lines file.
+
+    Args:
+        path: The PDF file.
+        output: The JSON Lines file, extraction resumes if it is incomplete.
+        workers: Number of worker processes, the number of CPUs by default.
+        chunk_size: Number of pages extracted by a worker at once.
+        extractor: Extracts a range of pages in a worker, it must be a
+            module-level function.
+        page_count: The number of pages, counted if not given.
+
+    Returns:
+        The number of pages extracted by this call.
+    """
+    path = Path(path)
+    output = Path(output)
+    if page_count is None:
+        page_count = count_pdf_pages(path)
+    workers = workers or os.cpu_count() or 1
+    f, done = _resume(output, path.name, page_count)
+    first = done
+    # Ranges are keyed by their first page, counted from 0
+    ranges = iter(range(done, page_count, chunk_size))
+    ready: Dict[int, List[ExtractedPage]] = {}
+
+    with f, ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight: Set["Future[List[ExtractedPage]]"] = set()
+        starts: Dict["Future[List[ExtractedPage]]", int] = {}
+
+        def submit() -> None:
+            # At most two ranges per worker are in flight or waiting
+            while len(in_flight) + len(ready) < 2 * workers:
+                start = next(ranges, None)
+                if start is None:
+                    return
+                future = executor.submit(
+                    extractor, path, start, min(start + chunk_size, page_count)
+                )
+                in_flight.add(future)
+                starts[future] = start
+
+        try:
+            submit()
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    in_flight.remove(future)
+                    ready[starts.pop(future)] = future.result()
+                while done in ready:
+                    for page in ready.pop(done):
+                        record = {
+                            "page": page.number,
+                            "text": page.text,
+                            "boxes": page.boxes,
+                        }
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    done = min(done + chunk_size, page_count)
+                f.flush()
+                logger.debug(f"Extracted {done}/{page_count} pages of {path.name}")
+                submit()
+        except BaseException:
+            executor.shutdown(cancel_futures=True)
+            raise
+
+    logger.info(f"Extracted {done - first} pages of {path.name}")
+    return done - first
+
+
+def read_extracted(output: Union[str, Path]) -> Iterator[ExtractedPage]:
+    """Read the pages of a JSON Lines file written by ``extract_pdf``."""
+    with Path(output).open(encoding="utf-8") as f:
+        next(f, None)
+        for line in f:
+            record = json.loads(line)
+            yield ExtractedPage(
+                record["page"],
+                record["text"],
+                [tuple(box) for box in record["boxes"]],  # type: ignore[misc]
+            )
@@ -0,0 +1,237 @@
+"""Typo-tolerant lookup of rule terms.
+
+Terms and their aliases are normalized (NFKC, case folding, punctuation and
+spaces dropped) and split into bigrams padded with ``^`` and ``$``. A query
+collects candidates from the posting lists of its bigrams, ranks them by
+bigram overlap and only the best ones are compared by edit distance, so a
+lookup touches a few short lists instead of every term.
+
+Latin words of a query that are an alias of a term are also replaced by the
+term, so ``dex检定`` finds ``敏捷检定`` when ``DEX`` is an alias of ``敏捷``.
+"""
+
+import re
+import unicodedata
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+__all__ = [
+    "FuzzyIndex",
+    "FuzzyMatch",
+    "edit_distance",
+    "normalize_term",
+    "parse_term",
+    "terms_from_template",
+]
+
+_LATIN_WORD = re.compile(r"[a-z0-9]+")
+# "力量(STR): ...", "急救（30%或智力×1）：..." or "艺术（各类）（05%）：..."
+_DEFINITION = re.compile(
+    r"\s*(?P<name>[^:：(（\n]+?)\s*"
+    r"(?P<groups>(?:[(（][^)）]*[)）]\s*)*)[:：]\s*(?P<text>.*)",
+    re.DOTALL,
+)
+_GROUP = re.compile(r"[(（]([^)）]*)[)）]")
+_ALIAS = re.compile(r"[A-Za-z][A-Za-z0-9 ]*")
+
+
+class FuzzyMatch(NamedTuple):
+    """A term similar to a query.
+
+    Attributes:
+        term: The term.
+        key: The normalized name or alias of the term that matched.
+        score: The similarity, 1 for an exact match.
+    """
+
+    term: str
+    key: str
+    score: float
+
+
+def normalize_term(text: str) -> str:
+    """Normalize a term, so that width, case and punctuation do not matter."""
+    return "".join(
+        c for c in unicodedata.normalize("NFKC", text).casefold() if c.isalnum()
+    )
+
+
+def _grams(key: str) -> List[str]:
+    padded = f"^{key}$"
+    return [padded[i : i + 2] for i in range(len(padded) - 1)]
+
+
+def edit_distance(a: str, b: str, limit: Optional[int] = None) -> int:
+    """The Levenshtein distance between two strings.
+
+    Args:
+        a: A string.
+        b: Another string.
+        limit: Stop once the distance is known to exceed it and return
+            ``limit + 1``.
+
+    Returns:
+        The distance.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, x in enumerate(a, start=1):
+        current = [i]
+        for j, y in enumerate(b, start=1):
+            current.append(
+                min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (x != y))
+            )
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class FuzzyIndex:
+    """Bigram index of terms and their aliases."""
+
+    def __init__(self) -> None:
+        self._keys: List[str] = []
+        self._terms: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._postings: Dict[str, List[int]] = {}
+        self._aliases: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(set(self._terms))
+
+    def __contains__(self, text: str) -> bool:
+        return normalize_term(text) in self._ids
+
+    def add(self, term: str, aliases: Iterable[str] = ()) -> None:
+        """Add a term.
+
+        Args:
+            term: The term, returned by lookups.
+            aliases: Other names of the term, such as an abbreviation.
+        """
+        for n, name in enumerate((term, *aliases)):
+            key = normalize_term(name)
+            if not key or key in self._ids:
+                continue
+            self._ids[key] = len(self._keys)
+            for gram in set(_grams(key)):
+                self._postings.setdefault(gram, []).append(len(self._keys))
+            self._keys.append(key)
+            self._terms.append(term)
+            if n and _LATIN_WORD.fullmatch(key):
+                self._aliases[key] = normalize_term(term)
+
+    def _variants(self, key: str) -> List[str]:
+        expanded = _LATIN_WORD.sub(
+            lambda m: self._aliases.get(m.group(), m.group()), key
+        )
+        return [key] if expanded == key else [key, expanded]
+
+    def lookup(
+        self,
+        query: str,
+        limit: int = 5,
+        min_score: float = 0.4,
+        candidates: int = 32,
+    ) -> List[FuzzyMatch]:
+        """Find the terms most similar to a query.
+
+        Args:
+            query: The query.
+            limit: The maximum number of terms.
+            min_score: The lowest similarity returned, the similarity is one
+                minus the edit distance over the length of the longer key.
+            candidates: Number of keys sharing the most bigrams with the
+                query that are compared by edit distance.
+
+        Returns:
+            The most similar terms first, each term once.
+        """
+        best: Dict[str, FuzzyMatch] = {}
+        for key in self._variants(normalize_term(query)):
+            for match in self._lookup(key, min_score, candidates):
+                if match.term not in best or best[match.term].score < match.score:
+                    best[match.term] = match
+        return sorted(best.values(), key=lambda m: (-m.score, len(m.key)))[:limit]
+
+    def _lookup(
+        self, key: str, min_score: float, candidates: int
+    ) -> List[FuzzyMatch]:
+        if not key:
+            return []
+        exact = self._ids.get(key)
+        if exact is not None:
+            return [FuzzyMatch(self._terms[exact], key, 1.0)]
+
+        grams = set(_grams(key))
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for i in self._postings.get(gram, ()):
+                shared[i] = shared.get(i, 0) + 1
+        # Dice coefficient of the bigram sets
+        ranked: Sequence[Tuple[float, int]] = sorted(
+            (
+                (-2 * count / (len(grams) + len(self._keys[i]) + 1), i)
+                for i, count in shared.items()
+            )
+        )[:candidates]
+
+        matches = []
+        for _, i in ranked:
+            other = self._keys[i]
+            longest = max(len(key), len(other))
+            limit = int(longest * (1 - min_score))
+            distance = edit_distance(key, other, limit)
+            score = 1 - distance / longest
+            if score >= min_score:
+                matches.append(FuzzyMatch(self._terms[i], other, score))
+        return matches
+
+
+def parse_term(doc: Optional[str]) -> Optional[Tuple[str, List[str], str]]:
+    """Parse a term definition such as ``力量(STR): 力量就是...``.
+
+    Args:
+        doc: The docstring.
+
+    Returns:
+        The name, the aliases (Latin abbreviations in parentheses) and the
+        description, ``None`` if the docstring is not a definition.
+    """
+    if not doc:
+        return None
+    match = _DEFINITION.match(doc)
+    if match is None:
+        return None
+    aliases = [
+        alias.strip()
+        for group in _GROUP.findall(match.group("groups"))
+        for alias in re.split(r"[,，/、]", group)
+        if _ALIAS.fullmatch(alias.strip())
+    ]
+    return match.group("name"), aliases, " ".join(match.group("text").split())
+
+
+def terms_from_template(
+    template: type, prefixes: Sequence[str] = ("t_", "d_")
+) -> List[Tuple[str, List[str], str]]:
+    """Collect the term definitions of a character template.
+
+    Args:
+        template: A template class whose ``t_*``/``d_*`` methods have
+            definitions as docstrings.
+        prefixes: Prefixes of the methods to read.
+
+    Returns:
+        The name, aliases and description of each term.
+    """
+    terms = []
+    for name, method in vars(template).items():
+        if name.startswith(tuple(prefixes)):
+            term = parse_term(getattr(method, "__doc__", None))
+            if term is not None:
+                terms.append(term)
+    return terms
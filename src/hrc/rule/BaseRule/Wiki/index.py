@@ -0,0 +1,456 @@
+"""Inverted index of rule books, built once and memory-mapped at runtime.
+
+Text is normalized with NFKC and case folding, so full-width and half-width
+forms match. Latin letters and digits form word tokens; CJK characters are
+indexed one by one and as overlapping bigrams, a query uses bigrams when it
+has two or more CJK characters in a row.
+
+The index file holds, little-endian and 8-byte aligned::
+
+    header      magic "HRCW", u16 version, u16 reserved, u32 terms,
+                u32 pages, u64 offset of each section below
+    terms       u32 start of each term in the term blob, UTF-8 term blob
+                (terms sorted by their UTF-8 bytes)
+    postings    u32 start of the postings of each term, then
+                (u32 page, u32 character position) pairs sorted by page
+    pages       u32 page number of each page, u32 start of each page in the
+                text blob, UTF-8 text blob
+"""
+
+import math
+import mmap
+import os
+import struct
+import sys
+import unicodedata
+from array import array
+from functools import lru_cache
+from pathlib import Path
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+from hrc.exceptions import CoreException
+from hrc.log import logger
+
+__all__ = [
+    "WikiHit",
+    "WikiIndex",
+    "WikiIndexError",
+    "build_index",
+    "extract_pdf_pages",
+    "open_index",
+    "tokenize",
+]
+
+INDEX_VERSION = 1
+
+_MAGIC = b"HRCW"
+_SECTIONS = (
+    "term_starts",
+    "term_blob",
+    "posting_starts",
+    "postings",
+    "page_numbers",
+    "page_starts",
+    "page_blob",
+)
+_HEADER = struct.Struct("<4sHHII" + "Q" * len(_SECTIONS))
+
+
+class WikiIndexError(CoreException):
+    """The file is not a Wiki index or is broken."""
+
+
+@lru_cache(maxsize=4096)
+def _normalize_char(char: str) -> str:
+    return unicodedata.normalize("NFKC", char).casefold()
+
+
+def _is_cjk(char: str) -> bool:
+    code = ord(char)
+    return (
+        0x3040 <= code <= 0x30FF  # Kana
+        or 0x3400 <= code <= 0x4DBF  # CJK extension A
+        or 0x4E00 <= code <= 0x9FFF  # CJK unified ideographs
+        or 0xAC00 <= code <= 0xD7AF  # Hangul syllables
+        or 0xF900 <= code <= 0xFAFF  # CJK compatibility ideographs
+        or 0x20000 <= code <= 0x3FFFF  # CJK extensions B and later
+    )
+
+
+def tokenize(text: str, unigrams: bool = True) -> Iterator[Tuple[str, int]]:
+    """Split text into index terms.
+
+    Args:
+        text: The text.
+        unigrams: Whether to yield every CJK character on its own as well.
+            If not, only CJK characters without a CJK neighbour are.
+
+    Yields:
+        The normalized term and its character position in ``text``.
+    """
+    word: List[str] = []
+    word_start = 0
+    previous: Optional[Tuple[str, int]] = None
+    run = 0
+    for position, char in enumerate(text):
+        for c in _normalize_char(char):
+            if _is_cjk(c):
+                if word:
+                    yield "".join(word), word_start
+                    word = []
+                if previous is not None:
+                    yield previous[0] + c, previous[1]
+                if unigrams:
+                    yield c, position
+                previous = (c, position)
+                run += 1
+                continue
+            if not unigrams and run == 1 and previous is not None:
+                yield previous
+            previous = None
+            run = 0
+            if c.isalnum():
+                if not word:
+                    word_start = position
+                word.append(c)
+            elif word:
+                yield "".join(word), word_start
+                word = []
+    if word:
+        yield "".join(word), word_start
+    if not unigrams and run == 1 and previous is not None:
+        yield previous
+
+
+def _section(data: bytes) -> bytes:
+    return data + bytes(-len(data) % 8)
+
+
+def _u32(values: Iterable[int]) -> bytes:
+    data = array("I", values)
+    if sys.byteorder == "big":  # pragma: no cover
+        data.byteswap()
+    return data.tobytes()
+
+
+def build_index(
+    pages: Iterable[Tuple[int, str]], path: Union[str, Path]
+) -> Tuple[int, int]:
+    """Build an index file from the text of pages.
+
+    The file is written next to ``path`` and renamed over it once complete.
+
+    Args:
+        pages: Page number and text of each page.
+        path: The index file.
+
+    Returns:
+        The number of pages and of distinct terms.
+    """
+    path = Path(path)
+    postings: Dict[str, List[int]] = {}
+    page_numbers: List[int] = []
+    texts: List[bytes] = []
+    for index, (number, text) in enumerate(pages):
+        page_numbers.append(number)
+        texts.append(text.encode())
+        for term, position in tokenize(text):
+            postings.setdefault(term, []).extend((index, position))
+
+    encoded = sorted((term.encode(), term) for term in postings)
+    term_starts = [0]
+    posting_starts = [0]
+    for term_bytes, term in encoded:
+        term_starts.append(term_starts[-1] + len(term_bytes))
+        posting_starts.append(posting_starts[-1] + len(postings[term]) // 2)
+    page_starts = [0]
+    for text in texts:
+        page_starts.append(page_starts[-1] + len(text))
+    if max(term_starts[-1], page_starts[-1], 2 * posting_starts[-1]) >= 1 << 32:
+        raise WikiIndexError("the rule book is too large to be indexed")
+
+    sections = [
+        _section(_u32(term_starts)),
+        _section(b"".join(term_bytes for term_bytes, _ in encoded)),
+        _section(_u32(posting_starts)),
+        _section(b"".join(_u32(postings[term]) for _, term in encoded)),
+        _section(_u32(page_numbers)),
+        _section(_u32(page_starts)),
+        _section(b"".join(texts)),
+    ]
+    offsets = []
+    offset = _HEADER.size + -_HEADER.size % 8
+    for section in sections:
+        offsets.append(offset)
+        offset += len(section)
+    header = _HEADER.pack(
+        _MAGIC, INDEX_VERSION, 0, len(encoded), len(page_numbers), *offsets
+    )
+
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(_section(header))
+        for section in sections:
+            f.write(section)
+    os.replace(tmp, path)
+    logger.info(f"Indexed {len(page_numbers)} pages and {len(encoded)} terms")
+    return len(page_numbers), len(encoded)
+
+
+def extract_pdf_pages(path: Union[str, Path]) -> Iterator[Tuple[int, str]]:
+    """Extract the text of every page of a PDF file.
+
+    Args:
+        path: The PDF file.
+
+    Yields:
+        The page number, starting at 1, and the text of the page.
+
+    Raises:
+        ImportError: pdfminer, installed with pdfquery, is missing.
+    """
+    try:
+        from pdfminer.high_level import extract_pages
+        from pdfminer.layout import LTTextContainer
+    except ImportError:
+        logger.warning('Wiki index needs "pdfquery", try "pip install pdfquery"')
+        raise
+
+    for number, layout in enumerate(extract_pages(path), start=1):
+        yield number, "".join(
+            element.get_text()
+            for element in layout
+            if isinstance(element, LTTextContainer)
+        )
+
+
+class WikiHit(NamedTuple):
+    """A page matching a query.
+
+    Attributes:
+        page: The page number.
+        score: The relevance, higher is better.
+        position: Character position of the best match in the page text.
+        snippet: The text around the match.
+    """
+
+    page: int
+    score: float
+    position: int
+    snippet: str
+
+
+class WikiIndex:
+    """A memory-mapped index file.
+
+    Terms are found by binary search in the mapping and postings are read in
+    place, so opening an index costs nothing but the mapping.
+
+    Attributes:
+        path: The index file.
+        term_count: The number of distinct terms.
+        page_count: The number of pages.
+    """
+
+    path: Path
+    term_count: int
+    page_count: int
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                raise WikiIndexError(f"{self.path} is not a Wiki index")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, version, _, self.term_count, self.page_count, *offsets = (
+            _HEADER.unpack_from(view)
+        )
+        if magic != _MAGIC:
+            raise WikiIndexError(f"{self.path} is not a Wiki index")
+        if version > INDEX_VERSION:
+            raise WikiIndexError(
+                f"{self.path} has version {version}, "
+                f"only {INDEX_VERSION} is supported"
+            )
+        lengths = {
+            "term_starts": 4 * (self.term_count + 1),
+            "posting_starts": 4 * (self.term_count + 1),
+            "page_numbers": 4 * self.page_count,
+            "page_starts": 4 * (self.page_count + 1),
+        }
+        ends = [*offsets[1:], size]
+        sections = {}
+        for name, start, end in zip(_SECTIONS, offsets, ends):
+            if not start <= end <= size:
+                raise WikiIndexError(f"{self.path} is truncated")
+            sections[name] = view[start : start + lengths.get(name, end - start)]
+
+        self._term_starts = self._array(sections["term_starts"])
+        self._term_blob = sections["term_blob"]
+        self._posting_starts = self._array(sections["posting_starts"])
+        self._postings = self._array(
+            sections["postings"][: 8 * self._posting_starts[-1]]
+        )
+        self._page_numbers = self._array(sections["page_numbers"])
+        self._page_starts = self._array(sections["page_starts"])
+        self._page_blob = sections["page_blob"]
+
+    @staticmethod
+    def _array(view: memoryview) -> Sequence[int]:
+        if sys.byteorder == "big":  # pragma: no cover
+            data = array("I", view.tobytes())
+            data.byteswap()
+            return data
+        return view.cast("I")
+
+    def __len__(self) -> int:
+        return self.term_count
+
+    def __contains__(self, term: str) -> bool:
+        return self._find(term.encode()) is not None
+
+    def _term(self, i: int) -> bytes:
+        return bytes(self._term_blob[self._term_starts[i] : self._term_starts[i + 1]])
+
+    def _find(self, term: bytes) -> Optional[int]:
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < term:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.term_count and self._term(low) == term:
+            return low
+        return None
+
+    def terms(self) -> Iterator[str]:
+        """All terms, in UTF-8 byte order."""
+        return (self._term(i).decode() for i in range(self.term_count))
+
+    def postings(self, term: str) -> Dict[int, List[int]]:
+        """Where a term occurs.
+
+        Args:
+            term: A normalized term, as yielded by ``tokenize``.
+
+        Returns:
+            Page index to the character positions of the term in the page.
+        """
+        i = self._find(term.encode())
+        if i is None:
+            return {}
+        pages: Dict[int, List[int]] = {}
+        start, end = self._posting_starts[i], self._posting_starts[i + 1]
+        pairs = self._postings[2 * start : 2 * end]
+        for j in range(0, len(pairs), 2):
+            pages.setdefault(pairs[j], []).append(pairs[j + 1])
+        return pages
+
+    def page_number(self, page: int) -> int:
+        """The number of the page at an index."""
+        return self._page_numbers[page]
+
+    def page_text(self, page: int) -> str:
+        """The text of the page at an index."""
+        start, end = self._page_starts[page], self._page_starts[page + 1]
+        return bytes(self._page_blob[start:end]).decode()
+
+    def search(
+        self, query: str, limit: int = 5, context: int = 40
+    ) -> List[WikiHit]:
+        """Find the pages containing every term of a query.
+
+        Pages are ranked by TF-IDF, with a large bonus for each place where
+        the terms follow each other as in the query.
+
+        Args:
+            query: The query, such as ``力量`` or ``dex检定``.
+            limit: The maximum number of hits.
+            context: Characters of text around the match in snippets.
+
+        Returns:
+            The best hits first.
+        """
+        tokens = list(tokenize(query, unigrams=False))
+        if not tokens:
+            return []
+        found = [(self.postings(term), position) for term, position in tokens]
+        pages: Set[int] = set(found[0][0])
+        for postings, _ in found[1:]:
+            pages.intersection_update(postings)
+        if not pages:
+            return []
+
+        hits = []
+        first, offset = found[0]
+        for page in pages:
+            score = sum(
+                len(postings[page]) * math.log(1 + self.page_count / len(postings))
+                for postings, _ in found
+            )
+            rest = [
+                (set(postings[page]), position - offset)
+                for postings, position in found[1:]
+            ]
+            phrases = [
+                x
+                for x in first[page]
+                if all(x + delta in positions for positions, delta in rest)
+            ]
+            score += 100 * len(phrases)
+            position = phrases[0] if phrases else first[page][0]
+            text = self.page_text(page)
+            snippet = " ".join(
+                text[max(position - context, 0) : position + context].split()
+            )
+            hits.append(WikiHit(self.page_number(page), score, position, snippet))
+        hits.sort(key=lambda hit: (-hit.score, hit.page))
+        return hits[:limit]
+
+    def close(self) -> None:
+        """Unmap the index file."""
+        for name in (
+            "_term_starts",
+            "_posting_starts",
+            "_postings",
+            "_page_numbers",
+            "_page_starts",
+        ):
+            data = getattr(self, name)
+            if isinstance(data, memoryview):
+                data.release()
+        self._term_blob.release()
+        self._page_blob.release()
+        try:
+            self._mmap.close()
+        except BufferError:  # pragma: no cover
+            # A view is still in use, the mapping goes away with it
+            pass
+
+    def __enter__(self) -> "WikiIndex":
+        return self
+
+    def __exit__(self, *_args: object) -> None:
+        self.close()
+
+
+def open_index(path: Union[str, Path]) -> Optional[WikiIndex]:
+    """Open an index file, ``None`` if it does not exist."""
+    try:
+        return WikiIndex(path)
+    except FileNotFoundError:
+        return None
@@ -1,3 +1,5 @@
 from . import CharacterCard  # noqa: F401
+from . import CardStore  # noqa: F401
 from . import CustomRule  # noqa: F401
+from . import Template  # noqa: F401
 from . import Wiki  # noqa: F401
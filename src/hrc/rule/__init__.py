@@ -1,7 +1,7 @@
 import functools  # noqa: F401
 from typing import Generic, Any, Type
 
-from abc import ABC
+from abc import ABC, ABCMeta
 
 from hrc.rule import BaseRule  # noqa: F401
 from hrc.typing import RuleT  # noqa: F401
@@ -25,6 +25,7 @@ from hrc.config import ConfigModel
 from hrc.dependencies import Depends
 from hrc.event import Event
 from hrc.exceptions import SkipException, StopException
+from hrc.rule.aliases import AliasMeta
 from hrc.typing import ConfigT, EventT, StateT
 from hrc.utils import is_config_class
 
@@ -41,7 +42,11 @@ class RuleLoadType(Enum):
     CLASS = "class"
 
 
-class Rule(ABC, Generic[EventT, StateT, ConfigT]):
+class _RuleMeta(AliasMeta, ABCMeta):
+    pass
+
+
+class Rule(ABC, Generic[EventT, StateT, ConfigT], metaclass=_RuleMeta):
     priority: ClassVar[int] = 0
     block: ClassVar[bool] = False
 
@@ -105,7 +110,7 @@ class Rule(ABC, Generic[EventT, StateT, ConfigT]):
     @property
     def core(self) -> "Core":
         """core object."""
-        return self.event.core  # pylint: disable=no-member
+        return self.event.service.core  # pylint: disable=no-member
 
     @final
     @property
@@ -134,7 +139,7 @@ class Rule(ABC, Generic[EventT, StateT, ConfigT]):
     @property
     def state(self) -> StateT:
         """rule status."""
-        return self.core.rule_state[self.name]
+        return self.core.rule_state.get(self.name)
 
     @state.setter
     @final
@@ -148,12 +153,35 @@ class Rule(ABC, Generic[EventT, StateT, ConfigT]):
     @staticmethod
     def aliases(names, ignore_case=False):
         def decorator(func):
+            # Redefinitions in the class body are marked by AliasMeta
             func._aliases = names
             func._ignore_case = ignore_case
             return func
 
         return decorator
 
+    @staticmethod
+    def command(name, ignore_case=False):
+        """Mark a method as the handler of a command.
+
+        Messages starting with a command prefix and the command name, or one
+        of the names given to ``Rule.aliases``, are routed by the core to this
+        method only. The method is called with the rest of the message. Other
+        events are still offered to ``rule`` and ``handle`` of the rule if it
+        defines them.
+
+        Args:
+            name: The command name, without the prefix.
+            ignore_case: Whether to match the command case-insensitively.
+        """
+
+        def decorator(func):
+            func._command = name
+            func._command_ignore_case = ignore_case
+            return func
+
+        return decorator
+
     @final
     async def safe_run(self) -> None:
         try:
@@ -0,0 +1,200 @@
+"""Alias index of the methods decorated with ``Rule.aliases``."""
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Type
+
+from hrc.dependencies import get_injection_plan
+from hrc.event import Event
+from hrc.log import logger
+
+__all__ = [
+    "AliasMeta",
+    "AliasTarget",
+    "AliasCollision",
+    "AliasIndex",
+    "get_aliased_methods",
+]
+
+
+class _AliasNamespace(Dict[str, Any]):
+    """Class body namespace marking the aliased methods defined twice."""
+
+    def __setitem__(self, name: str, value: Any) -> None:
+        previous = self.get(name)
+        if (
+            getattr(previous, "_aliases", None) is not None
+            and getattr(value, "_aliases", None) is not None
+        ):
+            value._redefines = previous  # noqa: SLF001
+        super().__setitem__(name, value)
+
+
+class AliasMeta(type):
+    """Metaclass of the classes defining methods with ``Rule.aliases``.
+
+    A method redefined in the same class body silently replaces the first
+    definition; ``AliasIndex`` reports it as a collision.
+    """
+
+    @classmethod
+    def __prepare__(  # type: ignore[override]
+        mcs, name: str, bases: Tuple[type, ...], **kwargs: Any
+    ) -> Dict[str, Any]:
+        return _AliasNamespace()
+
+
+class AliasTarget(NamedTuple):
+    """The method an alias resolves to.
+
+    Attributes:
+        owner: The class that has the method.
+        name: The name of the method.
+    """
+
+    owner: type
+    name: str
+
+
+class AliasCollision(NamedTuple):
+    """An alias claimed by more than one method.
+
+    Attributes:
+        alias: The alias, case-folded if it ignores case.
+        targets: The methods claiming the alias, the first one wins.
+    """
+
+    alias: str
+    targets: Tuple[AliasTarget, ...]
+
+
+def get_aliased_methods(owner: type) -> Dict[str, Callable[..., Any]]:
+    """Get the methods of a class decorated with ``Rule.aliases``.
+
+    Args:
+        owner: The class to look into.
+
+    Returns:
+        Method name to method, inherited methods included.
+    """
+    methods: Dict[str, Callable[..., Any]] = {}
+    for klass in reversed(owner.__mro__):
+        for name, value in vars(klass).items():
+            if getattr(value, "_aliases", None) is not None:
+                methods[name] = value
+            else:
+                methods.pop(name, None)
+    return methods
+
+
+class AliasIndex:
+    """Lookup table from aliases to methods across all loaded rules.
+
+    The methods decorated with ``Rule.aliases`` on a rule class and on the
+    classes it depends on are indexed under their name and their aliases.
+    Names declared with ``ignore_case=True`` are indexed case-folded.
+    Resolving a name is one or two dictionary lookups.
+
+    The index is updated rule by rule, so reloading one rule does not rebuild
+    the entries of the others.
+    """
+
+    def __init__(self) -> None:
+        # Every key keeps the claims of all rules in load order, the first
+        # claim is the one that resolves
+        self._exact: Dict[str, List[Tuple[type, AliasTarget]]] = {}
+        self._casefold: Dict[str, List[Tuple[type, AliasTarget]]] = {}
+        self._rule_keys: Dict[type, List[Tuple[bool, str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._exact) + len(self._casefold)
+
+    def __contains__(self, name: str) -> bool:
+        return self.lookup(name) is not None
+
+    def lookup(self, name: str) -> Optional[AliasTarget]:
+        """Resolve a name or alias.
+
+        Args:
+            name: The name as typed by the user.
+
+        Returns:
+            The method the name resolves to, ``None`` if it is unknown.
+        """
+        claims = self._exact.get(name) or self._casefold.get(name.casefold())
+        return claims[0][1] if claims else None
+
+    def add_rule(self, rule_class: Type[Any]) -> List[AliasCollision]:
+        """Index the aliased methods of a rule and its dependency classes.
+
+        Args:
+            rule_class: The rule class.
+
+        Returns:
+            Aliases that are now claimed by more than one method.
+        """
+        self.remove_rule(rule_class)
+        keys: List[Tuple[bool, str]] = []
+        collisions: List[AliasCollision] = []
+        for owner in self._get_owners(rule_class):
+            for name, method in get_aliased_methods(owner).items():
+                target = AliasTarget(owner, name)
+                redefined = getattr(method, "_redefines", None)
+                if redefined is not None:
+                    # The class body defines the aliased method twice, the
+                    # first definition is silently replaced
+                    collisions.append(AliasCollision(name, (target, target)))
+                ignore_case = bool(getattr(method, "_ignore_case", False))
+                for alias in (name, *method._aliases):  # noqa: SLF001
+                    key = alias.casefold() if ignore_case else alias
+                    table = self._casefold if ignore_case else self._exact
+                    claims = table.setdefault(key, [])
+                    if any(x == (rule_class, target) for x in claims):
+                        continue
+                    claims.append((rule_class, target))
+                    keys.append((ignore_case, key))
+                    targets = tuple(dict.fromkeys(x[1] for x in claims))
+                    if len(targets) > 1:
+                        collisions.append(AliasCollision(key, targets))
+        self._rule_keys[rule_class] = keys
+        for collision in collisions:
+            logger.warning(
+                f'Alias "{collision.alias}" is claimed by more than one method: '
+                + ", ".join(f"{x.owner.__qualname__}.{x.name}" for x in collision.targets)
+            )
+        return collisions
+
+    def remove_rule(self, rule_class: Type[Any]) -> None:
+        """Remove the entries added for a rule.
+
+        Args:
+            rule_class: The rule class.
+        """
+        for ignore_case, key in self._rule_keys.pop(rule_class, ()):
+            table = self._casefold if ignore_case else self._exact
+            claims = [x for x in table.get(key, ()) if x[0] is not rule_class]
+            if claims:
+                table[key] = claims
+            else:
+                table.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        self._exact.clear()
+        self._casefold.clear()
+        self._rule_keys.clear()
+
+    @staticmethod
+    def _get_owners(rule_class: Type[Any]) -> List[type]:
+        """The rule class and the classes it depends on."""
+        owners = [rule_class]
+        try:
+            attributes = get_injection_plan(rule_class).attributes
+        except TypeError:
+            return owners
+        for _, dependency, _, _ in attributes:
+            if (
+                isinstance(dependency, type)
+                and not issubclass(dependency, Event)
+                and dependency not in owners
+            ):
+                owners.append(dependency)
+        return owners
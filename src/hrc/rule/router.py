@@ -0,0 +1,196 @@
+"""Command router of the methods decorated with ``Rule.command``."""
+
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from hrc.log import logger
+
+__all__ = ["CommandMatch", "CommandRouter", "get_command_methods"]
+
+
+class CommandMatch(NamedTuple):
+    """A message routed to a command.
+
+    Attributes:
+        rule: The rule class that owns the command.
+        handler: The name of the method handling the command.
+        command: The command as registered, without the prefix.
+        args: The rest of the message, stripped.
+    """
+
+    rule: type
+    handler: str
+    command: str
+    args: str
+
+
+class _Node:
+    """Trie node, ``claims`` is non-empty if a command ends here."""
+
+    __slots__ = ("children", "claims")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_Node"] = {}
+        self.claims: List[Tuple[type, str, str]] = []
+
+
+def get_command_methods(rule_class: type) -> Dict[str, Callable[..., Any]]:
+    """Get the methods of a rule class decorated with ``Rule.command``.
+
+    Args:
+        rule_class: The rule class.
+
+    Returns:
+        Method name to method, inherited methods included.
+    """
+    methods: Dict[str, Callable[..., Any]] = {}
+    for klass in reversed(rule_class.__mro__):
+        for name, value in vars(klass).items():
+            if getattr(value, "_command", None) is not None:
+                methods[name] = value
+            else:
+                methods.pop(name, None)
+    return methods
+
+
+class CommandRouter:
+    """Route messages such as ``.r 3d6`` to the rule that owns the command.
+
+    Command names and their ``Rule.aliases`` are stored in a character trie,
+    a message is matched by walking the trie once and keeping the longest
+    command found. No separator is needed after the command, so ``.st力量60``
+    routes to ``st`` with ``力量60`` as arguments, and ``.coc7`` routes to a
+    ``coc7`` command if there is one and to ``coc`` otherwise.
+
+    Commands declared with ``ignore_case=True`` live in a second, case-folded
+    trie. When both tries match, the longer command wins and the exact one
+    wins a tie.
+
+    Attributes:
+        prefixes: The strings a command message starts with.
+    """
+
+    prefixes: Tuple[str, ...]
+
+    def __init__(self, prefixes: Iterable[str] = (".", "。")) -> None:
+        self.prefixes = tuple(prefixes)
+        self._exact = _Node()
+        self._casefold = _Node()
+        self._rule_commands: Dict[type, List[Tuple[bool, str]]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(x) for x in self._rule_commands.values())
+
+    def __contains__(self, rule_class: type) -> bool:
+        """Whether the rule owns at least one command."""
+        return rule_class in self._rule_commands
+
+    def add_rule(self, rule_class: type) -> List[str]:
+        """Register the commands of a rule.
+
+        Args:
+            rule_class: The rule class.
+
+        Returns:
+            Commands that are now owned by more than one rule, the one loaded
+            first keeps them.
+        """
+        self.remove_rule(rule_class)
+        commands: List[Tuple[bool, str]] = []
+        collisions: List[str] = []
+        for handler, method in get_command_methods(rule_class).items():
+            ignore_case = bool(
+                getattr(method, "_command_ignore_case", False)
+                or getattr(method, "_ignore_case", False)
+            )
+            names = (method._command, *(getattr(method, "_aliases", None) or ()))  # noqa: SLF001
+            for name in names:
+                key = name.casefold() if ignore_case else name
+                if not key or (ignore_case, key) in commands:
+                    continue
+                node = self._insert(self._casefold if ignore_case else self._exact, key)
+                node.claims.append((rule_class, handler, name))
+                commands.append((ignore_case, key))
+                if len(node.claims) > 1:
+                    collisions.append(key)
+                    logger.warning(
+                        f'Command "{key}" is owned by more than one rule: '
+                        + ", ".join(x[0].__qualname__ for x in node.claims)
+                    )
+        if commands:
+            self._rule_commands[rule_class] = commands
+        return collisions
+
+    def remove_rule(self, rule_class: type) -> None:
+        """Unregister the commands of a rule.
+
+        Args:
+            rule_class: The rule class.
+        """
+        for ignore_case, key in self._rule_commands.pop(rule_class, ()):
+            root = self._casefold if ignore_case else self._exact
+            path = [root]
+            for char in key:
+                path.append(path[-1].children[char])
+            path[-1].claims = [x for x in path[-1].claims if x[0] is not rule_class]
+            # Prune the branch that no longer leads to any command
+            for parent, char, node in zip(path[-2::-1], key[::-1], path[:0:-1]):
+                if node.claims or node.children:
+                    break
+                del parent.children[char]
+
+    def clear(self) -> None:
+        """Unregister all commands."""
+        self._exact = _Node()
+        self._casefold = _Node()
+        self._rule_commands.clear()
+
+    def match(self, message: str) -> Optional[CommandMatch]:
+        """Find the command a message invokes.
+
+        Args:
+            message: The plain text of the message.
+
+        Returns:
+            The longest command the message starts with, ``None`` if the
+            message is not a command or no rule owns the command.
+        """
+        text = message.lstrip()
+        for prefix in self.prefixes:
+            if text.startswith(prefix):
+                text = text[len(prefix) :]
+                break
+        else:
+            return None
+
+        best: Optional[Tuple[int, Tuple[type, str, str]]] = None
+        node = self._exact
+        for i, char in enumerate(text):
+            node = node.children.get(char)  # type: ignore
+            if node is None:
+                break
+            if node.claims:
+                best = (i + 1, node.claims[0])
+
+        node = self._casefold
+        for i, char in enumerate(text):
+            # A folded character may expand (ß -> ss), walk all of it
+            for folded in char.casefold():
+                node = node.children.get(folded)  # type: ignore
+                if node is None:
+                    break
+            if node is None:
+                break
+            if node.claims and (best is None or i + 1 > best[0]):
+                best = (i + 1, node.claims[0])
+
+        if best is None:
+            return None
+        end, (rule_class, handler, command) = best
+        return CommandMatch(rule_class, handler, command, text[end:].strip())
+
+    @staticmethod
+    def _insert(root: _Node, key: str) -> _Node:
+        node = root
+        for char in key:
+            node = node.children.setdefault(char, _Node())
+        return node
@@ -1,3 +1,4 @@
+import asyncio
 import os
 from abc import ABC, abstractmethod
 from typing import (
@@ -6,6 +7,8 @@ from typing import (
     Awaitable,
     Callable,
     Generic,
+    Hashable,
+    List,
     Optional,
     Type,
     TypeVar,
@@ -15,6 +18,7 @@ from typing import (
 )
 
 from hrc.event import Event
+from hrc.service.outbox import Outbox
 from hrc.typing import ConfigT, EventT
 from hrc.utils import is_config_class
 
@@ -32,15 +36,42 @@ _EventT = TypeVar("_EventT", bound="Event[Any]")
 
 
 class Service(Generic[EventT, ConfigT], ABC): 
+    """Base class of services.
+
+    Attributes:
+        send_rate: Sends per second allowed by the platform, unlimited if
+            ``None``.
+        send_burst: Sends allowed at once before ``send_rate`` applies.
+        send_window: Seconds to wait for more messages to the same target,
+            so that they are sent together.
+        send_max_batch: Maximum number of messages sent together.
+        send_max_length: Maximum total length of the messages sent together.
+    """
+
     name: str
     core: "Core"
     Config: Type[ConfigT]
+    outbox: Outbox
+    send_rate: Optional[float] = None
+    send_burst: int = 5
+    send_window: float = 0.05
+    send_max_batch: int = 20
+    send_max_length: Optional[int] = None
 
     def __init__(self, core: "Core") -> None:
         if not hasattr(self, "name"):
             self.name = self.__class__.__name__
         self.core: Core = core
         self.handle_event = self.core.handle_event
+        self.outbox = Outbox(
+            self.send_batch,
+            rate=self.send_rate,
+            burst=self.send_burst,
+            window=self.send_window,
+            max_batch=self.send_max_batch,
+            max_length=self.send_max_length,
+            on_error=self.core.error_or_exception,
+        )
 
     @property
     def config(self) -> ConfigT:
@@ -73,12 +104,59 @@ class Service(Generic[EventT, ConfigT], ABC):
     async def shutdown(self) -> None:
         ...
 
+    def queue_message(self, target: Hashable, message: str) -> "asyncio.Future[Any]":
+        """Queue a message, it is sent with ``send_batch`` shortly after.
+
+        Consecutive messages to the same target are coalesced and sends are
+        rate-limited by ``send_rate``, see ``hrc.service.outbox``.
+
+        Args:
+            target: The destination, such as a chat or user id.
+            message: The message.
+
+        Returns:
+            A future of the result of ``send_batch``, it may be ignored.
+
+        Raises:
+            TypeError: The service neither overrides ``send_batch`` nor has a
+                ``send`` method to send the messages with.
+        """
+        if type(self).send_batch is Service.send_batch and not callable(
+            getattr(self, "send", None)
+        ):
+            raise TypeError(
+                f"{type(self).__name__} must implement send_batch() or "
+                "send(target, message) to queue messages"
+            )
+        return self.outbox.put(target, message)
+
+    async def send_batch(self, target: Hashable, messages: List[str]) -> Any:
+        """Send queued messages to a target at once.
+
+        By default the messages are sent one by one, in order, with the
+        ``send(target, message)`` method of the service. Services override
+        this to send them with a single request where the protocol allows
+        it, for example by joining the messages, or when their ``send`` has
+        another signature.
+
+        Args:
+            target: The destination given to ``queue_message``.
+            messages: The messages, in order.
+
+        Returns:
+            The response of the platform, the list of the results of ``send``
+            by default.
+        """
+        send: Callable[[Hashable, str], Awaitable[Any]] = getattr(self, "send")
+        return [await send(target, message) for message in messages]
+
     @overload
     async def get(
         self,
         func: Optional[Callable[[EventT], Union[bool, Awaitable[bool]]]] = None,
         *,
         event_type: None = None,
+        session_id: Union[None, int, str] = None,
         max_try_times: Optional[int] = None,
         timeout: Optional[Union[int, float]] = None,
     ) -> EventT: ...
@@ -89,6 +167,7 @@ class Service(Generic[EventT, ConfigT], ABC):
         func: Optional[Callable[[_EventT], Union[bool, Awaitable[bool]]]] = None,
         *,
         event_type: Type[_EventT],
+        session_id: Union[None, int, str] = None,
         max_try_times: Optional[int] = None,
         timeout: Optional[Union[int, float]] = None,
     ) -> _EventT: ...
@@ -99,6 +178,7 @@ class Service(Generic[EventT, ConfigT], ABC):
         func: Optional[Callable[[Any], Union[bool, Awaitable[bool]]]] = None,
         *,
         event_type: Any = None,
+        session_id: Union[None, int, str] = None,
         max_try_times: Optional[int] = None,
         timeout: Optional[Union[int, float]] = None,
     ) -> Event[Any]:
@@ -106,6 +186,7 @@ class Service(Generic[EventT, ConfigT], ABC):
             func,
             event_type=event_type,
             server_type=type(self),
+            session_id=session_id,
             max_try_times=max_try_times,
             timeout=timeout,
         )
\ No newline at end of file
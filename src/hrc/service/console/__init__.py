@@ -1,5 +1,6 @@
 import asyncio
 import sys
+from typing import Hashable, List
 from typing_extensions import override
 
 from hrc.event import MessageEvent
@@ -38,4 +39,10 @@ class ConsoleService(Service[ConsoleServiceEvent, None]):
             )
 
     async def send(self, message: str) -> None:
-        print(f"Send a message: {message}")  # noqa: T201
\ No newline at end of file
+        """Queue a message, replies sent in a burst are printed together."""
+        self.queue_message(None, message)
+
+    @override
+    async def send_batch(self, target: Hashable, messages: List[str]) -> None:
+        text = "\n".join(messages)
+        print(f"Send a message: {text}")  # noqa: T201
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""Outbound message queues of services.
+
+Messages are queued per destination and sent by one task per destination,
+so messages to a target keep their order while different targets do not wait
+for each other. Messages to a target arriving within ``window`` seconds of
+each other are coalesced and handed to the sender together, and each send
+takes a token from a bucket shared by all the targets of the service, so a
+burst of replies becomes a few rate-limited sends.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Tuple,
+)
+
+__all__ = ["Outbox", "TokenBucket"]
+
+
+class TokenBucket:
+    """Token bucket rate limiter.
+
+    Args:
+        rate: Tokens added per second.
+        burst: Maximum number of tokens, the size of a burst allowed at once.
+    """
+
+    def __init__(self, rate: float, burst: float = 1) -> None:
+        if rate <= 0 or burst <= 0:
+            raise ValueError("rate and burst must be positive")
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take tokens if there are enough of them, without waiting."""
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1) -> None:
+        """Wait until there are enough tokens and take them.
+
+        Waiters are served in the order they arrived.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+_Pending = Tuple[str, "asyncio.Future[Any]"]
+
+
+class Outbox:
+    """Per-destination queues of outgoing messages.
+
+    Args:
+        sender: Sends coalesced messages to a target, called with the target
+            and the messages in order.
+        rate: Sends per second, unlimited if ``None``.
+        burst: Sends allowed at once before ``rate`` applies.
+        window: Seconds to wait for more messages to the same target before
+            sending.
+        max_batch: Maximum number of messages sent together.
+        max_length: Maximum total length of the messages sent together, a
+            longer message is still sent, alone.
+        on_error: Called with a message and the exception when a send fails.
+    """
+
+    def __init__(
+        self,
+        sender: Callable[[Any, List[str]], Awaitable[Any]],
+        *,
+        rate: Optional[float] = None,
+        burst: float = 1,
+        window: float = 0.05,
+        max_batch: int = 20,
+        max_length: Optional[int] = None,
+        on_error: Optional[Callable[[str, Exception], Any]] = None,
+    ) -> None:
+        self.sender = sender
+        self.bucket = None if rate is None else TokenBucket(rate, burst)
+        self.window = window
+        self.max_batch = max_batch
+        self.max_length = max_length
+        self.on_error = on_error
+        self._queues: Dict[Hashable, Deque[_Pending]] = {}
+        self._tasks: Dict[Hashable, "asyncio.Task[None]"] = {}
+
+    def __len__(self) -> int:
+        """Number of messages waiting to be sent."""
+        return sum(map(len, self._queues.values()))
+
+    def put(self, target: Hashable, message: str) -> "asyncio.Future[Any]":
+        """Queue a message.
+
+        Args:
+            target: The destination, such as a chat or user id.
+            message: The message.
+
+        Returns:
+            A future of the result of the send the message was part of, it
+            may be ignored.
+        """
+        future = asyncio.get_running_loop().create_future()
+        # Failures are reported through on_error, awaiting is optional
+        future.add_done_callback(_retrieve)
+        self._queues.setdefault(target, deque()).append((message, future))
+        if target not in self._tasks:
+            self._tasks[target] = asyncio.create_task(self._drain(target))
+        return future
+
+    def _take(self, queue: Deque[_Pending]) -> List[_Pending]:
+        batch = [queue.popleft()]
+        length = len(batch[0][0])
+        while queue and len(batch) < self.max_batch:
+            length += len(queue[0][0])
+            if self.max_length is not None and length > self.max_length:
+                break
+            batch.append(queue.popleft())
+        return batch
+
+    async def _drain(self, target: Hashable) -> None:
+        queue = self._queues[target]
+        try:
+            while queue:
+                # Let the rest of a burst arrive
+                await asyncio.sleep(self.window)
+                batch = self._take(queue)
+                if self.bucket is not None:
+                    await self.bucket.acquire()
+                try:
+                    result = await self.sender(target, [m for m, _ in batch])
+                except Exception as e:
+                    if self.on_error is not None:
+                        self.on_error(f"Send to {target!r} failed:", e)
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_result(result)
+        finally:
+            del self._tasks[target]
+            if queue:
+                # Cancelled, the messages left are not sent
+                for _, future in queue:
+                    future.cancel()
+            del self._queues[target]
+
+    async def flush(self) -> None:
+        """Wait until the queued messages are sent."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def close(self) -> None:
+        """Drop the queued messages."""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+
+def _retrieve(future: "asyncio.Future[Any]") -> None:
+    if not future.cancelled():
+        future.exception()
@@ -0,0 +1,69 @@
+"""HTTP client connection pool shared by the services.
+
+The core owns a single ``aiohttp.TCPConnector``, so services talking to the
+same host reuse kept-alive connections, TLS sessions and cached DNS lookups
+instead of each opening its own. Every service still gets a session of its
+own, with its own timeout. Closing such a session leaves the pool open; the
+core closes the pool when it stops.
+"""
+
+from typing import Any, Optional
+
+import aiohttp
+
+from hrc.config import HttpClientConfig
+
+__all__ = ["HttpClientPool"]
+
+
+class HttpClientPool:
+    """The HTTP client connection pool of the core.
+
+    Args:
+        config: Limits, keep-alive, DNS cache and default timeouts.
+    """
+
+    def __init__(self, config: HttpClientConfig) -> None:
+        self.config = config
+        self._connector: Optional[aiohttp.TCPConnector] = None
+
+    @property
+    def connector(self) -> aiohttp.TCPConnector:
+        """The shared connector, created on first use inside the event loop."""
+        if self._connector is None or self._connector.closed:
+            self._connector = aiohttp.TCPConnector(
+                limit=self.config.limit,
+                limit_per_host=self.config.limit_per_host,
+                keepalive_timeout=self.config.keepalive_timeout,
+                ttl_dns_cache=self.config.ttl_dns_cache,
+            )
+        return self._connector
+
+    def session(
+        self, timeout: Optional[float] = None, **kwargs: Any
+    ) -> aiohttp.ClientSession:
+        """Create a session using the shared connector.
+
+        Args:
+            timeout: Seconds a request may take, ``config.timeout`` if
+                ``None``. It only bounds the handshake of WebSockets.
+            **kwargs: Other arguments of ``aiohttp.ClientSession``.
+
+        Returns:
+            The session, closing it does not close the pool.
+        """
+        return aiohttp.ClientSession(
+            connector=self.connector,
+            connector_owner=False,
+            timeout=aiohttp.ClientTimeout(
+                total=self.config.timeout if timeout is None else timeout,
+                connect=self.config.connect_timeout,
+            ),
+            **kwargs,
+        )
+
+    async def close(self) -> None:
+        """Close the pooled connections."""
+        if self._connector is not None:
+            await self._connector.close()
+            self._connector = None
@@ -0,0 +1,215 @@
+"""Reconnection and liveness of services keeping a connection open.
+
+``keep_connected`` reconnects after every failure or disconnection. The delay
+grows exponentially up to a cap and is partly random, so that clients which
+lost the same upstream spread their attempts. After too many consecutive
+failures a circuit breaker waits much longer before the next attempt. A
+connection only resets the delay once it has stayed up for a while, so a peer
+that accepts and immediately drops connections is backed off too.
+
+``Heartbeat`` pings a WebSocket and closes it when the peer stays silent,
+which turns a half-open connection into a reconnection.
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from hrc.config import ReconnectConfig
+from hrc.log import logger
+
+__all__ = ["Backoff", "ConnectionStats", "Heartbeat", "keep_connected"]
+
+
+class Backoff:
+    """Delays between reconnection attempts.
+
+    Args:
+        config: The reconnection policy.
+        rng: Returns a random number in ``[0, 1)``.
+    """
+
+    def __init__(
+        self, config: ReconnectConfig, rng: Callable[[], float] = random.random
+    ) -> None:
+        self.config = config
+        self.rng = rng
+        self.failures = 0
+
+    @property
+    def circuit_open(self) -> bool:
+        """Whether failures reached the threshold of the circuit breaker."""
+        threshold = self.config.failure_threshold
+        return threshold is not None and self.failures >= threshold
+
+    def failure(self) -> float:
+        """Record a failure and return the seconds to wait before retrying."""
+        self.failures += 1
+        config = self.config
+        if self.circuit_open:
+            delay = config.open_timeout
+        else:
+            delay = min(
+                config.max_delay,
+                config.initial_delay * config.multiplier ** (self.failures - 1),
+            )
+        return delay * (1 - config.jitter * self.rng())
+
+    def reset(self) -> None:
+        """Record a stable connection, the next delay is the initial one."""
+        self.failures = 0
+
+
+class ConnectionStats:
+    """Metrics of a connection kept open by ``keep_connected``.
+
+    Attributes:
+        connects: Number of connections established.
+        failures: Number of attempts that failed before connecting.
+        total_uptime: Seconds connected, the current connection excluded.
+        last_error: The error of the last failed or dropped connection.
+        connected_since: ``time.monotonic()`` when the current connection was
+            established, ``None`` when disconnected.
+    """
+
+    def __init__(self) -> None:
+        self.connects = 0
+        self.failures = 0
+        self.total_uptime = 0.0
+        self.last_error: Optional[BaseException] = None
+        self.connected_since: Optional[float] = None
+
+    @property
+    def reconnects(self) -> int:
+        """Number of connections established after the first one."""
+        return max(self.connects - 1, 0)
+
+    @property
+    def uptime(self) -> float:
+        """Seconds the current connection has been up, 0 if disconnected."""
+        if self.connected_since is None:
+            return 0.0
+        return time.monotonic() - self.connected_since
+
+    def connected(self) -> None:
+        """Record an established connection."""
+        self.connects += 1
+        self.connected_since = time.monotonic()
+
+    def disconnected(self, error: Optional[BaseException] = None) -> float:
+        """Record the end of a connection or a failed attempt.
+
+        Returns:
+            The uptime of the connection, 0 if it was never established.
+        """
+        uptime = self.uptime
+        if self.connected_since is None:
+            self.failures += 1
+        self.total_uptime += uptime
+        self.connected_since = None
+        if error is not None:
+            self.last_error = error
+        return uptime
+
+    def __repr__(self) -> str:
+        return (
+            f"<ConnectionStats connects={self.connects} failures={self.failures} "
+            f"uptime={self.uptime:.1f}s total_uptime={self.total_uptime:.1f}s>"
+        )
+
+
+async def keep_connected(
+    connect: Callable[[], Awaitable[Any]],
+    config: ReconnectConfig,
+    stats: ConnectionStats,
+    should_exit: asyncio.Event,
+    *,
+    name: str = "connection",
+    on_error: Optional[Callable[[str, Exception], Any]] = None,
+    rng: Callable[[], float] = random.random,
+) -> None:
+    """Run a connection until ``should_exit`` is set, reconnecting as needed.
+
+    Args:
+        connect: Connects and returns when the connection is closed, it calls
+            ``stats.connected()`` once the connection is established.
+        config: The reconnection policy.
+        stats: Metrics of the connection.
+        should_exit: Stops reconnecting when set.
+        name: The name of the connection in logs.
+        on_error: Called with a message and the exception when ``connect``
+            raises, the exception is logged as a warning if ``None``.
+        rng: Returns a random number in ``[0, 1)``, for the jitter.
+    """
+    backoff = Backoff(config, rng)
+    while not should_exit.is_set():
+        error: Optional[Exception] = None
+        try:
+            await connect()
+        except Exception as e:
+            error = e
+            if on_error is not None:
+                on_error(f"{name} connection error:", e)
+            else:
+                logger.warning(f"{name} connection error: {e!r}")
+        uptime = stats.disconnected(error)
+        if should_exit.is_set():
+            break
+        if uptime >= config.stable_after:
+            backoff.reset()
+        delay = backoff.failure()
+        if backoff.circuit_open:
+            logger.warning(
+                f"{name} failed {backoff.failures} times in a row, "
+                f"next attempt in {delay:.1f}s"
+            )
+        else:
+            logger.info(f"Reconnecting {name} in {delay:.1f}s")
+        try:
+            await asyncio.wait_for(should_exit.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+
+class Heartbeat:
+    """Pings a WebSocket and closes it when the peer stays silent.
+
+    The WebSocket is expected to be opened with ``autoping=False`` and the
+    receiving loop to call ``seen()`` for every frame, pongs included.
+
+    Args:
+        websocket: An aiohttp WebSocket.
+        interval: Seconds between two pings.
+        timeout: Seconds to wait for any frame after a ping.
+    """
+
+    def __init__(self, websocket: Any, interval: float, timeout: float) -> None:
+        self.websocket = websocket
+        self.interval = interval
+        self.timeout = timeout
+        self.last_seen = time.monotonic()
+
+    def seen(self) -> None:
+        """Record a frame received from the peer."""
+        self.last_seen = time.monotonic()
+
+    async def run(self) -> None:
+        """Ping until the WebSocket is closed, close it on a timeout."""
+        ws = self.websocket
+        while not ws.closed:
+            await asyncio.sleep(self.interval)
+            if ws.closed:
+                return
+            sent = time.monotonic()
+            try:
+                await ws.ping()
+            except (ConnectionError, RuntimeError):
+                return
+            await asyncio.sleep(self.timeout)
+            if self.last_seen < sent:
+                logger.warning(
+                    f"No answer to a ping in {self.timeout}s, closing the WebSocket"
+                )
+                await ws.close()
+                return
@@ -1,52 +1,194 @@
 import asyncio
+import itertools
+import json
+import time
 from abc import ABCMeta, abstractmethod
-from typing import Literal, Optional, Union
+from contextvars import ContextVar
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Literal,
+    Optional,
+    Set,
+    Union,
+)
 
 import aiohttp
 from aiohttp import web
 
+from hrc.config import ReconnectConfig
 from hrc.service import Service
+from hrc.service.reconnect import ConnectionStats, Heartbeat, keep_connected
 from hrc.log import logger
 from hrc.typing import ConfigT, EventT
 
+if TYPE_CHECKING:
+    from hrc.core import Core
+
 __all__ = [
+    "TickStats",
     "PollingService",
     "HttpClientService",
     "WebSocketClientService",
     "HttpServerService",
     "WebSocketServerService",
+    "WebSocketConnection",
     "WebSocketService",
 ]
 
 
+class TickStats:
+    """Metrics of the ticks of a ``PollingService``.
+
+    Attributes:
+        ticks: Number of finished ticks.
+        idle: Number of ticks that produced no events.
+        skipped: Number of ticks skipped because too many were running.
+        last_latency: Seconds the last tick took.
+        mean_latency: Moving average of the seconds a tick takes.
+        max_latency: Seconds the slowest tick took.
+    """
+
+    def __init__(self) -> None:
+        self.ticks = 0
+        self.idle = 0
+        self.skipped = 0
+        self.last_latency = 0.0
+        self.mean_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency: float, active: bool) -> None:
+        """Record a finished tick."""
+        self.ticks += 1
+        if not active:
+            self.idle += 1
+        self.last_latency = latency
+        if self.ticks == 1:
+            self.mean_latency = latency
+        else:
+            self.mean_latency += (latency - self.mean_latency) / 10
+        self.max_latency = max(self.max_latency, latency)
+
+    def __repr__(self) -> str:
+        return (
+            f"<TickStats ticks={self.ticks} idle={self.idle} skipped={self.skipped} "
+            f"mean_latency={self.mean_latency * 1000:.1f}ms>"
+        )
+
+
 class PollingService(Service[EventT, ConfigT], metaclass=ABCMeta):
-    """轮询式适配器示例。"""
+    """轮询式适配器示例。
+
+    The interval between two ticks starts at ``delay``, grows by ``backoff``
+    after each tick that produced no events up to ``max_delay``, and goes back
+    to ``delay`` as soon as a tick produces events.
+
+    Attributes:
+        delay: The shortest interval, in seconds.
+        max_delay: The longest interval, in seconds.
+        backoff: Factor the interval grows by after an idle tick.
+        create_task: Whether ticks run in their own task, so that the next
+            one may start before the previous one is done.
+        max_in_flight: Maximum number of ticks running at once when
+            ``create_task`` is set, a tick is skipped when it is reached.
+        interval: The current interval.
+        tick_stats: Tick counts and latencies.
+    """
 
     delay: float = 0.1
+    max_delay: float = 2
+    backoff: float = 2
     create_task: bool = False
-    _on_tick_task: Optional["asyncio.Task[None]"] = None
+    max_in_flight: int = 1
+    interval: float
+    tick_stats: TickStats
+
+    def __init__(self, core: "Core") -> None:
+        super().__init__(core)
+        self._handled = 0
+        handle_event = self.handle_event
+
+        async def handle_counted_event(*args: Any, **kwargs: Any) -> None:
+            self._handled += 1
+            await handle_event(*args, **kwargs)
+
+        self.handle_event = handle_counted_event
 
     async def run(self) -> None:
-        while not self.core.should_exit.is_set():
-            await asyncio.sleep(self.delay)
-            if self.create_task:
-                self._on_tick_task = asyncio.create_task(self.on_tick())
-            else:
-                await self.on_tick()
+        self.interval = self.delay
+        self.tick_stats = TickStats()
+        in_flight: Set["asyncio.Task[None]"] = set()
+        try:
+            while not self.core.should_exit.is_set():
+                try:
+                    await asyncio.wait_for(self.core.should_exit.wait(), self.interval)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+                if not self.create_task:
+                    await self._tick()
+                elif len(in_flight) >= self.max_in_flight:
+                    self.tick_stats.skipped += 1
+                    if self.tick_stats.skipped % 100 == 1:
+                        logger.warning(
+                            f"{self.name} skipped {self.tick_stats.skipped} ticks, "
+                            f"a tick takes {self.tick_stats.last_latency:.2f}s"
+                        )
+                else:
+                    task = asyncio.create_task(self._safe_tick())
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+        finally:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+
+    async def _tick(self) -> None:
+        handled = self._handled
+        start = time.perf_counter()
+        result = await self.on_tick()
+        latency = time.perf_counter() - start
+        active = self._handled > handled if result is None else bool(result)
+        self.tick_stats.record(latency, active)
+        if active:
+            self.interval = self.delay
+        else:
+            self.interval = min(self.max_delay, self.interval * self.backoff)
+
+    async def _safe_tick(self) -> None:
+        try:
+            await self._tick()
+        except Exception as e:
+            self.core.error_or_exception(f"Tick of {self.name} failed:", e)
 
     @abstractmethod
-    async def on_tick(self) -> None:
-        """当轮询发生。"""
+    async def on_tick(self) -> Union[None, bool, int]:
+        """当轮询发生。
+
+        Returns:
+            Whether, or how many, events the tick produced. If ``None``, the
+            events passed to ``handle_event`` during the tick are counted.
+        """
 
 
 class HttpClientService(PollingService[EventT, ConfigT], metaclass=ABCMeta):
+    """Polling HTTP client using the connection pool of the core.
+
+    Attributes:
+        request_timeout: Seconds a request may take, ``core.http_client``
+            decides if ``None``.
+    """
+
     session: aiohttp.ClientSession
+    request_timeout: Optional[float] = None
 
     async def startup(self) -> None:
-        self.session = aiohttp.ClientSession()
+        self.session = self.core.http_client.session(self.request_timeout)
 
     @abstractmethod
-    async def on_tick(self) -> None:
+    async def on_tick(self) -> Union[None, bool, int]:
         ...
     async def shutdown(self) -> None:
         """关闭并清理连接。"""
@@ -54,19 +196,50 @@ class HttpClientService(PollingService[EventT, ConfigT], metaclass=ABCMeta):
 
 
 class WebSocketClientService(Service[EventT, ConfigT], metaclass=ABCMeta):
+    """WebSocket client reconnecting according to ``reconnect``.
+
+    Attributes:
+        reconnect: Backoff, circuit breaker and heartbeat settings.
+        request_timeout: Seconds the handshake may take, ``core.http_client``
+            decides if ``None``.
+        stats: Uptime and reconnection metrics of the connection.
+    """
+
     url: str
+    reconnect: ReconnectConfig = ReconnectConfig()
+    request_timeout: Optional[float] = None
+    stats: ConnectionStats
+    websocket: Optional[aiohttp.ClientWebSocketResponse] = None
 
     async def run(self) -> None:
-        async with aiohttp.ClientSession() as session, session.ws_connect(
-            self.url
-        ) as ws:
-            msg: aiohttp.WSMessage
-            async for msg in ws:
-                if self.core.should_exit.is_set():
-                    break
-                if msg.type == aiohttp.WSMsgType.ERROR:
-                    break
-                await self.handle_response(msg)
+        self.stats = ConnectionStats()
+        async with self.core.http_client.session(self.request_timeout) as session:
+            await keep_connected(
+                lambda: self._connect(session),
+                self.reconnect,
+                self.stats,
+                self.core.should_exit,
+                name=f"WebSocket {self.url}",
+                on_error=self.core.error_or_exception,
+            )
+
+    async def _connect(self, session: aiohttp.ClientSession) -> None:
+        async with session.ws_connect(self.url, autoping=False) as ws:
+            self.websocket = ws
+            self.stats.connected()
+            try:
+                error = await _serve_websocket(
+                    ws, self.reconnect, self.handle_response, self.core.should_exit
+                )
+            finally:
+                self.websocket = None
+        if error is not None:
+            raise error
+
+    async def shutdown(self) -> None:
+        """关闭并清理连接。"""
+        if self.websocket is not None:
+            await self.websocket.close()
 
     @abstractmethod
     async def handle_response(self, msg: aiohttp.WSMessage) -> None:
@@ -107,16 +280,73 @@ class HttpServerService(Service[EventT, ConfigT], metaclass=ABCMeta):
         """处理响应。"""
 
 
+class WebSocketConnection:
+    """A client connected to a ``WebSocketServerService``.
+
+    Outgoing frames wait in a bounded queue and are written by a task of
+    their own, so a slow client never delays the others.
+
+    Attributes:
+        id: The connection id, unique within the service.
+        websocket: The WebSocket of the client.
+        request: The HTTP request that opened the connection.
+        queue: Frames waiting to be written.
+        dropped: Number of frames discarded because the queue was full.
+    """
+
+    def __init__(
+        self,
+        connection_id: str,
+        websocket: web.WebSocketResponse,
+        request: web.Request,
+        max_queue: int,
+    ) -> None:
+        self.id = connection_id
+        self.websocket = websocket
+        self.request = request
+        self.queue: "asyncio.Queue[Union[str, bytes]]" = asyncio.Queue(max_queue)
+        self.dropped = 0
+        self._writer: Optional["asyncio.Task[None]"] = None
+
+    @property
+    def closed(self) -> bool:
+        """Whether the connection is closed or closing."""
+        return self.websocket.closed
+
+    def __repr__(self) -> str:
+        return f"<WebSocketConnection {self.id} queued={self.queue.qsize()}>"
+
+
+# The connection whose message is being handled
+_current_connection: ContextVar[Optional[WebSocketConnection]] = ContextVar(
+    "_current_connection", default=None
+)
+
+
 class WebSocketServerService(Service[EventT, ConfigT], metaclass=ABCMeta):
+    """WebSocket server accepting any number of clients.
+
+    Clients are kept in ``connections`` by connection id. ``send`` writes to
+    one of them and ``broadcast`` to all of them, both only queue the frame.
+    When the queue of a client is full, or a write takes longer than
+    ``send_timeout``, ``slow_consumer`` decides what happens: ``drop``
+    discards the frame for this client only, ``disconnect`` closes it.
+    """
+
     app: web.Application
     runner: web.AppRunner
     site: web.TCPSite
-    websocket: web.WebSocketResponse
+    connections: Dict[str, WebSocketConnection]
     host: str
     port: int
     url: str
+    send_queue_size: int = 100
+    send_timeout: Optional[float] = 10
+    slow_consumer: Literal["drop", "disconnect"] = "drop"
 
     async def startup(self) -> None:
+        self.connections = {}
+        self._connection_ids = itertools.count(1)
         self.app = web.Application()
         self.app.add_routes([web.get(self.url, self.handle_response)])
 
@@ -128,28 +358,173 @@ class WebSocketServerService(Service[EventT, ConfigT], metaclass=ABCMeta):
 
     async def shutdown(self) -> None:
         """关闭并清理连接。"""
-        await self.websocket.close()
+        await asyncio.gather(
+            *(
+                self.disconnect(connection_id)
+                for connection_id in list(self.connections)
+            )
+        )
         await self.site.stop()
         await self.runner.cleanup()
 
+    @property
+    def current_connection(self) -> Optional[WebSocketConnection]:
+        """The connection of the message being handled, ``None`` outside of
+        ``handle_ws_response``."""
+        return _current_connection.get()
+
     async def handle_response(self, request: web.Request) -> web.WebSocketResponse:
         """处理 WebSocket。"""
         ws = web.WebSocketResponse()
         await ws.prepare(request)
-        self.websocket = ws
+        connection = WebSocketConnection(
+            str(next(self._connection_ids)), ws, request, self.send_queue_size
+        )
+        connection._writer = asyncio.create_task(self._write(connection))
+        self.connections[connection.id] = connection
+        token = _current_connection.set(connection)
+        try:
+            await self.on_connect(connection)
+            msg: aiohttp.WSMessage
+            async for msg in ws:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    await self.handle_ws_response(msg)
+                elif msg.type == aiohttp.WSMsgType.ERROR:
+                    break
+        finally:
+            _current_connection.reset(token)
+            await self._unregister(connection)
+        return ws
 
-        msg: aiohttp.WSMessage
-        async for msg in ws:
-            if msg.type == aiohttp.WSMsgType.TEXT:
-                await self.handle_ws_response(msg)
-            elif msg.type == aiohttp.WSMsgType.ERROR:
-                break
+    async def on_connect(self, connection: WebSocketConnection) -> None:
+        """Called when a client connects, before any of its messages."""
+        logger.info(f"WebSocket client {connection.id} connected")
+
+    async def on_disconnect(self, connection: WebSocketConnection) -> None:
+        """Called when a client is gone."""
+        logger.info(f"WebSocket client {connection.id} disconnected")
+
+    async def send(self, connection_id: str, data: Any) -> bool:
+        """Queue a frame for one client.
+
+        Args:
+            connection_id: The id of the client.
+            data: A text (``str``) or binary (``bytes``) frame, anything else
+                is serialized as JSON.
+
+        Returns:
+            Whether the frame was queued.
+        """
+        connection = self.connections.get(connection_id)
+        if connection is None:
+            return False
+        return self._enqueue(connection, _encode_frame(data))
+
+    async def broadcast(self, data: Any, exclude: Iterable[str] = ()) -> int:
+        """Queue a frame for every client.
+
+        The frame is serialized once, the writers of all the clients send it
+        concurrently.
+
+        Args:
+            data: A text (``str``) or binary (``bytes``) frame, anything else
+                is serialized as JSON.
+            exclude: Ids of the clients to skip, such as the sender.
+
+        Returns:
+            The number of clients the frame was queued for.
+        """
+        frame = _encode_frame(data)
+        skipped = set(exclude)
+        return sum(
+            self._enqueue(connection, frame)
+            for connection in list(self.connections.values())
+            if connection.id not in skipped
+        )
 
-        return ws
+    async def disconnect(self, connection_id: str) -> None:
+        """Close the connection of a client."""
+        connection = self.connections.get(connection_id)
+        if connection is not None:
+            await connection.websocket.close()
+            await self._unregister(connection)
+
+    def _enqueue(
+        self, connection: WebSocketConnection, frame: Union[str, bytes]
+    ) -> bool:
+        if connection.closed:
+            return False
+        try:
+            connection.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self._slow_consumer(connection)
+            return False
+        return True
+
+    def _slow_consumer(self, connection: WebSocketConnection) -> None:
+        if self.slow_consumer == "disconnect":
+            logger.warning(f"Disconnecting slow WebSocket client {connection.id}")
+            # The writer closes the socket when it stops
+            if connection._writer is not None:
+                connection._writer.cancel()
+        else:
+            connection.dropped += 1
+            if connection.dropped == 1 or connection.dropped % 100 == 0:
+                logger.warning(
+                    f"WebSocket client {connection.id} is too slow, "
+                    f"{connection.dropped} frames dropped"
+                )
+
+    async def _write(self, connection: WebSocketConnection) -> None:
+        ws = connection.websocket
+        try:
+            while not ws.closed:
+                frame = await connection.queue.get()
+                if isinstance(frame, str):
+                    send = ws.send_str(frame)
+                else:
+                    send = ws.send_bytes(frame)
+                try:
+                    await asyncio.wait_for(send, self.send_timeout)
+                except asyncio.TimeoutError:
+                    if self.slow_consumer == "disconnect":
+                        logger.warning(
+                            f"Disconnecting slow WebSocket client {connection.id}"
+                        )
+                        break
+                    connection.dropped += 1
+                except (ConnectionError, RuntimeError) as e:
+                    logger.debug(
+                        f"WebSocket client {connection.id} write failed: {e!r}"
+                    )
+                    break
+        finally:
+            await ws.close()
+
+    async def _unregister(self, connection: WebSocketConnection) -> None:
+        if self.connections.get(connection.id) is not connection:
+            return
+        del self.connections[connection.id]
+        writer = connection._writer
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
+            await asyncio.gather(writer, return_exceptions=True)
+        await self.on_disconnect(connection)
 
     @abstractmethod
     async def handle_ws_response(self, msg: aiohttp.WSMessage) -> None:
-        """处理 WebSocket 响应。"""
+        """处理 WebSocket 响应。
+
+        The client that sent the message is ``current_connection``.
+        """
+
+
+def _encode_frame(data: Any) -> Union[str, bytes]:
+    if isinstance(data, (str, bytes)):
+        return data
+    if isinstance(data, (bytearray, memoryview)):
+        return bytes(data)
+    return json.dumps(data, ensure_ascii=False)
 
 
 class WebSocketService(Service[EventT, ConfigT], metaclass=ABCMeta):
@@ -174,11 +549,15 @@ class WebSocketService(Service[EventT, ConfigT], metaclass=ABCMeta):
     host: str
     port: int
     url: str
-    reconnect_interval: int = 3
+    reconnect: ReconnectConfig = ReconnectConfig()
+    request_timeout: Optional[float] = None
+
+    # metrics of the connection in "ws" mode
+    stats: ConnectionStats
 
     async def startup(self) -> None:
         if self.service_type == "ws":
-            self.session = aiohttp.ClientSession()
+            self.session = self.core.http_client.session(self.request_timeout)
         elif self.service_type == "reverse-ws":
             self.app = web.Application()
             self.app.add_routes([web.get(self.url, self.handle_reverse_ws_response)])
@@ -190,14 +569,15 @@ class WebSocketService(Service[EventT, ConfigT], metaclass=ABCMeta):
 
     async def run(self) -> None:
         if self.service_type == "ws":
-            while True:
-                try:
-                    await self.websocket_connect()
-                except aiohttp.ClientError as e:
-                    self.core.error_or_exception("WebSocket connection error:", e)
-                if self.core.should_exit.is_set():
-                    break
-                await asyncio.sleep(self.reconnect_interval)
+            self.stats = ConnectionStats()
+            await keep_connected(
+                self.websocket_connect,
+                self.reconnect,
+                self.stats,
+                self.core.should_exit,
+                name="WebSocket",
+                on_error=self.core.error_or_exception,
+            )
         elif self.service_type == "reverse-ws":
             assert self.app is not None
             self.runner = web.AppRunner(self.app)
@@ -222,7 +602,7 @@ class WebSocketService(Service[EventT, ConfigT], metaclass=ABCMeta):
         self, request: web.Request
     ) -> web.WebSocketResponse:
         """处理 aiohttp WebSocket 服务器的接收。"""
-        self.websocket = web.WebSocketResponse()
+        self.websocket = web.WebSocketResponse(autoping=False)
         await self.websocket.prepare(request)
         await self.reverse_ws_connection_hook()
         await self.handle_websocket()
@@ -237,20 +617,64 @@ class WebSocketService(Service[EventT, ConfigT], metaclass=ABCMeta):
         assert self.session is not None
         logger.info("Tying to connect to WebSocket server...")
         async with self.session.ws_connect(
-            f"ws://{self.host}:{self.port}{self.url}"
+            f"ws://{self.host}:{self.port}{self.url}", autoping=False
         ) as self.websocket:
+            self.stats.connected()
             await self.handle_websocket()
+            error = self.websocket.exception()
+        if isinstance(error, Exception):
+            raise error
 
     async def handle_websocket(self) -> None:
         """处理 WebSocket。"""
         if self.websocket is None or self.websocket.closed:
             return
-        async for msg in self.websocket:
-            await self.handle_websocket_msg(msg)
+        error = await _serve_websocket(
+            self.websocket, self.reconnect, self.handle_websocket_msg
+        )
+        if error is not None and self.service_type == "reverse-ws":
+            logger.warning(f"WebSocket connection error: {error!r}")
         if not self.core.should_exit.is_set():
             logger.warning("WebSocket connection closed!")
 
     @abstractmethod
     async def handle_websocket_msg(self, msg: aiohttp.WSMessage) -> None:
         """处理 WebSocket 消息。"""
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+
+async def _serve_websocket(
+    ws: Union[web.WebSocketResponse, aiohttp.ClientWebSocketResponse],
+    config: ReconnectConfig,
+    handler: Callable[[aiohttp.WSMessage], Awaitable[Any]],
+    should_exit: Optional[asyncio.Event] = None,
+) -> Optional[BaseException]:
+    """Hand the frames of a WebSocket opened with ``autoping=False`` to a
+    handler until it is closed, answering and sending pings.
+
+    Returns:
+        The error that ended the connection, if any.
+    """
+    heartbeat = None
+    heartbeat_task = None
+    if config.heartbeat_interval is not None:
+        heartbeat = Heartbeat(ws, config.heartbeat_interval, config.heartbeat_timeout)
+        heartbeat_task = asyncio.create_task(heartbeat.run())
+    try:
+        msg: aiohttp.WSMessage
+        async for msg in ws:
+            if heartbeat is not None:
+                heartbeat.seen()
+            if msg.type == aiohttp.WSMsgType.PING:
+                await ws.pong(msg.data)
+            elif msg.type == aiohttp.WSMsgType.ERROR:
+                return ws.exception()
+            elif msg.type != aiohttp.WSMsgType.PONG:
+                await handler(msg)
+            if should_exit is not None and should_exit.is_set():
+                break
+    finally:
+        if heartbeat_task is not None:
+            heartbeat_task.cancel()
+            await asyncio.gather(heartbeat_task, return_exceptions=True)
+    return None
@@ -0,0 +1,551 @@
+"""Binary snapshots of character card stores and rule state.
+
+A snapshot file starts with a header and is followed by records, all fields
+little-endian::
+
+    header  magic "HRCS", u16 version, u16 reserved, u64 creation time (ns)
+    record  tag (4 bytes), u16 name length, u16 reserved, u32 CRC-32 of the
+            payload, u64 payload length, name (UTF-8), payload
+
+Names and payloads are padded to 8 bytes so that columns can be viewed in
+place; on big-endian hosts they are byte-swapped into copies instead. Record
+tags:
+
+``CARD``
+    A full card store: u32 metadata length, JSON metadata (type code,
+    attribute names, owners, groups and free rows), then the columns one
+    after another.
+``CDLT``
+    Changed rows of a card store: u32 metadata length, JSON metadata (rows,
+    their owners and groups, free rows), then the values of the rows one row
+    after another.
+``STAT``
+    The pickled state of a rule, an empty payload deletes it.
+
+Later records of the same name replace (``CARD``, ``STAT``) or update
+(``CDLT``) the earlier ones, so changes are appended to the file and a full
+snapshot is only written from time to time. Reading stops at the first
+truncated or corrupt record, a crash while appending loses that record only.
+
+Owner and group ids of the cards must be JSON values.
+"""
+
+import json
+import mmap
+import os
+import pickle
+import struct
+import sys
+import time
+import zlib
+from array import array
+from hashlib import blake2b
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple, Union
+
+from hrc.exceptions import CoreException
+from hrc.log import logger
+from hrc.rule.BaseRule.CardStore import CardStore
+
+__all__ = [
+    "SNAPSHOT_VERSION",
+    "Snapshot",
+    "SnapshotError",
+    "SnapshotWriter",
+    "encode_header",
+    "encode_record",
+    "load_snapshot",
+    "read_header",
+    "read_records",
+]
+
+SNAPSHOT_VERSION = 1
+
+_MAGIC = b"HRCS"
+_HEADER = struct.Struct("<4sHHQ")
+_RECORD = struct.Struct("<4sHHIQ")
+_META = struct.Struct("<I")
+# Values are stored little-endian, whatever the byte order of the host
+_SWAP = sys.byteorder != "little"
+
+
+class SnapshotError(CoreException):
+    """The file is not a snapshot or was written by a newer version."""
+
+
+def _pad(size: int) -> int:
+    return -size % 8
+
+
+def encode_header() -> bytes:
+    """Encode the header of a new snapshot file."""
+    return _HEADER.pack(_MAGIC, SNAPSHOT_VERSION, 0, time.time_ns())
+
+
+def encode_record(tag: bytes, name: str, payload: bytes) -> bytes:
+    """Encode a record.
+
+    Args:
+        tag: The four bytes record type.
+        name: The name of the record.
+        payload: The content of the record.
+
+    Returns:
+        The padded record, ready to be appended to a snapshot file.
+    """
+    encoded = name.encode()
+    return b"".join(
+        (
+            _RECORD.pack(tag, len(encoded), 0, zlib.crc32(payload), len(payload)),
+            encoded,
+            bytes(_pad(_RECORD.size + len(encoded))),
+            payload,
+            bytes(_pad(len(payload))),
+        )
+    )
+
+
+def read_header(view: memoryview, path: Path) -> Tuple[int, int]:
+    """Read the header of a snapshot file.
+
+    Args:
+        view: The content of the file.
+        path: The file, for error messages.
+
+    Returns:
+        The format version and the creation time in nanoseconds.
+
+    Raises:
+        SnapshotError: The file is not a snapshot or is too new.
+    """
+    if len(view) < _HEADER.size:
+        raise SnapshotError(f"{path} is not a snapshot")
+    magic, version, _, created = _HEADER.unpack_from(view)
+    if magic != _MAGIC:
+        raise SnapshotError(f"{path} is not a snapshot")
+    if version > SNAPSHOT_VERSION:
+        raise SnapshotError(
+            f"{path} has version {version}, only {SNAPSHOT_VERSION} is supported"
+        )
+    return version, created
+
+
+def read_records(
+    view: memoryview, path: Path
+) -> Iterator[Tuple[int, bytes, str, memoryview]]:
+    """Read the records of a snapshot file, stopping at a broken one.
+
+    Args:
+        view: The content of the file, its header is skipped.
+        path: The file, for warnings.
+
+    Yields:
+        The offset of the end of the record, its tag, name and payload.
+    """
+    offset = _HEADER.size
+    while offset + _RECORD.size <= len(view):
+        tag, name_size, _, crc, size = _RECORD.unpack_from(view, offset)
+        start = offset + _RECORD.size
+        name_end = start + name_size
+        payload_start = name_end + _pad(_RECORD.size + name_size)
+        end = payload_start + size + _pad(size)
+        payload = view[payload_start : payload_start + size]
+        if end > len(view) or zlib.crc32(payload) != crc:
+            logger.warning(
+                f"Snapshot {path} is truncated at byte {offset}, ignoring the rest"
+            )
+            return
+        yield end, tag, bytes(view[start:name_end]).decode(), payload
+        offset = end
+
+
+def _values(data: memoryview, typecode: str) -> Any:
+    """View stored values in place, or copy them in host byte order."""
+    if not _SWAP:
+        return data.cast(typecode)
+    values = array(typecode, bytes(data))
+    values.byteswap()
+    return values
+
+
+def _to_bytes(values: "array[int]") -> bytes:
+    """Encode values little-endian."""
+    if _SWAP:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _with_meta(meta: Dict[str, Any], data: bytes) -> bytes:
+    encoded = json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode()
+    return b"".join(
+        (
+            _META.pack(len(encoded)),
+            encoded,
+            bytes(_pad(_META.size + len(encoded))),
+            data,
+        )
+    )
+
+
+def _split_meta(payload: memoryview) -> Tuple[Dict[str, Any], memoryview]:
+    (size,) = _META.unpack_from(payload)
+    start = _META.size + size
+    meta = json.loads(bytes(payload[_META.size : start]))
+    return meta, payload[start + _pad(start) :]
+
+
+class _StoreImage:
+    """A card store as read from a snapshot, before it is restored."""
+
+    __slots__ = ("typecode", "names", "owners", "groups", "free", "columns")
+
+    def __init__(self, meta: Dict[str, Any], data: memoryview) -> None:
+        self.typecode: str = meta["typecode"]
+        self.names: List[str] = meta["names"]
+        self.owners: List[Any] = meta["owners"]
+        self.groups: List[Any] = meta["groups"]
+        self.free: List[int] = meta["free"]
+        size = len(self.owners) * array(self.typecode).itemsize
+        # Views of the mapping, nothing is copied until the store grows
+        self.columns: List[Any] = [
+            _values(data[i * size : (i + 1) * size], self.typecode)
+            for i in range(len(self.names))
+        ]
+
+    def apply(self, meta: Dict[str, Any], data: memoryview) -> None:
+        rows: List[int] = meta["rows"]
+        size = max(rows, default=-1) + 1
+        if size > len(self.owners):
+            grow = size - len(self.owners)
+            unset = -(1 << (array(self.typecode).itemsize * 8 - 1))
+            self.columns = [
+                array(self.typecode, column) + array(self.typecode, [unset]) * grow
+                for column in self.columns
+            ]
+            self.owners.extend([None] * grow)
+            self.groups.extend([None] * grow)
+        values = _values(
+            data[: len(rows) * len(self.names) * array(self.typecode).itemsize],
+            self.typecode,
+        )
+        width = len(self.names)
+        for i, row in enumerate(rows):
+            self.owners[row] = meta["owners"][i]
+            self.groups[row] = meta["groups"][i]
+            for slot, column in enumerate(self.columns):
+                column[row] = values[i * width + slot]
+        self.free = meta["free"]
+
+    def encode(self) -> bytes:
+        """Encode the image as the payload of a ``CARD`` record."""
+        meta = {
+            "typecode": self.typecode,
+            "names": self.names,
+            "owners": self.owners,
+            "groups": self.groups,
+            "free": self.free,
+        }
+        return _with_meta(
+            meta,
+            b"".join(
+                _to_bytes(array(self.typecode, column)) for column in self.columns
+            ),
+        )
+
+    def detach(self) -> None:
+        """Copy the columns that are views of the mapping into arrays."""
+        self.columns = [array(self.typecode, column) for column in self.columns]
+
+
+class Snapshot:
+    """The content of a snapshot file.
+
+    The file is memory-mapped copy-on-write: card store columns are restored
+    as views of the mapping and changes to them never reach the file. The
+    mapping must be released before the file is written again, see
+    ``release``.
+
+    Attributes:
+        path: The snapshot file.
+        version: The format version of the file.
+        created: When the file was created, in nanoseconds since the epoch.
+        state: Rule name to rule state.
+    """
+
+    path: Path
+    version: int
+    created: int
+    state: Dict[str, Any]
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self.version = SNAPSHOT_VERSION
+        self.created = 0
+        self.state = {}
+        self._stores: Dict[str, _StoreImage] = {}
+        self._restored: List[CardStore] = []
+        self._mmap: Optional[mmap.mmap] = None
+        self.size = 0
+
+        with self.path.open("rb") as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise SnapshotError(f"{self.path} is not a snapshot")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        view = memoryview(self._mmap)
+        self.version, self.created = read_header(view, self.path)
+
+        self.size = _HEADER.size
+        for end, tag, name, payload in read_records(view, self.path):
+            self.size = end
+            if tag == b"CARD":
+                self._stores[name] = _StoreImage(*_split_meta(payload))
+            elif tag == b"CDLT" and name in self._stores:
+                self._stores[name].apply(*_split_meta(payload))
+            elif tag == b"STAT":
+                if payload:
+                    self.state[name] = pickle.loads(payload)
+                else:
+                    self.state.pop(name, None)
+
+    @property
+    def store_names(self) -> List[str]:
+        """Names of the card stores in the snapshot not restored yet."""
+        return list(self._stores)
+
+    def encode_store(self, name: str) -> bytes:
+        """Encode a card store not restored yet as a ``CARD`` payload."""
+        return self._stores[name].encode()
+
+    def restore_store(self, name: str, store: CardStore) -> bool:
+        """Load a card store from the snapshot.
+
+        Columns are used in place if the type code matches the schema of the
+        store; attributes unknown to the schema are dropped. From then on the
+        store is saved instead of its image in the snapshot.
+
+        Args:
+            name: The name the store was saved under.
+            store: The store to fill.
+
+        Returns:
+            Whether the snapshot has the store.
+        """
+        image = self._stores.pop(name, None)
+        if image is None:
+            return False
+        if image.typecode == store.schema.typecode:
+            columns = dict(zip(image.names, image.columns))
+        else:
+            columns = {
+                name: array(store.schema.typecode, column)
+                for name, column in zip(image.names, image.columns)
+            }
+        store.restore(columns, image.owners, image.groups, image.free)
+        if self._mmap is not None:
+            self._restored.append(store)
+        return True
+
+    def release(self) -> None:
+        """Copy what still views the mapping and close it.
+
+        Restored stores and the images of the stores not restored yet are
+        copied into arrays. The file can not be truncated or replaced on
+        Windows while it is mapped.
+        """
+        if self._mmap is None:
+            return
+        for store in self._restored:
+            store.detach()
+        self._restored.clear()
+        for image in self._stores.values():
+            image.detach()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # A column view escaped, it keeps the mapping alive until dropped
+            logger.warning(f"Snapshot {self.path} is still in use, not unmapped")
+        self._mmap = None
+
+
+def load_snapshot(path: Union[str, Path]) -> Optional[Snapshot]:
+    """Load a snapshot file.
+
+    Args:
+        path: The snapshot file.
+
+    Returns:
+        The snapshot, ``None`` if the file does not exist.
+
+    Raises:
+        SnapshotError: The file is not a snapshot or is too new.
+    """
+    try:
+        return Snapshot(path)
+    except FileNotFoundError:
+        return None
+
+
+class SnapshotWriter:
+    """Write snapshots of card stores and rule state to a file.
+
+    ``prepare`` encodes what changed since the previous call and must run
+    where the stores are modified, usually in the event loop. ``commit``
+    writes it and may run in another thread. A full snapshot is written to a
+    temporary file and renamed over the old one when the appended changes
+    have grown larger than the last full snapshot.
+
+    Stores of the loaded snapshot that are not registered yet are copied
+    from it into full snapshots, so that compacting does not lose them.
+
+    Attributes:
+        path: The snapshot file.
+    """
+
+    path: Path
+
+    def __init__(
+        self, path: Union[str, Path], snapshot: Optional[Snapshot] = None
+    ) -> None:
+        self.path = Path(path)
+        self._full_size = 0
+        self._size = 0
+        self._state_digests: Dict[str, bytes] = {}
+        self._snapshot = snapshot
+        if snapshot is not None:
+            # The file already holds this state, appending goes on from it
+            self._full_size = self._size = snapshot.size
+            self._state_digests = {
+                name: self._digest(pickle.dumps(value))
+                for name, value in snapshot.state.items()
+            }
+        # Name to the token of the store last written in full
+        self._stores_written: Dict[str, int] = {}
+
+    @staticmethod
+    def _digest(data: bytes) -> bytes:
+        return blake2b(data, digest_size=16).digest()
+
+    @property
+    def should_compact(self) -> bool:
+        """Whether the appended changes outgrew the last full snapshot."""
+        return self._full_size == 0 or self._size > 2 * self._full_size
+
+    def prepare(
+        self,
+        stores: Mapping[str, CardStore],
+        state: Mapping[str, Any],
+        *,
+        full: bool = False,
+    ) -> Tuple[bytes, bool]:
+        """Encode the records to write.
+
+        Args:
+            stores: Name to card store.
+            state: Rule name to rule state.
+            full: Whether to encode everything instead of the changes only.
+
+        Returns:
+            The records and whether they are a full snapshot.
+        """
+        if self._snapshot is not None:
+            # commit() rewrites the file, it must not be mapped any more
+            self._snapshot.release()
+        full = full or self.should_compact
+        records: List[bytes] = []
+        for name, store in stores.items():
+            changed = store.pop_changes()
+            if full or self._stores_written.get(name) != store.token:
+                payload = self._encode_store(store)
+                records.append(encode_record(b"CARD", name, payload))
+                self._stores_written[name] = store.token
+            elif changed:
+                payload = self._encode_rows(store, sorted(changed))
+                records.append(encode_record(b"CDLT", name, payload))
+        if full and self._snapshot is not None:
+            for name in self._snapshot.store_names:
+                if name not in stores:
+                    payload = self._snapshot.encode_store(name)
+                    records.append(encode_record(b"CARD", name, payload))
+
+        digests: Dict[str, bytes] = {}
+        for name, value in state.items():
+            try:
+                data = pickle.dumps(value)
+            except Exception as e:
+                logger.warning(f'State of rule "{name}" cannot be pickled: {e!r}')
+                continue
+            digests[name] = digest = self._digest(data)
+            if full or self._state_digests.get(name) != digest:
+                records.append(encode_record(b"STAT", name, data))
+        if not full:
+            for name in self._state_digests.keys() - digests.keys():
+                records.append(encode_record(b"STAT", name, b""))
+        self._state_digests = digests
+        return b"".join(records), full
+
+    def commit(self, records: bytes, full: bool) -> None:
+        """Write encoded records, this blocks on file IO.
+
+        Args:
+            records: What ``prepare`` returned.
+            full: Whether the records are a full snapshot.
+        """
+        try:
+            self._write(records, full)
+        except BaseException:
+            # Whether the records reached the file is unknown
+            self._full_size = 0
+            raise
+
+    def _write(self, records: bytes, full: bool) -> None:
+        if full:
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with tmp.open("wb") as f:
+                f.write(encode_header())
+                f.write(records)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self._full_size = self._size = _HEADER.size + len(records)
+        elif records:
+            with self.path.open("r+b") as f:
+                # Drop a record left half-written by a crash
+                f.truncate(self._size)
+                f.seek(self._size)
+                f.write(records)
+                f.flush()
+                os.fsync(f.fileno())
+            self._size += len(records)
+
+    @staticmethod
+    def _encode_store(store: CardStore) -> bytes:
+        meta = {
+            "typecode": store.schema.typecode,
+            "names": list(store.schema.names),
+            "owners": list(store.owners),
+            "groups": list(store.groups),
+            "free": list(store.free_rows),
+        }
+        return _with_meta(
+            meta,
+            b"".join(
+                _to_bytes(array(store.schema.typecode, store.column(name)))
+                for name in store.schema.names
+            ),
+        )
+
+    @staticmethod
+    def _encode_rows(store: CardStore, rows: List[int]) -> bytes:
+        meta = {
+            "rows": rows,
+            "owners": [store.owners[row] for row in rows],
+            "groups": [store.groups[row] for row in rows],
+            "free": list(store.free_rows),
+        }
+        columns = [store.column(name) for name in store.schema.names]
+        values = array(
+            store.schema.typecode,
+            (column[row] for row in rows for column in columns),
+        )
+        return _with_meta(meta, _to_bytes(values))
@@ -0,0 +1,538 @@
+"""Storage backends of rule state.
+
+``Core.rule_state`` maps rule names to their state. Which backend holds it is
+chosen by the ``core.state`` configuration:
+
+``memory``
+    A dictionary in the process, optionally bounded by a number of rules
+    (least recently used state is evicted first) and a time to live.
+``sqlite``
+    A SQLite database in WAL mode.
+``mmap``
+    A memory-mapped key/value file in the snapshot format, see
+    ``hrc.snapshot``.
+
+The persistent backends keep the state they have read or written in memory
+and write changes behind: changed names are collected and written in one
+transaction, in a thread, when ``flush()`` is called. The core flushes every
+``flush_interval`` seconds and as soon as ``max_pending`` names are waiting.
+Mutable state read by a rule may be changed in place, so it is written back
+too.
+
+Reads are served from memory when possible. The ``sqlite`` backend loads the
+stored state on ``open()``, up to ``max_size`` rules, and state evicted or not
+loaded then is read from the database in the event loop: keep ``max_size``
+above the number of rules with state to avoid these blocking reads. Listing
+the rules of a persistent backend also queries what it stores.
+"""
+
+import asyncio
+import mmap
+import os
+import pickle
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import (
+    Any,
+    ClassVar,
+    Dict,
+    Iterator,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from hrc.config import StateConfig
+from hrc.log import logger
+from hrc.snapshot import encode_header, encode_record, read_header, read_records
+
+__all__ = [
+    "MemoryStateBackend",
+    "MmapStateBackend",
+    "SQLiteStateBackend",
+    "StateBackend",
+    "create_state_backend",
+]
+
+# Values of these types cannot be changed in place
+_IMMUTABLE = (type(None), bool, int, float, complex, str, bytes, tuple, frozenset)
+
+
+class StateBackend(MutableMapping, ABC):  # type: ignore[type-arg]
+    """Rule name to rule state.
+
+    Attributes:
+        persistent: Whether the state outlives the process.
+    """
+
+    persistent: ClassVar[bool] = False
+
+    async def open(self) -> None:
+        """Open the backend, called before the core runs."""
+
+    async def flush(self) -> None:
+        """Write pending changes."""
+
+    async def close(self) -> None:
+        """Write pending changes and close the backend."""
+        await self.flush()
+
+    async def wait_for_flush(self, timeout: float) -> None:
+        """Wait until a flush is due or ``timeout`` seconds have passed."""
+        await asyncio.sleep(timeout)
+
+
+class MemoryStateBackend(StateBackend):
+    """Rule state in a dictionary, lost when the process exits.
+
+    Attributes:
+        max_size: Maximum number of rules with state, the state of the least
+            recently used rule is evicted first. Unbounded if ``None``.
+        ttl: Seconds after which the state of a rule not used since is
+            evicted. Never if ``None``.
+    """
+
+    max_size: Optional[int]
+    ttl: Optional[float]
+
+    def __init__(
+        self, max_size: Optional[int] = None, ttl: Optional[float] = None
+    ) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+
+    def _deadline(self) -> float:
+        return float("inf") if self.ttl is None else time.monotonic() + self.ttl
+
+    def _alive(self, name: str) -> bool:
+        item = self._data.get(name)
+        if item is None:
+            return False
+        if item[1] < time.monotonic():
+            del self._data[name]
+            return False
+        return True
+
+    def __getitem__(self, name: str) -> Any:
+        if not self._alive(name):
+            raise KeyError(name)
+        value = self._data[name][0]
+        self._data[name] = (value, self._deadline())
+        self._data.move_to_end(name)
+        return value
+
+    def __setitem__(self, name: str, value: Any) -> None:
+        self._data[name] = (value, self._deadline())
+        self._data.move_to_end(name)
+        if self.max_size is not None:
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def __delitem__(self, name: str) -> None:
+        if not self._alive(name):
+            raise KeyError(name)
+        del self._data[name]
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and self._alive(name)
+
+    def __iter__(self) -> Iterator[str]:
+        now = time.monotonic()
+        return iter([name for name, (_, d) in self._data.items() if d >= now])
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def copy(self) -> Dict[str, Any]:
+        """The state of all rules, without changing the eviction order."""
+        now = time.monotonic()
+        return {name: value for name, (value, d) in self._data.items() if d >= now}
+
+
+class _WriteBehindBackend(StateBackend):
+    """A persistent backend with a read cache and batched writes.
+
+    Subclasses read and write pickled state, ``_write`` runs in a thread.
+    """
+
+    persistent = True
+
+    def __init__(
+        self, max_size: Optional[int] = None, max_pending: int = 100
+    ) -> None:
+        self.max_size = max_size
+        self.max_pending = max_pending
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()
+        # Names to write, those missing from the cache are deleted
+        self._dirty: Set[str] = set()
+        self._flush_due: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @abstractmethod
+    def _load(self, name: str) -> bytes:
+        """Read the pickled state of a rule, raise ``KeyError`` if none."""
+
+    @abstractmethod
+    def _stored_names(self) -> Set[str]:
+        """The names of the rules with stored state."""
+
+    def _prepare_write(self, batch: Dict[str, Optional[bytes]]) -> Any:
+        """Called in the event loop with the batch, returns what to pass to
+        ``_write``."""
+        return batch
+
+    @abstractmethod
+    def _write(self, batch: Any) -> Any:
+        """Store pickled state, ``None`` deletes it. Runs in a thread."""
+
+    def _written(self, result: Any) -> None:
+        """Called in the event loop with what ``_write`` returned."""
+
+    async def open(self) -> None:
+        self._flush_due = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    def _mark(self, name: str) -> None:
+        self._dirty.add(name)
+        if len(self._dirty) >= self.max_pending and self._flush_due is not None:
+            self._flush_due.set()
+
+    def __getitem__(self, name: str) -> Any:
+        if name in self._cache:
+            self._cache.move_to_end(name)
+            value = self._cache[name]
+        elif name in self._dirty:
+            # Deleted, not written yet
+            raise KeyError(name)
+        else:
+            value = self._cache[name] = pickle.loads(self._load(name))
+        if not isinstance(value, _IMMUTABLE):
+            self._mark(name)
+        return value
+
+    def __setitem__(self, name: str, value: Any) -> None:
+        self._cache[name] = value
+        self._cache.move_to_end(name)
+        self._mark(name)
+
+    def __delitem__(self, name: str) -> None:
+        if name not in self:
+            raise KeyError(name)
+        self._cache.pop(name, None)
+        self._mark(name)
+
+    def __contains__(self, name: object) -> bool:
+        if not isinstance(name, str):
+            return False
+        if name in self._cache:
+            return True
+        if name in self._dirty:
+            return False
+        try:
+            self._cache[name] = pickle.loads(self._load(name))
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[str]:
+        deleted = self._dirty - self._cache.keys()
+        return iter((self._stored_names() - deleted) | self._cache.keys())
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    async def wait_for_flush(self, timeout: float) -> None:
+        assert self._flush_due is not None
+        try:
+            await asyncio.wait_for(self._flush_due.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def flush(self) -> None:
+        if self._lock is None:
+            return
+        async with self._lock:
+            if self._flush_due is not None:
+                self._flush_due.clear()
+            if not self._dirty:
+                return
+            batch: Dict[str, Optional[bytes]] = {}
+            for name in self._dirty:
+                if name not in self._cache:
+                    batch[name] = None
+                    continue
+                try:
+                    batch[name] = pickle.dumps(self._cache[name])
+                except Exception as e:
+                    logger.warning(
+                        f'State of rule "{name}" cannot be pickled: {e!r}'
+                    )
+            self._dirty.clear()
+            try:
+                result = await asyncio.to_thread(
+                    self._write, self._prepare_write(batch)
+                )
+            except BaseException:
+                self._dirty.update(batch)
+                raise
+            self._written(result)
+            self._evict()
+
+    def _evict(self) -> None:
+        if self.max_size is None:
+            return
+        for name in list(self._cache):
+            if len(self._cache) <= self.max_size:
+                break
+            if name not in self._dirty:
+                del self._cache[name]
+
+
+class SQLiteStateBackend(_WriteBehindBackend):
+    """Rule state in a SQLite database in WAL mode.
+
+    Reads use their own connection so they do not wait for a flush.
+
+    Attributes:
+        path: The database file.
+    """
+
+    path: Path
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        max_size: Optional[int] = None,
+        max_pending: int = 100,
+    ) -> None:
+        super().__init__(max_size, max_pending)
+        self.path = Path(path)
+        self._reader: Optional[sqlite3.Connection] = None
+        self._writer: Optional[sqlite3.Connection] = None
+
+    async def open(self) -> None:
+        await super().open()
+        self._writer = sqlite3.connect(self.path, check_same_thread=False)
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+        self._writer.execute(
+            "CREATE TABLE IF NOT EXISTS rule_state "
+            "(name TEXT PRIMARY KEY, value BLOB NOT NULL)"
+        )
+        self._writer.commit()
+        self._reader = sqlite3.connect(self.path)
+        self._cache.update(await asyncio.to_thread(self._preload))
+
+    def _preload(self) -> Dict[str, Any]:
+        """Read up to ``max_size`` stored states, runs in a thread."""
+        assert self._writer is not None
+        query = "SELECT name, value FROM rule_state"
+        if self.max_size is not None:
+            query += f" LIMIT {int(self.max_size)}"
+        return {
+            name: pickle.loads(value)
+            for name, value in self._writer.execute(query)
+        }
+
+    def _load(self, name: str) -> bytes:
+        if self._reader is None:
+            raise KeyError(name)
+        row = self._reader.execute(
+            "SELECT value FROM rule_state WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return row[0]
+
+    def _stored_names(self) -> Set[str]:
+        if self._reader is None:
+            return set()
+        rows = self._reader.execute("SELECT name FROM rule_state")
+        return {name for (name,) in rows}
+
+    def _write(self, batch: Dict[str, Optional[bytes]]) -> None:
+        assert self._writer is not None
+        with self._writer:
+            self._writer.executemany(
+                "INSERT OR REPLACE INTO rule_state VALUES (?, ?)",
+                [(name, value) for name, value in batch.items() if value is not None],
+            )
+            self._writer.executemany(
+                "DELETE FROM rule_state WHERE name = ?",
+                [(name,) for name, value in batch.items() if value is None],
+            )
+
+    async def close(self) -> None:
+        await super().close()
+        for connection in (self._reader, self._writer):
+            if connection is not None:
+                connection.close()
+        self._reader = self._writer = None
+
+
+class MmapStateBackend(_WriteBehindBackend):
+    """Rule state in a memory-mapped key/value file.
+
+    The file is a snapshot holding ``STAT`` records only. Changes are
+    appended and the file is mapped again; when it has grown to twice the
+    size of the live records, it is rewritten with those only. The file is
+    unmapped while it is written, which Windows requires, and reads are
+    served from the file or from the records being rewritten meanwhile.
+
+    Attributes:
+        path: The key/value file.
+    """
+
+    path: Path
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        max_size: Optional[int] = None,
+        max_pending: int = 100,
+    ) -> None:
+        super().__init__(max_size, max_pending)
+        self.path = Path(path)
+        self._mmap: Optional[mmap.mmap] = None
+        # Name to the offset and size of its payload in the file
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._size = 0
+        # Live payloads while the file is rewritten
+        self._copies: Dict[str, bytes] = {}
+
+    async def open(self) -> None:
+        await super().open()
+        if not self.path.exists():
+            with self.path.open("wb") as f:
+                f.write(encode_header())
+        self._map()
+        assert self._mmap is not None
+        view = memoryview(self._mmap)
+        try:
+            read_header(view, self.path)
+            self._size = len(encode_header())
+            for end, tag, name, payload in read_records(view, self.path):
+                self._size = end
+                if tag != b"STAT":
+                    continue
+                if payload:
+                    start = end - len(payload) - (-len(payload) % 8)
+                    self._index[name] = (start, len(payload))
+                else:
+                    self._index.pop(name, None)
+                payload.release()
+        finally:
+            view.release()
+
+    def _map(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+        with self.path.open("rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _load(self, name: str) -> bytes:
+        start, size = self._index[name]
+        if self._mmap is not None:
+            return self._mmap[start : start + size]
+        if name in self._copies:
+            return self._copies[name]
+        # Being written, the records already in the file do not move
+        with self.path.open("rb") as f:
+            f.seek(start)
+            return f.read(size)
+
+    def _stored_names(self) -> Set[str]:
+        return set(self._index)
+
+    def _prepare_write(
+        self, batch: Dict[str, Optional[bytes]]
+    ) -> Tuple[Dict[str, Optional[bytes]], bool]:
+        live = sum(
+            size for name, (_, size) in self._index.items() if name not in batch
+        )
+        live += sum(len(value) for value in batch.values() if value is not None)
+        rewrite = self._size > 2 * live + 4096
+        if rewrite:
+            # Rewrite the live records only
+            self._copies = {name: self._load(name) for name in self._index}
+            batch = {**self._copies, **batch}
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        return batch, rewrite
+
+    def _write(
+        self, prepared: Tuple[Dict[str, Optional[bytes]], bool]
+    ) -> Tuple[Dict[str, Tuple[int, int]], int]:
+        batch, rewrite = prepared
+        records = []
+        if rewrite:
+            offset = len(encode_header())
+            records.append(encode_header())
+            index: Dict[str, Tuple[int, int]] = {}
+        else:
+            offset = self._size
+            index = dict(self._index)
+        for name, value in batch.items():
+            record = encode_record(b"STAT", name, value or b"")
+            if value:
+                start = offset + len(record) - len(value) - (-len(value) % 8)
+                index[name] = (start, len(value))
+            else:
+                index.pop(name, None)
+            records.append(record)
+            offset += len(record)
+
+        if rewrite:
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with tmp.open("wb") as f:
+                f.write(b"".join(records))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        else:
+            with self.path.open("r+b") as f:
+                # Drop a record left half-written by a crash
+                f.truncate(self._size)
+                f.seek(self._size)
+                f.write(b"".join(records))
+                f.flush()
+                os.fsync(f.fileno())
+        return index, offset
+
+    def _written(self, result: Tuple[Dict[str, Tuple[int, int]], int]) -> None:
+        self._index, self._size = result
+        self._copies = {}
+        self._map()
+
+    async def close(self) -> None:
+        await super().close()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+
+def create_state_backend(config: StateConfig) -> StateBackend:
+    """Create the state backend chosen by the configuration.
+
+    Args:
+        config: The ``core.state`` configuration.
+
+    Returns:
+        The backend, not opened yet.
+    """
+    if config.backend == "sqlite":
+        return SQLiteStateBackend(
+            config.path or "state.sqlite3", config.max_size, config.max_pending
+        )
+    if config.backend == "mmap":
+        return MmapStateBackend(
+            config.path or "state.kv", config.max_size, config.max_pending
+        )
+    return MemoryStateBackend(config.max_size, config.ttl)
@@ -1,4 +1,10 @@
+use pyo3::exceptions::{PyOverflowError, PyValueError, PyZeroDivisionError};
 use pyo3::prelude::*;
+use pyo3::types::PyBytes;
+use rand::rngs::StdRng;
+use rand::SeedableRng;
+
+mod dice;
 
 #[pyfunction]
 fn sum_as_string(a: usize, b: usize) -> PyResult<String> {
@@ -16,9 +22,96 @@ impl Base {
     }
 }
 
+fn dice_error(error: dice::DiceError) -> PyErr {
+    match error {
+        dice::DiceError::DivisionByZero => PyZeroDivisionError::new_err(error.to_string()),
+        dice::DiceError::Overflow => PyOverflowError::new_err(error.to_string()),
+        _ => PyValueError::new_err(error.to_string()),
+    }
+}
+
+/// Copy a slice into an `array.array`, `typecode` must match `T` (`q` for
+/// i64, `d` for f64) as the array has the layout of the slice in native byte
+/// order.
+fn to_array<'py, T: Copy>(py: Python<'py>, typecode: &str, values: &[T]) -> PyResult<&'py PyAny> {
+    let bytes = unsafe {
+        std::slice::from_raw_parts(values.as_ptr() as *const u8, std::mem::size_of_val(values))
+    };
+    let array = py.import("array")?.getattr("array")?.call1((typecode,))?;
+    array.call_method1("frombytes", (PyBytes::new(py, bytes),))?;
+    Ok(array)
+}
+
+/// A compiled dice expression such as `3d6`, `2d6+6`, `4d6k3` or `b1`.
+#[pyclass(frozen, module = "hrc._core")]
+pub struct DiceExpr {
+    program: dice::Program,
+}
+
+#[pymethods]
+impl DiceExpr {
+    #[new]
+    fn py_new(expression: &str) -> PyResult<Self> {
+        dice::Program::compile(expression)
+            .map(|program| DiceExpr { program })
+            .map_err(dice_error)
+    }
+
+    /// The source expression.
+    #[getter]
+    fn expression(&self) -> &str {
+        &self.program.source
+    }
+
+    /// Roll once.
+    #[pyo3(signature = (seed=None))]
+    fn roll(&self, seed: Option<u64>) -> PyResult<i64> {
+        match seed {
+            Some(seed) => self.program.roll(&mut StdRng::seed_from_u64(seed)),
+            None => self.program.roll(&mut rand::thread_rng()),
+        }
+        .map_err(dice_error)
+    }
+
+    /// Roll `n` times without holding the GIL, the results are returned as
+    /// an `array.array` of signed 64-bit integers.
+    #[pyo3(signature = (n, seed=None))]
+    fn roll_many<'py>(&self, py: Python<'py>, n: usize, seed: Option<u64>) -> PyResult<&'py PyAny> {
+        let program = &self.program;
+        let values = py
+            .allow_threads(|| match seed {
+                Some(seed) => program.roll_many(&mut StdRng::seed_from_u64(seed), n),
+                None => program.roll_many(&mut rand::thread_rng(), n),
+            })
+            .map_err(dice_error)?;
+        to_array(py, "q", &values)
+    }
+
+    /// The exact distribution, computed without holding the GIL. Returns the
+    /// smallest value and an `array.array` of doubles, the probability of
+    /// each value from the smallest one on.
+    fn pmf<'py>(&self, py: Python<'py>) -> PyResult<(i64, &'py PyAny)> {
+        let program = &self.program;
+        let dist = py.allow_threads(|| program.distribution()).map_err(dice_error)?;
+        Ok((dist.min, to_array(py, "d", &dist.pmf)?))
+    }
+
+    fn __repr__(&self) -> String {
+        format!("DiceExpr({:?})", self.program.source)
+    }
+}
+
+/// Parse and compile a dice expression.
+#[pyfunction]
+fn compile_dice(expression: &str) -> PyResult<DiceExpr> {
+    DiceExpr::py_new(expression)
+}
+
 #[pymodule]
 fn _core(_py: Python<'_>, m: &PyModule) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(sum_as_string, m)?)?;
+    m.add_function(wrap_pyfunction!(compile_dice, m)?)?;
     m.add_class::<Base>()?;
+    m.add_class::<DiceExpr>()?;
     Ok(())
-}
\ No newline at end of file
+}
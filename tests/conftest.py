@@ -0,0 +1,24 @@
+from typing import List
+
+import pytest
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config: pytest.Config) -> None:
+    # Benchmarks only run with --benchmark-enable, when pytest-benchmark is
+    # installed
+    if config.pluginmanager.hasplugin("benchmark"):
+        config.option.benchmark_disable = True
+    else:
+        config.addinivalue_line("markers", "benchmark: needs pytest-benchmark")
+
+
+def pytest_collection_modifyitems(
+    config: pytest.Config, items: List[pytest.Item]
+) -> None:
+    if config.pluginmanager.hasplugin("benchmark"):
+        return
+    skip = pytest.mark.skip(reason="pytest-benchmark is not installed")
+    for item in items:
+        if item.get_closest_marker("benchmark") is not None:
+            item.add_marker(skip)
@@ -0,0 +1,97 @@
+"""Per-event cost of building a rule instance through ``Depends``.
+
+Run with ``nox -s bench`` (or ``pytest --benchmark-enable``) to compare
+resolution by reflection on every event with the cached injection plans.
+"""
+
+import asyncio
+import inspect
+from contextlib import AsyncExitStack
+from typing import Any, Dict
+
+import pytest
+
+from hrc.dependencies import Depends, InnerDepends, solve_dependencies
+from hrc.utils import get_annotations
+
+pytest.importorskip("pytest_benchmark")
+
+EVENTS = 1000
+
+
+class Attributes:
+    pass
+
+
+class Wiki:
+    pass
+
+
+class Command:
+    pass
+
+
+class Event:
+    pass
+
+
+class COC7:
+    event: Event = Depends(Event)
+    attr: Attributes = Depends()
+    wiki: Wiki = Depends()
+    cmd: Command = Depends()
+
+
+async def solve_by_reflection(
+    dependent: Any, dependency_cache: Dict[Any, Any]
+) -> Any:
+    """Resolution as it was done before injection plans were cached."""
+    if dependent in dependency_cache:
+        return dependency_cache[dependent]
+    values: Dict[str, Any] = {}
+    ann = get_annotations(dependent)
+    for name, sub_dependent in inspect.getmembers(
+        dependent, lambda x: isinstance(x, InnerDepends)
+    ):
+        values[name] = await solve_by_reflection(
+            sub_dependent.dependency or ann[name], dependency_cache
+        )
+    depend_obj = dependent.__new__(dependent)
+    for key, value in values.items():
+        setattr(depend_obj, key, value)
+    depend_obj.__init__()
+    dependency_cache[dependent] = depend_obj
+    return depend_obj
+
+
+def resolve_by_reflection() -> None:
+    async def main() -> None:
+        for _ in range(EVENTS):
+            async with AsyncExitStack():
+                await solve_by_reflection(COC7, {Event: Event()})
+
+    asyncio.run(main())
+
+
+def resolve_by_plan() -> None:
+    async def main() -> None:
+        for _ in range(EVENTS):
+            async with AsyncExitStack() as stack:
+                await solve_dependencies(
+                    COC7,
+                    use_cache=True,
+                    stack=stack,
+                    dependency_cache={Event: Event()},
+                )
+
+    asyncio.run(main())
+
+
+@pytest.mark.benchmark(group="dependencies")
+def test_bench_resolve_by_reflection(benchmark: Any):
+    benchmark(resolve_by_reflection)
+
+
+@pytest.mark.benchmark(group="dependencies")
+def test_bench_resolve_by_plan(benchmark: Any):
+    benchmark(resolve_by_plan)
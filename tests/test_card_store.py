@@ -0,0 +1,131 @@
+from array import array
+
+import pytest
+
+from hrc.rule.BaseRule.CardStore import CardStore
+from hrc.rule.BaseRule.CharacterCard import CardSchema
+
+SCHEMA = CardSchema(["STR", "POW", "SAN"])
+
+
+def make_store() -> CardStore:
+    store = CardStore(SCHEMA, indexes=["SAN"])
+    store.add("alice", "g1", {"STR": 50, "SAN": 45})
+    store.add("bob", "g1", {"STR": 60, "SAN": 20})
+    store.add("bob", "g2", {"STR": 60, "SAN": 70})
+    store.add("carol", "g2", {"POW": 80})
+    return store
+
+
+def test_cards_are_found_by_owner_and_group():
+    store = make_store()
+
+    card = store.get("bob", "g2")
+    assert card is not None and dict(card) == {"STR": 60, "SAN": 70}
+    assert store.get("bob") is None
+    assert [c.group for c in store.by_owner("bob")] == ["g1", "g2"]
+    assert [c.owner for c in store.by_group("g1")] == ["alice", "bob"]
+    assert len(store) == 4 and ("carol", "g2") in store
+
+
+def test_range_queries_follow_updates():
+    store = make_store()
+    san = store.range("SAN", high=29)
+    assert [store.cards([row])[0].owner for row in san] == ["bob"]
+
+    card = store.get("alice", "g1")
+    card["SAN"] -= 30  # type: ignore
+    assert [c.owner for c in store.cards(store.range("SAN", high=29))] == [
+        "alice",
+        "bob",
+    ]
+    del card["SAN"]  # type: ignore
+    assert store.range("SAN") == sorted(store.range("SAN", 0, 100))
+    assert len(store.range("SAN")) == 2
+    with pytest.raises(KeyError):
+        store.range("STR")
+
+
+def test_bulk_update_and_row_reuse():
+    store = make_store()
+    group = [c.row for c in store.by_group("g1")]
+    store.update("SAN", group, lambda san: san - 10)
+    assert [store.column("SAN")[row] for row in group] == [35, 10]
+    assert store.range("SAN", 30, 40) == [group[0]]
+
+    assert store.remove("alice", "g1") and not store.remove("alice", "g1")
+    assert store.by_owner("alice") == []
+    assert store.add("dave", "g1", {"SAN": 99}).row == group[0]
+    assert store.range("SAN", 90) == [group[0]]
+
+
+def test_removed_cards_do_not_reach_the_reused_row():
+    store = make_store()
+    alice = store.get("alice", "g1")
+    assert alice is not None
+    with pytest.raises(OverflowError):
+        alice["SAN"] = SCHEMA.unset
+
+    store.remove("alice", "g1")
+    dave = store.add("dave", "g1", {"SAN": 99})
+    assert dave.row == alice.row
+    with pytest.raises(ReferenceError):
+        alice["SAN"]
+    with pytest.raises(ReferenceError):
+        alice["SAN"] = 10
+    assert dict(dave) == {"SAN": 99}
+
+    store.restore(
+        {name: store.column(name) for name in SCHEMA.names},
+        store.owners,
+        store.groups,
+        store.free_rows,
+    )
+    with pytest.raises(ReferenceError):
+        dave.owner
+    assert store.get("dave", "g1") == {"SAN": 99}
+
+
+def test_rejected_values_change_nothing():
+    store = make_store()
+    rows = store.range("SAN")
+    with pytest.raises(OverflowError):
+        store.update("SAN", [0], 40000)
+    with pytest.raises(OverflowError):
+        # Enough rows to rebuild the index instead of moving entries
+        store.update("SAN", [0, 1, 2, 3], [1, 2, 3, 40000])
+    assert store.range("SAN") == rows
+    assert store.column("SAN")[0] == 45
+
+    store.update("SAN", [0], 10)
+    assert store.range("SAN", high=31) == [0, 1]
+
+    with pytest.raises(KeyError):
+        store.add("dave", "g3", {"SAN": 50, "LUCK": 1})
+    with pytest.raises(OverflowError):
+        store.add("dave", "g3", {"SAN": 50, "STR": 40000})
+    with pytest.raises(OverflowError):
+        store.add("alice", "g1", {"SAN": 40000})
+    assert len(store) == 4 and store.get("dave", "g3") is None
+    assert store.get("alice", "g1") == {"STR": 50, "SAN": 10}
+    assert store.range("SAN") == [0, 1, 2]
+
+
+def test_free_rows_are_not_updated_or_inherited():
+    store = make_store()
+    store.remove("alice", "g1")
+    with pytest.raises(ValueError):
+        store.update("SAN", [0], 5)
+    assert 0 not in store.range("SAN")
+
+    # A restored free row may still hold values, they are not indexed or kept
+    store.restore(
+        {"SAN": array(SCHEMA.typecode, [5, 20, 70, SCHEMA.unset])},
+        store.owners,
+        store.groups,
+        store.free_rows,
+    )
+    assert store.range("SAN") == [1, 2]
+    card = store.add("dave", "g3", {"STR": 9})
+    assert card.row == 0 and dict(card) == {"STR": 9}
+    assert store.range("SAN") == [1, 2]
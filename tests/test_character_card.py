@@ -0,0 +1,154 @@
+import sys
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import pytest
+
+from hrc.rule.BaseRule.CharacterCard import (
+    Attribute,
+    CardSchema,
+    generate_cards,
+)
+
+
+def test_cards_are_generated_column_wise():
+    np = pytest.importorskip("numpy")
+    cards = generate_cards(
+        1000,
+        {"STR": "3d6", "SIZ": "2d6+6"},
+        {
+            "HP": lambda cards: (cards["STR"] + cards["SIZ"] + 1) // 2,
+            "MOV": lambda cards: 10,
+            "BIG": lambda cards: np.where(cards["SIZ"] > 15, "yes", "no"),
+        },
+        seed=1,
+    )
+
+    assert cards.shape == (1000,)
+    assert cards.dtype.names == ("STR", "SIZ", "HP", "MOV", "BIG")
+    assert cards["STR"].min() >= 3 and cards["STR"].max() <= 18
+    assert cards["SIZ"].min() >= 8 and cards["SIZ"].max() <= 18
+    assert (cards["HP"] == (cards["STR"] + cards["SIZ"] + 1) // 2).all()
+    assert (cards["MOV"] == 10).all()
+    assert set(cards["BIG"]) <= {"yes", "no"}
+
+
+def test_seeded_generation_is_reproducible():
+    pytest.importorskip("numpy")
+    rolls = {"STR": "3d6", "CON": "3d6"}
+    first = generate_cards(100, rolls, seed=7)
+    assert (generate_cards(100, rolls, seed=7) == first).all()
+    assert not (first["STR"] == first["CON"]).all()
+
+
+class Attributes(Attribute):
+    calls: List[str]
+
+    def MAX_HP(self) -> Optional[int]:
+        self.calls.append("MAX_HP")
+        if hasattr(self, "CON") and hasattr(self, "SIZ"):
+            return (self.CON() + self.SIZ()) // 10
+        return None
+
+    def HP(self) -> Optional[int]:
+        self.calls.append("HP")
+        return self.MAX_HP()
+
+    def MP(self) -> int:
+        self.calls.append("MP")
+        return self.POW() // 5
+
+
+def make_card() -> Attributes:
+    card = Attributes()
+    card.calls = []
+    card.update({"CON": 50, "SIZ": 60, "POW": 70})
+    return card
+
+
+def test_derived_attributes_are_memoized():
+    card = make_card()
+    assert (card.HP(), card["MP"]) == (11, 14)
+    assert (card.HP(), card.MP()) == (11, 14)
+    assert card.calls == ["HP", "MAX_HP", "MP"]
+
+
+def test_only_affected_attributes_are_recomputed():
+    card = make_card()
+    card.HP(), card.MP()
+    card.calls.clear()
+
+    card["CON"] = 60
+    assert (card.HP(), card.MP()) == (12, 14)
+    assert card.calls == ["HP", "MAX_HP"]
+
+
+def test_explicit_values_override_derived_ones():
+    card = make_card()
+    card["HP"] = 3
+    assert card.HP() == 3
+    del card["HP"]
+    assert card.HP() == 11
+
+
+def test_unset_attributes_are_tracked():
+    card = Attributes()
+    card.calls = []
+    assert card.MAX_HP() is None
+    assert "CON" not in card
+    card.update({"CON": 50, "SIZ": 50})
+    assert card.MAX_HP() == 10
+
+
+SKILLS = [f"SKILL_{i}" for i in range(50)]
+
+
+def test_card_is_a_compact_mapping():
+    schema = CardSchema(["STR", "CON", "SIZ", *SKILLS])
+    card = schema.new({"STR": 50, "SKILL_3": 25})
+
+    assert dict(card) == {"STR": 50, "SKILL_3": 25}
+    assert "CON" not in card and len(card) == 2
+    with pytest.raises(KeyError):
+        card["CON"]
+    with pytest.raises(KeyError):
+        card["LUCK"] = 50
+    del card["STR"]
+    assert card.get("STR") is None
+    assert not hasattr(card, "__dict__")
+
+
+def test_card_is_an_order_of_magnitude_smaller():
+    @dataclass
+    class Sheet:
+        values: Dict[str, int]
+
+    names = ["STR", "CON", "SIZ", "DEX", "APP", "INT", "POW", *SKILLS]
+    values = {name: 300 + i for i, name in enumerate(names)}
+    sheet = Sheet(dict(values))
+    card = CardSchema(names).new(values)
+
+    sheet_size = (
+        sys.getsizeof(sheet)
+        + sys.getsizeof(sheet.__dict__)
+        + sys.getsizeof(sheet.values)
+        + sum(sys.getsizeof(x) for x in sheet.values.values())
+    )
+    card_size = sys.getsizeof(card) + sys.getsizeof(card.data)
+    assert card_size * 10 <= sheet_size
+
+
+def test_attributes_view_a_stored_card():
+    class Stored(Attributes):
+        __schema__ = CardSchema(["CON", "SIZ", "POW"])
+
+    card = Stored.__schema__.new({"CON": 50, "SIZ": 60, "POW": 70})
+    attributes = Stored.view(card)
+    attributes.calls = []
+    assert attributes.HP() == 11
+
+    attributes["CON"] = 60
+    assert card["CON"] == 60
+    assert attributes.HP() == 12
+    with pytest.raises(KeyError):
+        attributes["HP"] = 3
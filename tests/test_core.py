@@ -0,0 +1,483 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Union
+
+import pytest
+
+from hrc.core import Core
+from hrc.event import Event, MessageEvent
+from hrc.exceptions import GetEventTimeout
+from hrc.rule import Rule
+
+
+class FakeService:
+    name = "fake"
+
+    def __init__(self, core: Core) -> None:
+        self.core = core
+
+
+class FakeEvent(Event[Any]):
+    message: str = ""
+    session: Optional[str] = None
+
+    def get_session_id(self) -> Union[None, int, str]:
+        return self.session
+
+
+def make_event(
+    core: Core, message: str = "", session: Optional[str] = None
+) -> FakeEvent:
+    return FakeEvent(
+        service=FakeService(core),
+        type="message",
+        rule="",
+        message=message,
+        session=session,
+    )
+
+
+async def start_core(core: Core) -> None:
+    core._reload_config_dict()
+    core.should_exit = asyncio.Event()
+    core._start_event_workers()
+
+
+def test_rules_are_bucketed_by_priority():
+    core = Core(config_dict={})
+
+    class Late(Rule):
+        priority = 5
+
+    class Early(Rule):
+        priority = 1
+
+    class AlsoEarly(Rule):
+        priority = 1
+
+    core.load_rules(Late, Early, AlsoEarly)
+
+    assert [p for p, _ in core._rule_buckets] == [1, 5]
+    assert core.rules == [Early, AlsoEarly, Late]
+
+
+def test_rules_in_one_bucket_run_concurrently():
+    core = Core(config_dict={})
+    calls: List[str] = []
+    gate = asyncio.Event()
+
+    class Waiter(Rule):
+        priority = 0
+
+        async def rule(self) -> bool:
+            return True
+
+        async def handle(self) -> None:
+            await gate.wait()
+            calls.append("waiter")
+
+    class Opener(Rule):
+        priority = 0
+
+        async def rule(self) -> bool:
+            return True
+
+        async def handle(self) -> None:
+            gate.set()
+            calls.append("opener")
+
+    core.load_rules(Waiter, Opener)
+
+    async def main() -> None:
+        await asyncio.wait_for(core._handle_event(make_event(core)), 1)
+
+    asyncio.run(main())
+    assert calls == ["opener", "waiter"]
+
+
+def test_block_stops_at_bucket_boundary():
+    core = Core(config_dict={})
+    calls: List[str] = []
+
+    class Blocker(Rule):
+        priority = 0
+        block = True
+
+        async def rule(self) -> bool:
+            return True
+
+        async def handle(self) -> None:
+            calls.append("blocker")
+
+    class Sibling(Rule):
+        priority = 0
+
+        async def rule(self) -> bool:
+            return True
+
+        async def handle(self) -> None:
+            calls.append("sibling")
+
+    class Lower(Rule):
+        priority = 1
+
+        async def rule(self) -> bool:
+            return True
+
+        async def handle(self) -> None:
+            calls.append("lower")
+
+    core.load_rules(Blocker, Sibling, Lower)
+    asyncio.run(core._handle_event(make_event(core)))
+    assert sorted(calls) == ["blocker", "sibling"]
+
+
+def test_stop_exception_stops_propagation():
+    core = Core(config_dict={})
+    calls: List[str] = []
+
+    class Stopper(Rule):
+        priority = 0
+
+        async def rule(self) -> bool:
+            return True
+
+        async def handle(self) -> None:
+            calls.append("stopper")
+            self.stop()
+
+    class Lower(Rule):
+        priority = 1
+
+        async def rule(self) -> bool:
+            return True
+
+        async def handle(self) -> None:
+            calls.append("lower")
+
+    core.load_rules(Stopper, Lower)
+    asyncio.run(core._handle_event(make_event(core)))
+    assert calls == ["stopper"]
+
+
+def test_events_of_one_session_are_handled_in_order():
+    core = Core(config_dict={"core": {"event_queue": {"workers": 4}}})
+    handled: List[str] = []
+
+    class Recorder(Rule):
+        async def rule(self) -> bool:
+            return True
+
+        async def handle(self) -> None:
+            # Later events of the session would overtake slower earlier ones
+            # if they were not handled in order
+            await asyncio.sleep(0.01 if self.event.message == "1" else 0)
+            handled.append(f"{self.event.session}:{self.event.message}")
+
+    core.load_rules(Recorder)
+
+    async def main() -> None:
+        await start_core(core)
+        for message in "123":
+            await core.handle_event(make_event(core, message, session="a"))
+            await core.handle_event(make_event(core, message, session="b"))
+        await core._stop_event_workers()
+        while core._handle_event_tasks:
+            await asyncio.gather(*core._handle_event_tasks)
+
+    asyncio.run(main())
+    assert [x for x in handled if x.startswith("a")] == ["a:1", "a:2", "a:3"]
+    assert [x for x in handled if x.startswith("b")] == ["b:1", "b:2", "b:3"]
+
+
+def test_event_queue_overflow_policies():
+    for overflow in ("drop_oldest", "reject"):
+        core = Core(
+            config_dict={
+                "core": {
+                    "event_queue": {"workers": 1, "max_size": 2, "overflow": overflow}
+                }
+            }
+        )
+
+        async def main() -> List[str]:
+            await start_core(core)
+            core._event_workers[0].cancel()
+            for message in "123":
+                await core.handle_event(make_event(core, message))
+            assert core.event_queue_depth == 2
+            return [
+                event.message for event, _ in core._event_queues[0]._queue  # type: ignore
+            ]
+
+        pending = asyncio.run(main())
+        if overflow == "drop_oldest":
+            assert pending == ["2", "3"]
+            assert core.dropped_events == 1
+        else:
+            assert pending == ["1", "2"]
+            assert core.rejected_events == 1
+
+
+def test_get_inside_rule_receives_event_from_same_session():
+    core = Core(config_dict={"core": {"event_queue": {"workers": 1}}})
+    answers: List[str] = []
+
+    class Asker(Rule):
+        async def rule(self) -> bool:
+            return self.event.message == "ask"
+
+        async def handle(self) -> None:
+            reply = await self.core.get(timeout=1)
+            answers.append(reply.message)
+
+    core.load_rules(Asker)
+
+    async def main() -> None:
+        await start_core(core)
+        await core.handle_event(make_event(core, "ask"))
+        await core.handle_event(make_event(core, "answer"))
+        await core._stop_event_workers()
+        while core._handle_event_tasks:
+            await asyncio.gather(*core._handle_event_tasks)
+
+    asyncio.run(main())
+    assert answers == ["answer"]
+
+
+def test_session_scopes_expire_and_close():
+    core = Core(config_dict={"core": {"dependency": {"max_sessions": 2}}})
+    core._reload_config_dict()
+
+    async def use(session: str) -> Dict[Any, Any]:
+        scopes = await core._get_dependency_scopes(make_event(core, session=session))
+        core._release_dependency_scopes(scopes)
+        return scopes
+
+    async def main() -> None:
+        alice = await use("alice")
+        again = await use("alice")
+        assert alice["session"] is again["session"]
+        assert alice["app"] is again["app"]
+
+        await use("bob")
+        await use("carol")
+        assert [key[1] for key in core._session_scopes] == ["bob", "carol"]
+
+        await core._close_dependency_scopes()
+        assert not core._session_scopes
+        assert core._app_scope is None
+
+    asyncio.run(main())
+
+
+def test_session_scopes_in_use_are_not_closed():
+    core = Core(config_dict={"core": {"dependency": {"max_sessions": 1}}})
+    core._reload_config_dict()
+    closed: List[str] = []
+
+    async def main() -> None:
+        alice = await core._get_dependency_scopes(make_event(core, session="alice"))
+        alice["session"].stack.callback(closed.append, "alice")
+
+        bob = await core._get_dependency_scopes(make_event(core, session="bob"))
+        bob["session"].stack.callback(closed.append, "bob")
+        assert [key[1] for key in core._session_scopes] == ["alice", "bob"]
+        assert closed == []
+
+        core._release_dependency_scopes(alice)
+        core._release_dependency_scopes(bob)
+        carol = await core._get_dependency_scopes(make_event(core, session="carol"))
+        core._release_dependency_scopes(carol)
+        assert closed == ["alice", "bob"]
+        assert [key[1] for key in core._session_scopes] == ["carol"]
+
+    asyncio.run(main())
+
+
+def test_get_only_tests_waiters_indexed_for_the_event():
+    core = Core(config_dict={})
+    tested: List[str] = []
+
+    def track(name: str) -> Any:
+        def func(event: FakeEvent) -> bool:
+            tested.append(name)
+            return True
+
+        return func
+
+    async def main() -> None:
+        core.should_exit = asyncio.Event()
+        alice = asyncio.create_task(core.get(track("alice"), session_id="alice"))
+        bob = asyncio.create_task(core.get(track("bob"), session_id="bob"))
+        anyone = asyncio.create_task(core.get(track("anyone"), max_try_times=0))
+        await asyncio.sleep(0)
+
+        assert await core._offer_to_waiters(make_event(core, "hi", session="bob"))
+        assert (await bob).message == "hi"
+        assert tested == ["bob"]
+
+        assert await core._offer_to_waiters(make_event(core, "yo", session="carol"))
+        assert (await anyone).message == "yo"
+        assert not alice.done()
+        alice.cancel()
+
+    asyncio.run(main())
+    assert not core._waiters
+
+
+def test_get_times_out_and_gives_up_after_max_try_times():
+    core = Core(config_dict={})
+
+    async def main() -> None:
+        core.should_exit = asyncio.Event()
+        with pytest.raises(GetEventTimeout):
+            await core.get(timeout=0.01)
+
+        never = asyncio.create_task(core.get(lambda _: False, max_try_times=1))
+        await asyncio.sleep(0)
+        for _ in range(2):
+            assert not await core._offer_to_waiters(make_event(core))
+        with pytest.raises(GetEventTimeout):
+            await never
+
+    asyncio.run(main())
+    assert not core._waiters
+    assert core._waiter_timer is None
+
+
+class FakeMessageEvent(MessageEvent[Any]):
+    message: str = ""
+
+    def get_sender_id(self) -> Union[None, int, str]:
+        return None
+
+    def get_plain_text(self) -> str:
+        return self.message
+
+    async def reply(self, message: str) -> Any: ...
+
+    async def is_same_sender(self, other: Any) -> bool:
+        return True
+
+
+def test_commands_are_routed_to_the_owning_rule():
+    core = Core(config_dict={})
+    calls: List[str] = []
+
+    class Dice(Rule):
+        @Rule.command("r")
+        async def roll(self, args: str) -> None:
+            calls.append(f"roll {args}")
+
+        async def rule(self) -> bool:
+            calls.append("dice rule")
+            return False
+
+    class Investigator(Rule):
+        @Rule.command("st")
+        async def set_attributes(self, args: str) -> None:
+            calls.append(f"st {args}")
+
+    class Logger(Rule):
+        priority = 1
+
+        async def rule(self) -> bool:
+            return True
+
+        async def handle(self) -> None:
+            calls.append(f"log {self.event.message}")
+
+    core.load_rules(Dice, Investigator, Logger)
+    core._reload_config_dict()
+
+    for message in (".st力量60", "hello"):
+        asyncio.run(
+            core._handle_event(
+                FakeMessageEvent(
+                    service=FakeService(core), type="message", rule="", message=message
+                )
+            )
+        )
+    # Dice owns a command but still sees the messages that are not commands
+    assert calls == ["st 力量60", "log .st力量60", "dice rule", "log hello"]
+
+
+def test_card_stores_and_rule_state_survive_a_restart(tmp_path):
+    from hrc.rule.BaseRule.CardStore import CardStore
+    from hrc.rule.BaseRule.CharacterCard import CardSchema
+
+    schema = CardSchema(["STR", "SAN"])
+    config = {"core": {"snapshot": {"path": str(tmp_path / "snapshot.bin")}}}
+    stores: List[CardStore] = []
+
+    def run_once(change: bool) -> Core:
+        core = Core(config_dict=config)
+
+        @core.core_run_hook
+        async def _(core: Core) -> None:
+            store = CardStore(schema)
+            core.register_card_store("cards", store)
+            stores.append(store)
+            if change:
+                store.add("alice", "g1", {"SAN": 45})
+                core.rule_state["Sanity"] = {"rounds": 2}
+            core.should_exit.set()
+
+        core.run()
+        return core
+
+    run_once(True)
+    core = run_once(False)
+    assert core.rule_state["Sanity"] == {"rounds": 2}
+    card = stores[1].get("alice", "g1")
+    assert card is not None and dict(card) == {"SAN": 45}
+
+
+def test_rule_state_backend_is_chosen_by_config(tmp_path):
+    config = {
+        "core": {"state": {"backend": "sqlite", "path": str(tmp_path / "s.db")}}
+    }
+
+    def run_once(change: bool) -> Core:
+        core = Core(config_dict=config)
+
+        @core.core_run_hook
+        async def _(core: Core) -> None:
+            if change:
+                core.rule_state["Sanity"] = {"rounds": 2}
+            else:
+                assert core.rule_state["Sanity"] == {"rounds": 2}
+            core.should_exit.set()
+
+        core.run()
+        return core
+
+    run_once(True)
+    assert run_once(False).rule_state.persistent
+
+
+def test_snapshot_state_moves_into_a_persistent_backend(tmp_path):
+    from hrc.snapshot import load_snapshot
+
+    path = str(tmp_path / "snapshot.bin")
+    seen: List[Any] = []
+
+    def run_once(state: Dict[str, Any]) -> None:
+        core = Core(config_dict={"core": {"snapshot": {"path": path}, "state": state}})
+
+        @core.core_run_hook
+        async def _(core: Core) -> None:
+            if not core.rule_state.persistent:
+                core.rule_state["Sanity"] = {"rounds": 2}
+            seen.append(core.rule_state.get("Sanity"))
+            core.should_exit.set()
+
+        core.run()
+
+    run_once({})
+    sqlite = {"backend": "sqlite", "path": str(tmp_path / "s.db")}
+    run_once(sqlite)
+    run_once(sqlite)
+    assert seen == [{"rounds": 2}] * 3
+    snapshot = load_snapshot(path)
+    assert snapshot is not None and snapshot.state == {"Sanity": {"rounds": 2}}
@@ -0,0 +1,240 @@
+import asyncio
+import time
+from contextlib import AsyncExitStack
+from typing import Any, AsyncGenerator, Dict, List
+
+import pytest
+
+from hrc.dependencies import (
+    DependencyScope,
+    Depends,
+    InnerDepends,
+    get_injection_plan,
+    invalidate_injection_plans,
+    solve_dependencies,
+)
+from hrc.event import Event
+from hrc.exceptions import DependencyScopeError
+
+
+class Session:
+    pass
+
+
+async def get_token() -> AsyncGenerator[str, None]:
+    yield "token"
+
+
+class Card:
+    session: Session = Depends()
+    token: str = Depends(get_token)
+
+
+def solve(dependent: Any, cache: Dict[Any, Any]) -> Any:
+    async def main() -> Any:
+        async with AsyncExitStack() as stack:
+            return await solve_dependencies(
+                dependent, use_cache=True, stack=stack, dependency_cache=cache
+            )
+
+    return asyncio.run(main())
+
+
+def test_injection_plan_is_compiled_once():
+    invalidate_injection_plans()
+    plan = get_injection_plan(Card)
+
+    assert plan.kind == "class"
+    assert plan.attributes == (
+        ("session", Session, True, "event"),
+        ("token", get_token, True, "event"),
+    )
+    assert get_injection_plan(Card) is plan
+
+
+def test_solving_does_not_mutate_depends():
+    invalidate_injection_plans()
+    card = solve(Card, {})
+
+    assert isinstance(card.session, Session)
+    assert card.token == "token"
+    assert isinstance(Card.__dict__["session"], InnerDepends)
+    assert Card.__dict__["session"].dependency is None
+
+
+def test_invalidate_injection_plans_by_module():
+    get_injection_plan(Card)
+    invalidate_injection_plans("some.other.module")
+    assert get_injection_plan(Card) is get_injection_plan(Card)
+
+    plan = get_injection_plan(Card)
+    invalidate_injection_plans(__name__)
+    assert get_injection_plan(Card) is not plan
+
+
+def test_independent_async_dependencies_are_entered_concurrently():
+    events: List[str] = []
+
+    async def slow(name: str) -> AsyncGenerator[str, None]:
+        events.append(f"enter {name}")
+        await asyncio.sleep(0.05)
+        yield name
+        events.append(f"exit {name}")
+
+    async def get_db() -> AsyncGenerator[str, None]:
+        async for x in slow("db"):
+            yield x
+
+    async def get_http() -> AsyncGenerator[str, None]:
+        async for x in slow("http"):
+            yield x
+
+    async def get_cards() -> AsyncGenerator[str, None]:
+        async for x in slow("cards"):
+            yield x
+
+    class Handler:
+        db: str = Depends(get_db)
+        http: str = Depends(get_http)
+        cards: str = Depends(get_cards)
+
+    start = time.perf_counter()
+    handler = solve(Handler, {})
+    elapsed = time.perf_counter() - start
+
+    assert (handler.db, handler.http, handler.cards) == ("db", "http", "cards")
+    assert elapsed < 0.12
+    entered = [x.split()[1] for x in events if x.startswith("enter")]
+    exited = [x.split()[1] for x in events if x.startswith("exit")]
+    assert exited == entered[::-1]
+
+
+def test_shared_dependency_is_built_once_and_torn_down_last():
+    events: List[str] = []
+
+    async def connection() -> AsyncGenerator[str, None]:
+        events.append("enter connection")
+        await asyncio.sleep(0.01)
+        yield "connection"
+        events.append("exit connection")
+
+    class Repository:
+        conn: str = Depends(connection)
+
+        async def __aenter__(self) -> "Repository":
+            events.append("enter repository")
+            return self
+
+        async def __aexit__(self, *_args: Any) -> None:
+            events.append("exit repository")
+
+    class Handler:
+        repository: Repository = Depends()
+        conn: str = Depends(connection)
+
+    solve(Handler, {})
+    assert events.count("enter connection") == 1
+    assert events[-1] == "exit connection"
+
+
+def test_failed_dependency_unwinds_entered_ones():
+    events: List[str] = []
+
+    async def get_ok() -> AsyncGenerator[str, None]:
+        events.append("enter ok")
+        try:
+            yield "ok"
+        finally:
+            events.append("exit ok")
+
+    async def get_broken() -> AsyncGenerator[str, None]:
+        await asyncio.sleep(0.01)
+        raise RuntimeError("broken")
+        yield "never"  # pragma: no cover
+
+    class Handler:
+        ok: str = Depends(get_ok)
+        broken: str = Depends(get_broken)
+
+    with pytest.raises(RuntimeError):
+        solve(Handler, {})
+    assert events == ["enter ok", "exit ok"]
+
+
+def test_scoped_dependencies_outlive_the_event():
+    built: List[str] = []
+
+    async def get_http() -> AsyncGenerator[str, None]:
+        built.append("http")
+        try:
+            yield "http"
+        finally:
+            built.append("close http")
+
+    class Sheet:
+        pass
+
+    class Handler:
+        http: str = Depends(get_http, scope="app")
+        sheet: Sheet = Depends(scope="session")
+        token: str = Depends(get_token)
+
+    async def main() -> None:
+        app = DependencyScope()
+        alice, bob = DependencyScope(), DependencyScope()
+        handlers = []
+        for session in (alice, alice, bob):
+            async with AsyncExitStack() as stack:
+                handlers.append(
+                    await solve_dependencies(
+                        Handler,
+                        use_cache=True,
+                        stack=stack,
+                        dependency_cache={},
+                        scopes={"app": app, "session": session},
+                    )
+                )
+        assert built == ["http"]
+        assert handlers[0].sheet is handlers[1].sheet
+        assert handlers[0].sheet is not handlers[2].sheet
+        await app.aclose()
+        assert built == ["http", "close http"]
+
+    asyncio.run(main())
+
+
+def test_depends_rejects_unknown_scope():
+    with pytest.raises(ValueError):
+        Depends(Session, scope="request")  # type: ignore
+
+
+def test_shorter_lived_scopes_are_rejected():
+    class Sheet:
+        pass
+
+    class Client:
+        sheet: Sheet = Depends(scope="session")
+
+    class Handler:
+        client: Client = Depends(scope="app")
+
+    class Listener:
+        event: Event[Any] = Depends(Event)
+
+    class Watcher:
+        listener: Listener = Depends(scope="session")
+
+    async def main(handler: Any) -> None:
+        async with AsyncExitStack() as stack:
+            await solve_dependencies(
+                handler,
+                use_cache=True,
+                stack=stack,
+                dependency_cache={},
+                scopes={"app": DependencyScope(), "session": DependencyScope()},
+            )
+
+    with pytest.raises(DependencyScopeError):
+        asyncio.run(main(Handler))
+    with pytest.raises(DependencyScopeError):
+        asyncio.run(main(Watcher))
@@ -0,0 +1,54 @@
+from array import array
+
+import pytest
+
+from hrc.dice import DiceExpr, compile_dice, distribution
+
+
+def test_compiled_expression_is_reusable():
+    expr = compile_dice("2d6 + 6")
+    assert expr.expression == "2d6 + 6"
+    assert all(8 <= expr.roll() <= 18 for _ in range(100))
+
+
+def test_roll_many_returns_a_buffer():
+    values = DiceExpr("4d6k3").roll_many(1000, seed=1)
+    assert isinstance(values, array) and values.typecode == "q"
+    assert len(memoryview(values)) == 1000
+    assert min(values) >= 3 and max(values) <= 18
+    assert DiceExpr("4d6k3").roll_many(1000, seed=1) == values
+
+
+def test_bonus_and_penalty_dice():
+    bonus = DiceExpr("b2").roll_many(2000, seed=1)
+    penalty = DiceExpr("p2").roll_many(2000, seed=1)
+    assert 1 <= min(bonus) and max(penalty) <= 100
+    assert sum(bonus) < sum(penalty)
+
+
+@pytest.mark.parametrize("expression", ["", "3d6+", "(1d6", "0d6", "1d0", "4d6k0"])
+def test_malformed_expressions_are_rejected(expression: str):
+    with pytest.raises(ValueError):
+        compile_dice(expression)
+
+
+def test_division_by_zero():
+    with pytest.raises(ZeroDivisionError):
+        DiceExpr("1/(1d1-1)").roll()
+
+
+def test_exact_distribution():
+    dist = distribution("3D6")
+    assert (dist.minimum, dist.maximum) == (3, 18)
+    assert dist.at_least(12) == pytest.approx(81 / 216)
+    assert dist.probability(12) == pytest.approx(25 / 216)
+    assert dist.mean == pytest.approx(10.5)
+    assert distribution(" 3d6 ") is dist
+
+
+def test_attribute_check_odds():
+    # Attribute x5 check against a d100 with two penalty dice
+    check = distribution("p2")
+    assert check.at_most(50) == pytest.approx(0.5**3, abs=0.01)
+    assert distribution("1d100").at_most(50) == pytest.approx(0.5)
+    assert distribution("2d6+6*5").minimum == 32
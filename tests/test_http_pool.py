@@ -0,0 +1,83 @@
+import asyncio
+from typing import Any, List
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from hrc.config import HttpClientConfig
+from hrc.core import Core
+from hrc.service.pool import HttpClientPool
+from hrc.service.utils import HttpClientService
+
+
+class Poller(HttpClientService[Any, None]):
+    request_timeout = 0.05
+
+    async def on_tick(self) -> None:
+        pass
+
+
+async def start_server() -> "tuple[web.AppRunner, str, List[Any]]":
+    peers: List[Any] = []
+
+    async def handle(request: web.Request) -> web.Response:
+        peers.append(request.transport)
+        if request.path == "/slow":
+            await asyncio.sleep(0.3)
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.add_routes([web.get("/", handle), web.get("/slow", handle)])
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}", peers
+
+
+def test_services_share_connections_with_their_own_timeouts():
+    async def main() -> None:
+        runner, url, peers = await start_server()
+        core = Core(config_dict={})
+
+        first, second = Poller(core), Poller(core)
+        await first.startup()
+        await second.startup()
+        for service in (first, second, first):
+            async with service.session.get(url) as response:
+                assert await response.text() == "ok"
+        # The connection kept alive by the first request serves all of them
+        assert len(set(map(id, peers))) == 1
+
+        with pytest.raises(asyncio.TimeoutError):
+            await first.session.get(f"{url}/slow")
+
+        await first.shutdown()
+        assert not core.http_client.connector.closed
+        async with second.session.get(url) as response:
+            assert response.status == 200
+
+        await second.shutdown()
+        connector = core.http_client.connector
+        await core.http_client.close()
+        assert connector.closed
+        await runner.cleanup()
+
+    asyncio.run(main())
+
+
+def test_pool_settings_and_default_timeout():
+    async def main() -> aiohttp.ClientTimeout:
+        pool = HttpClientPool(
+            HttpClientConfig(limit=5, limit_per_host=1, timeout=3, ttl_dns_cache=None)
+        )
+        assert (pool.connector.limit, pool.connector.limit_per_host) == (5, 1)
+        async with pool.session() as session:
+            timeout = session.timeout
+        await pool.close()
+        return timeout
+
+    timeout = asyncio.run(main())
+    assert (timeout.total, timeout.connect) == (3, 10)
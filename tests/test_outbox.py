@@ -0,0 +1,127 @@
+import asyncio
+import time
+from typing import Any, List, Tuple
+
+import pytest
+
+from hrc.core import Core
+from hrc.rule import Rule
+from hrc.service import Service
+from hrc.service.console import ConsoleService, ConsoleServiceEvent
+from hrc.service.outbox import Outbox, TokenBucket
+
+
+def test_token_bucket_limits_rate():
+    async def main() -> float:
+        bucket = TokenBucket(rate=100, burst=2)
+        start = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # Two tokens at once, then one every 10 ms
+    assert 0.035 <= asyncio.run(main()) < 0.5
+    assert not TokenBucket(rate=1, burst=1).try_acquire(2)
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+
+def test_messages_to_a_target_are_coalesced():
+    sent: List[Tuple[Any, List[str]]] = []
+
+    async def sender(target: Any, messages: List[str]) -> int:
+        sent.append((target, messages))
+        return len(sent)
+
+    async def main() -> None:
+        outbox = Outbox(sender, window=0.01, max_batch=3)
+        futures = [outbox.put("a", str(n)) for n in range(4)]
+        outbox.put("b", "x")
+        assert len(outbox) == 5
+        await outbox.flush()
+        # The first three are sent together, then "b", then the last one
+        assert [f.result() for f in futures] == [1, 1, 1, 3]
+        assert len(outbox) == 0
+
+    asyncio.run(main())
+    assert sent == [("a", ["0", "1", "2"]), ("b", ["x"]), ("a", ["3"])]
+
+
+def test_max_length_and_failures():
+    sent: List[List[str]] = []
+    errors: List[str] = []
+
+    async def sender(target: Any, messages: List[str]) -> None:
+        if "boom" in messages:
+            raise RuntimeError("boom")
+        sent.append(messages)
+
+    async def main() -> None:
+        outbox = Outbox(
+            sender,
+            window=0,
+            max_length=5,
+            on_error=lambda message, e: errors.append(message),
+        )
+        for message in ["abc", "de", "fgh", "far too long"]:
+            outbox.put(None, message)
+        await outbox.flush()
+        failed = outbox.put("t", "boom")
+        await outbox.flush()
+        with pytest.raises(RuntimeError):
+            failed.result()
+
+    asyncio.run(main())
+    assert sent == [["abc", "de"], ["fgh"], ["far too long"]]
+    assert errors == ["Send to 't' failed:"]
+
+
+def test_console_replies_are_batched(capsys):
+    async def main() -> None:
+        service = ConsoleService(Core(config_dict={}))
+        event = ConsoleServiceEvent(
+            service=service, type="message", message="", rule=""
+        )
+        for n in range(3):
+            await event.reply(f"roll {n}")
+        await service.outbox.flush()
+
+    asyncio.run(main())
+    assert capsys.readouterr().out == "Send a message: roll 0\nroll 1\nroll 2\n"
+
+
+class RecordingService(Service[Any, None]):
+    name = "recording"
+    log: List[str] = []
+
+    async def run(self) -> None:
+        await self.handle_event(
+            ConsoleServiceEvent(service=self, type="message", message="", rule="")
+        )
+        self.core.should_exit.set()
+
+    async def send(self, target: Any, message: str) -> None:
+        self.log.append(f"{target} {message}")
+
+    async def shutdown(self) -> None:
+        self.log.append("shutdown")
+
+
+def test_queued_messages_are_sent_before_the_service_stops():
+    core = Core(config_dict={})
+    core.load_services(RecordingService)
+    RecordingService.log = []
+
+    class Echo(Rule[Any, None, None]):
+        async def rule(self) -> bool:
+            return True
+
+        async def handle(self) -> None:
+            # Still running when the core starts shutting down
+            await asyncio.sleep(0.05)
+            self.event.service.queue_message("t", "one")
+            self.event.service.queue_message("t", "two")
+
+    core.load_rules(Echo)
+    core.run()
+    assert RecordingService.log == ["t one", "t two", "shutdown"]
@@ -0,0 +1,83 @@
+import asyncio
+from typing import Any, List, Optional
+
+from hrc.core import Core
+from hrc.service.utils import PollingService
+
+
+class Poller(PollingService[Any, None]):
+    delay = 0.01
+    max_delay = 0.08
+
+    def __init__(self, core: Core, replies: List[Optional[int]]) -> None:
+        super().__init__(core)
+        self.replies = replies
+        self.intervals: List[float] = []
+
+    async def on_tick(self) -> Optional[int]:
+        self.intervals.append(self.interval)
+        if not self.replies:
+            self.core.should_exit.set()
+            return 0
+        reply = self.replies.pop(0)
+        if reply is None:
+            await self.handle_event(object())  # type: ignore[arg-type]
+        return reply
+
+
+def make_core() -> Core:
+    core = Core(config_dict={})
+    core.should_exit = asyncio.Event()
+
+    async def handle_event(*args: Any, **kwargs: Any) -> None:
+        pass
+
+    core.handle_event = handle_event  # type: ignore[method-assign]
+    return core
+
+
+def test_interval_backs_off_when_idle_and_tightens_on_events():
+    async def main() -> Poller:
+        poller = Poller(make_core(), [0, 0, 0, 0, 0, 3, 0, None, 0])
+        await asyncio.wait_for(poller.run(), timeout=5)
+        return poller
+
+    poller = asyncio.run(main())
+    idle = [0.01, 0.02, 0.04, 0.08, 0.08, 0.08]
+    assert poller.intervals == [*idle, 0.01, 0.02, 0.01, 0.02]
+    # The last tick stops the core
+    assert poller.tick_stats.ticks == 10 and poller.tick_stats.idle == 8
+    assert poller.tick_stats.max_latency >= poller.tick_stats.last_latency
+
+
+class SlowPoller(PollingService[Any, None]):
+    delay = 0.01
+    max_delay = 0.01
+    create_task = True
+    max_in_flight = 2
+    running = 0
+    most_running = 0
+
+    async def on_tick(self) -> bool:
+        self.running += 1
+        self.most_running = max(self.most_running, self.running)
+        await asyncio.sleep(0.1)
+        self.running -= 1
+        return True
+
+
+def test_overlapping_ticks_are_capped():
+    async def main() -> SlowPoller:
+        poller = SlowPoller(make_core())
+        task = asyncio.create_task(poller.run())
+        await asyncio.sleep(0.25)
+        poller.core.should_exit.set()
+        await asyncio.wait_for(task, timeout=5)
+        return poller
+
+    poller = asyncio.run(main())
+    assert poller.most_running == 2
+    assert poller.tick_stats.skipped > 0
+    # Ticks still running are awaited when the service stops
+    assert poller.running == 0
+    assert poller.tick_stats.mean_latency >= 0.1
@@ -0,0 +1,124 @@
+import asyncio
+from typing import Any, List
+
+import aiohttp
+from aiohttp import web
+
+from hrc.config import ReconnectConfig
+from hrc.core import Core
+from hrc.service.reconnect import Backoff, ConnectionStats, Heartbeat, keep_connected
+from hrc.service.utils import WebSocketClientService
+
+
+def test_backoff_grows_caps_and_opens_the_circuit():
+    config = ReconnectConfig(
+        initial_delay=1, max_delay=5, jitter=0.5, failure_threshold=5, open_timeout=60
+    )
+    backoff = Backoff(config, rng=lambda: 0)
+    assert [backoff.failure() for _ in range(4)] == [1, 2, 4, 5]
+    assert not backoff.circuit_open
+    assert backoff.failure() == 60 and backoff.circuit_open
+    backoff.reset()
+    assert backoff.failure() == 1
+
+    # A jitter of 0.5 takes off at most half of the delay
+    assert Backoff(config, rng=lambda: 0.999).failure() > 0.5
+
+
+def test_keep_connected_retries_until_exit():
+    attempts: List[int] = []
+
+    async def main() -> ConnectionStats:
+        should_exit = asyncio.Event()
+        stats = ConnectionStats()
+
+        async def connect() -> None:
+            attempts.append(len(attempts))
+            if len(attempts) < 3:
+                raise OSError("refused")
+            stats.connected()
+            if len(attempts) == 4:
+                should_exit.set()
+
+        config = ReconnectConfig(initial_delay=0.001, stable_after=10)
+        await asyncio.wait_for(
+            keep_connected(connect, config, stats, should_exit), timeout=5
+        )
+        return stats
+
+    stats = asyncio.run(main())
+    assert len(attempts) == 4
+    assert (stats.connects, stats.reconnects, stats.failures) == (2, 1, 2)
+    assert isinstance(stats.last_error, OSError)
+    assert stats.uptime == 0
+
+
+class SilentSocket:
+    closed = False
+    pings = 0
+
+    async def ping(self) -> None:
+        self.pings += 1
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+def test_heartbeat_closes_a_silent_socket():
+    ws = SilentSocket()
+    asyncio.run(asyncio.wait_for(Heartbeat(ws, 0.01, 0.01).run(), timeout=5))
+    assert ws.closed and ws.pings == 1
+
+
+class Client(WebSocketClientService[Any, None]):
+    reconnect = ReconnectConfig(initial_delay=0.01, heartbeat_interval=0.05)
+
+    async def handle_response(self, msg: aiohttp.WSMessage) -> None:
+        self.received.append(msg.data)
+
+
+def test_client_reconnects_after_the_server_drops_it():
+    async def main() -> Client:
+        connections = 0
+
+        async def handle(request: web.Request) -> web.WebSocketResponse:
+            nonlocal connections
+            connections += 1
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            await ws.send_str(f"hello {connections}")
+            if connections < 3:
+                await ws.close()
+            else:
+                # Stay open, pings are answered by aiohttp
+                await ws.receive()
+            return ws
+
+        app = web.Application()
+        app.add_routes([web.get("/", handle)])
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+
+        core = Core(config_dict={})
+        core.should_exit = asyncio.Event()
+        client = Client(core)
+        client.url = f"ws://{host}:{port}/"
+        client.received = []
+        task = asyncio.create_task(client.run())
+        while len(client.received) < 3:
+            await asyncio.sleep(0.01)
+        # Heartbeats keep the last connection up
+        await asyncio.sleep(0.2)
+        assert client.stats.uptime > 0.1
+        core.should_exit.set()
+        await client.shutdown()
+        await asyncio.wait_for(task, timeout=5)
+        await runner.cleanup()
+        return client
+
+    client = asyncio.run(main())
+    assert client.received == ["hello 1", "hello 2", "hello 3"]
+    assert client.stats.reconnects == 2 and client.stats.connected_since is None
@@ -0,0 +1,168 @@
+from typing import Any
+
+from hrc.dependencies import Depends
+from hrc.rule import Rule
+from hrc.rule.BaseRule.CharacterCard import Attribute
+from hrc.rule.aliases import AliasIndex, AliasTarget
+from hrc.rule.router import CommandMatch, CommandRouter
+
+aliases = Rule.aliases
+
+
+class Attributes:
+    @aliases(["luck", "运气"], ignore_case=True)
+    def LUK(self) -> Any: ...
+
+    @aliases(["HitPoints", "生命值"])
+    def HP(self) -> Any: ...
+
+
+class Sheet(Rule):
+    attr: Attributes = Depends()
+
+
+def test_lookup_by_name_alias_and_case():
+    index = AliasIndex()
+    assert index.add_rule(Sheet) == []
+
+    assert index.lookup("LUK") == AliasTarget(Attributes, "LUK")
+    assert index.lookup("Luck") == AliasTarget(Attributes, "LUK")
+    assert index.lookup("运气") == AliasTarget(Attributes, "LUK")
+    assert index.lookup("生命值") == AliasTarget(Attributes, "HP")
+    assert index.lookup("hitpoints") is None
+    assert "HitPoints" in index
+
+
+def test_alias_collisions_are_reported():
+    class Other(Rule):
+        @aliases(["luck"], ignore_case=True)
+        def fortune(self) -> Any: ...
+
+    index = AliasIndex()
+    index.add_rule(Sheet)
+    (collision,) = index.add_rule(Other)
+
+    assert collision.alias == "luck"
+    assert collision.targets == (
+        AliasTarget(Attributes, "LUK"),
+        AliasTarget(Other, "fortune"),
+    )
+    assert index.lookup("LUCK") == AliasTarget(Attributes, "LUK")
+
+
+def test_redefined_aliased_method_is_reported():
+    class Duplicated(Rule):
+        @aliases(["DamageBonus"], ignore_case=True)
+        def DB(self) -> Any: ...
+
+        @aliases(["DamageBonus"], ignore_case=True)
+        def DB(self) -> Any: ...  # noqa: F811
+
+    (collision,) = AliasIndex().add_rule(Duplicated)
+    assert collision.alias == "DB"
+
+    class Card(Attribute):
+        @aliases(["DamageBonus"], ignore_case=True)
+        def DB(self) -> Any: ...
+
+        @aliases(["DamageBonus"], ignore_case=True)
+        def DB(self) -> Any: ...  # noqa: F811
+
+    class CardRule(Rule):
+        card: Card = Depends()
+
+    (collision,) = AliasIndex().add_rule(CardRule)
+    assert collision.targets[0] == AliasTarget(Card, "DB")
+
+
+def test_rules_are_indexed_incrementally():
+    class Other(Rule):
+        @aliases(["luck"], ignore_case=True)
+        def fortune(self) -> Any: ...
+
+    index = AliasIndex()
+    index.add_rule(Sheet)
+    index.add_rule(Other)
+
+    index.remove_rule(Sheet)
+    assert index.lookup("luck") == AliasTarget(Other, "fortune")
+    assert index.lookup("LUK") is None
+
+    index.add_rule(Sheet)
+    assert index.lookup("luck") == AliasTarget(Other, "fortune")
+    index.remove_rule(Other)
+    index.remove_rule(Sheet)
+    assert len(index) == 0
+
+
+class Dice(Rule):
+    @Rule.command("r")
+    async def roll(self, args: str) -> None: ...
+
+    @Rule.command("rh")
+    async def roll_hidden(self, args: str) -> None: ...
+
+    @aliases(["技能检定"])
+    @Rule.command("ra", ignore_case=True)
+    async def roll_skill(self, args: str) -> None: ...
+
+
+class Investigator(Rule):
+    @aliases(["属性"])
+    @Rule.command("st")
+    async def set_attributes(self, args: str) -> None: ...
+
+    @Rule.command("coc")
+    async def generate(self, args: str) -> None: ...
+
+
+def make_router() -> CommandRouter:
+    router = CommandRouter()
+    router.add_rule(Dice)
+    router.add_rule(Investigator)
+    return router
+
+
+def test_router_matches_longest_command():
+    router = make_router()
+
+    assert router.match(".r 3d6+2") == CommandMatch(Dice, "roll", "r", "3d6+2")
+    assert router.match(".rh3d6") == CommandMatch(Dice, "roll_hidden", "rh", "3d6")
+    assert router.match("。RA 侦查") == CommandMatch(Dice, "roll_skill", "ra", "侦查")
+    assert router.match(".技能检定侦查50") == CommandMatch(
+        Dice, "roll_skill", "技能检定", "侦查50"
+    )
+    assert router.match(".st力量60") == CommandMatch(
+        Investigator, "set_attributes", "st", "力量60"
+    )
+    assert router.match(".属性力量60").handler == "set_attributes"  # type: ignore
+    assert router.match(".coc7") == CommandMatch(Investigator, "generate", "coc", "7")
+
+
+def test_router_ignores_other_messages():
+    router = make_router()
+
+    assert router.match("r 3d6") is None
+    assert router.match(".x") is None
+    assert router.match(".") is None
+    assert router.match(".ST力量60") is None
+
+
+def test_router_rules_are_added_and_removed_incrementally():
+    router = make_router()
+    assert Dice in router and len(router) == 7
+
+    class Other(Rule):
+        @Rule.command("r")
+        async def roll(self, args: str) -> None: ...
+
+    assert router.add_rule(Other) == ["r"]
+    assert router.match(".r").rule is Dice  # type: ignore
+
+    router.remove_rule(Dice)
+    assert router.match(".r").rule is Other  # type: ignore
+    assert router.match(".rh") == CommandMatch(Other, "roll", "r", "h")
+    assert Dice not in router
+    router.remove_rule(Other)
+    router.remove_rule(Investigator)
+    assert not router._exact.children and not router._casefold.children
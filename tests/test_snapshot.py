@@ -0,0 +1,182 @@
+from array import array
+from pathlib import Path
+
+import pytest
+
+import hrc.snapshot as snapshot_module
+from hrc.rule.BaseRule.CardStore import CardStore
+from hrc.rule.BaseRule.CharacterCard import CardSchema
+from hrc.snapshot import SnapshotError, SnapshotWriter, load_snapshot
+
+SCHEMA = CardSchema(["STR", "POW", "SAN"])
+
+
+def make_store() -> CardStore:
+    store = CardStore(SCHEMA, indexes=["SAN"])
+    store.add("alice", "g1", {"STR": 50, "SAN": 45})
+    store.add("bob", "g1", {"STR": 60, "SAN": 20})
+    store.add("carol", "g2", {"POW": 80})
+    return store
+
+
+def save(writer: SnapshotWriter, *args, **kwargs) -> None:
+    writer.commit(*writer.prepare(*args, **kwargs))
+
+
+def restored(path: Path) -> CardStore:
+    snapshot = load_snapshot(path)
+    assert snapshot is not None
+    store = CardStore(SCHEMA, indexes=["SAN"])
+    assert snapshot.restore_store("coc", store)
+    return store
+
+
+def test_round_trip_views_the_file(tmp_path: Path):
+    path = tmp_path / "snapshot.bin"
+    store = make_store()
+    save(SnapshotWriter(path), {"coc": store}, {"rule": {"turn": 3}})
+
+    snapshot = load_snapshot(path)
+    assert snapshot is not None
+    assert snapshot.state == {"rule": {"turn": 3}}
+    copy = CardStore(SCHEMA, indexes=["SAN"])
+    snapshot.restore_store("coc", copy)
+    assert isinstance(copy.column("STR"), memoryview)
+    assert {(c.owner, c.group): dict(c) for c in copy} == {
+        (c.owner, c.group): dict(c) for c in store
+    }
+    assert copy.range("SAN", high=30) == store.range("SAN", high=30)
+
+    # Writes stay in memory and the store still grows
+    copy.get("alice", "g1")["SAN"] = 10  # type: ignore
+    copy.add("dave", "g2", {"STR": 70})
+    assert [c.owner for c in copy.cards(copy.range("SAN", high=30))] == [
+        "alice",
+        "bob",
+    ]
+    assert restored(path).get("alice", "g1")["SAN"] == 45  # type: ignore
+
+
+def test_changes_are_appended(tmp_path: Path):
+    path = tmp_path / "snapshot.bin"
+    store = make_store()
+    writer = SnapshotWriter(path)
+    save(writer, {"coc": store}, {"a": 1, "b": 2})
+    size = path.stat().st_size
+
+    store.get("bob", "g1")["SAN"] = 5  # type: ignore
+    store.remove("carol", "g2")
+    store.add("dave", "g3", {"POW": 40})
+    store.add("erin", "g3", {"POW": 41})
+    save(writer, {"coc": store}, {"a": 1, "c": 3})
+    assert path.stat().st_size > size
+
+    copy = restored(path)
+    assert {(c.owner, c.group): dict(c) for c in copy} == {
+        (c.owner, c.group): dict(c) for c in store
+    }
+    assert load_snapshot(path).state == {"a": 1, "c": 3}  # type: ignore
+
+
+def test_writer_compacts(tmp_path: Path):
+    path = tmp_path / "snapshot.bin"
+    store = make_store()
+    writer = SnapshotWriter(path)
+    save(writer, {"coc": store}, {})
+    full = path.stat().st_size
+    for i in range(20):
+        store.add(f"user{i}", "g1", {"STR": i})
+        save(writer, {"coc": store}, {})
+    assert path.stat().st_size <= 2 * full + 1024
+    assert len(restored(path)) == len(store)
+
+
+def test_truncated_record_is_dropped(tmp_path: Path):
+    path = tmp_path / "snapshot.bin"
+    store = make_store()
+    writer = SnapshotWriter(path)
+    save(writer, {"coc": store}, {})
+    size = path.stat().st_size
+    store.add("dave", "g3", {"POW": 40})
+    save(writer, {"coc": store}, {})
+    with path.open("r+b") as f:
+        f.truncate(path.stat().st_size - 3)
+
+    snapshot = load_snapshot(path)
+    assert snapshot is not None and snapshot.size == size
+    assert len(restored(path)) == 3
+
+    # Appending goes on after the last complete record
+    writer = SnapshotWriter(path, snapshot)
+    store.add("erin", "g3", {"POW": 41})
+    save(writer, {"coc": store}, {})
+    assert len(restored(path)) == 5
+
+
+def test_not_a_snapshot(tmp_path: Path):
+    path = tmp_path / "snapshot.bin"
+    assert load_snapshot(path) is None
+    path.write_bytes(b"not a snapshot file")
+    with pytest.raises(SnapshotError):
+        load_snapshot(path)
+
+
+def test_compacting_keeps_stores_not_registered_yet(tmp_path: Path):
+    path = tmp_path / "snapshot.bin"
+    store = make_store()
+    save(SnapshotWriter(path), {"coc": store, "other": make_store()}, {})
+    store.add("dave", "g3", {"POW": 40})
+    save(SnapshotWriter(path, load_snapshot(path)), {"coc": store}, {})
+
+    # Only "other" registers before the snapshot is compacted
+    snapshot = load_snapshot(path)
+    assert snapshot is not None
+    other = CardStore(SCHEMA, indexes=["SAN"])
+    assert snapshot.restore_store("other", other)
+    other.remove("bob", "g1")
+    writer = SnapshotWriter(path, snapshot)
+    save(writer, {"other": other}, {}, full=True)
+
+    assert {(c.owner, c.group) for c in restored(path)} == {
+        (c.owner, c.group) for c in store
+    }
+    reloaded = load_snapshot(path)
+    assert reloaded is not None
+    copy = CardStore(SCHEMA, indexes=["SAN"])
+    assert reloaded.restore_store("other", copy) and len(copy) == 2
+
+
+def test_writing_releases_the_mapping(tmp_path: Path):
+    path = tmp_path / "snapshot.bin"
+    save(SnapshotWriter(path), {"coc": make_store(), "other": make_store()}, {})
+    snapshot = load_snapshot(path)
+    assert snapshot is not None
+    copy = CardStore(SCHEMA, indexes=["SAN"])
+    snapshot.restore_store("coc", copy)
+    assert isinstance(copy.column("STR"), memoryview)
+
+    writer = SnapshotWriter(path, snapshot)
+    save(writer, {"coc": copy}, {}, full=True)
+    assert snapshot._mmap is None  # noqa: SLF001
+    assert isinstance(copy.column("STR"), array)
+    assert len(restored(path)) == 3
+
+    # A store restored in place is written in full, not as changed rows
+    copy.restore({}, ["zoe"], ["g9"])
+    save(writer, {"coc": copy}, {})
+    assert [(c.owner, c.group) for c in restored(path)] == [("zoe", "g9")]
+
+
+def test_values_are_little_endian(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    path = tmp_path / "snapshot.bin"
+    save(SnapshotWriter(path), {"coc": make_store()}, {})
+    native = path.read_bytes()
+
+    # As on a big-endian host, values are swapped when written and read
+    monkeypatch.setattr(snapshot_module, "_SWAP", True)
+    save(SnapshotWriter(path), {"coc": make_store()}, {})
+    assert path.read_bytes()[16:] != native[16:]
+    assert dict(restored(path).get("alice", "g1")) == {  # type: ignore
+        "STR": 50,
+        "SAN": 45,
+    }
@@ -0,0 +1,171 @@
+import asyncio
+import threading
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from hrc.state import (
+    MemoryStateBackend,
+    MmapStateBackend,
+    SQLiteStateBackend,
+    StateBackend,
+)
+
+
+def test_memory_backend_evicts_least_recently_used_and_expired(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("hrc.state.time.monotonic", lambda: now[0])
+    state = MemoryStateBackend(max_size=2, ttl=10)
+
+    state["a"] = 1
+    state["b"] = 2
+    assert state["a"] == 1
+    state["c"] = 3
+    assert "b" not in state and set(state) == {"a", "c"}
+
+    now[0] = 5
+    assert state["c"] == 3
+    now[0] = 12
+    assert "a" not in state and state.get("c") == 3
+    assert state.copy() == {"c": 3}
+
+
+@pytest.mark.parametrize(
+    "backend", [SQLiteStateBackend, MmapStateBackend], ids=["sqlite", "mmap"]
+)
+def test_persistent_backends_write_behind(tmp_path: Path, backend):
+    path = tmp_path / "state"
+
+    async def run(*steps) -> StateBackend:
+        state = backend(path, max_size=1)
+        await state.open()
+        for step in steps:
+            step(state)
+            await state.flush()
+        await state.close()
+        return state
+
+    def write(state: StateBackend) -> None:
+        state["counter"] = 1
+        state["dice"] = {"rolls": [1]}
+        state["gone"] = "x"
+
+    def change(state: StateBackend) -> None:
+        assert state["counter"] == 1 and "gone" in state
+        state["counter"] += 1
+        state["dice"]["rolls"].append(6)
+        del state["gone"]
+
+    def check(state: StateBackend) -> None:
+        assert dict(state) == {"counter": 2, "dice": {"rolls": [1, 6]}}
+
+    asyncio.run(run(write))
+    asyncio.run(run(change))
+    asyncio.run(run(check))
+
+
+def test_writes_wait_for_flush(tmp_path: Path):
+    async def main() -> None:
+        state = SQLiteStateBackend(tmp_path / "state.sqlite3", max_pending=2)
+        await state.open()
+        other = SQLiteStateBackend(tmp_path / "state.sqlite3")
+        await other.open()
+
+        state["a"] = 1
+        assert "a" not in other
+        await asyncio.wait_for(state.wait_for_flush(0.01), 1)
+        state["b"] = 2
+        # Enough changes are pending, a flush is due at once
+        await asyncio.wait_for(state.wait_for_flush(60), 1)
+        await state.flush()
+        assert other["a"] == 1 and other["b"] == 2
+        await state.close()
+        await other.close()
+
+    asyncio.run(main())
+
+
+def test_mmap_backend_compacts(tmp_path: Path):
+    path = tmp_path / "state.kv"
+
+    async def main() -> None:
+        state = MmapStateBackend(path)
+        await state.open()
+        for i in range(200):
+            state["rule"] = "x" * 100 + str(i)
+            await state.flush()
+        await state.close()
+
+    asyncio.run(main())
+    assert path.stat().st_size < 8192
+
+    async def reopen() -> None:
+        state = MmapStateBackend(path)
+        await state.open()
+        assert state["rule"].endswith("199")
+        await state.close()
+
+    asyncio.run(reopen())
+
+
+def test_mmap_backend_is_unmapped_while_written(tmp_path: Path):
+    path = tmp_path / "state.kv"
+    writing = threading.Event()
+    resume = threading.Event()
+
+    class Paused(MmapStateBackend):
+        def _write(self, prepared: Any) -> Any:
+            assert self._mmap is None
+            writing.set()
+            resume.wait(5)
+            return super()._write(prepared)
+
+    async def main() -> None:
+        state = Paused(path, max_size=1)
+        await state.open()
+        state["a"] = "old"
+        state["b"] = "x"
+        writing.set()
+        resume.set()
+        await state.flush()
+        assert "a" not in state._cache  # noqa: SLF001
+
+        writing.clear()
+        resume.clear()
+        state["b"] = "y"
+        flush = asyncio.create_task(state.flush())
+        await asyncio.to_thread(writing.wait, 5)
+        # Evicted, read from the file while it is not mapped
+        assert state["a"] == "old"
+        resume.set()
+        await flush
+        await state.close()
+
+    asyncio.run(main())
+
+
+def test_sqlite_backend_preloads_state(tmp_path: Path):
+    path = tmp_path / "state.sqlite3"
+
+    async def main() -> None:
+        state = SQLiteStateBackend(path)
+        await state.open()
+        state["a"] = 1
+        state["b"] = [2]
+        await state.close()
+
+        state = SQLiteStateBackend(path, max_size=1)
+        await state.open()
+        assert len(state._cache) == 1  # noqa: SLF001
+        await state.close()
+
+        state = SQLiteStateBackend(path)
+        await state.open()
+        reader = state._reader  # noqa: SLF001
+        state._reader = None  # noqa: SLF001
+        assert state["a"] == 1 and state["b"] == [2]
+        state._reader = reader  # noqa: SLF001
+        await state.close()
+
+    asyncio.run(main())
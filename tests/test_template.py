@@ -0,0 +1,86 @@
+from pathlib import Path
+from typing import Literal, Optional, Union
+
+import pytest
+
+from hrc.rule.BaseRule import Template
+from hrc.rule.BaseRule.Template import compile_template
+
+
+class Identity:
+    """
+    身份
+    ----
+
+    角色的基本信息。
+    """
+
+    def t_name(self) -> str:
+        """姓名: 给角色起个合适的名字"""
+
+    def t_dominant_hand(self) -> Optional[Literal["左撇子", "右撇子"]]:
+        """惯用手: 角色是右撇子还是左撇子？"""
+
+    def t_STR(self) -> Union[int, str]:
+        """力量(STR): 投掷 3D6 来决定力量。"""
+
+    def t_height(self) -> Union[int, str]:
+        """身高: 根据体型决定"""
+        return "普通身材"
+
+    def d_1(self):
+        """可以稍后再填写。"""
+
+
+@pytest.fixture(autouse=True)
+def clear_memory_cache():
+    Template._schemas.clear()
+    yield
+    Template._schemas.clear()
+
+
+def test_schema_describes_fields(tmp_path: Path):
+    schema = compile_template(Identity, cache_dir=tmp_path)
+
+    assert schema.title == "身份"
+    assert [field.name for field in schema.fields] == ["姓名", "惯用手", "力量", "身高"]
+    hand = schema.field("dominant_hand")
+    assert hand is not None
+    assert hand.literals == ("左撇子", "右撇子") and hand.optional
+    strength = schema.field("ｓｔｒ")
+    assert strength is not None
+    assert strength.types == ("int", "str") and strength.aliases == ("STR",)
+    assert [field.name for field in schema.fields if field.derived] == ["身高"]
+    assert schema.derived(Identity)["身高"](None) == "普通身材"
+    assert schema.notes == ("可以稍后再填写。",)
+
+
+def test_validate_and_render_help(tmp_path: Path):
+    schema = compile_template(Identity, cache_dir=tmp_path)
+
+    assert schema.validate({"姓名": "Alice", "STR": 12, "惯用手": None}) == []
+    assert schema.validate({"惯用手": "双手", "力量": 1.5, "魅力": 1}) == [
+        "惯用手只能是：左撇子、右撇子",
+        "力量应为：int/str",
+        "未知字段：魅力",
+    ]
+    assert schema.validate({"姓名": "Alice"}, partial=False) == ["缺少字段：力量"]
+    assert schema.render_help("str") == "力量(STR): 投掷 3D6 来决定力量。"
+    assert schema.render_help().startswith("身份\n姓名: 给角色起个合适的名字")
+
+
+def test_schema_is_cached_on_disk(tmp_path: Path, monkeypatch):
+    schema = compile_template(Identity, cache_dir=tmp_path)
+    assert len(list(tmp_path.glob("Identity-*.json"))) == 1
+
+    Template._schemas.clear()
+
+    def fail(*_args):
+        raise AssertionError("the template was compiled again")
+
+    monkeypatch.setattr(Template, "_compile", fail)
+    assert compile_template(Identity, cache_dir=tmp_path) == schema
+    # The in-memory cache answers without reading the file again
+    for path in tmp_path.iterdir():
+        path.unlink()
+    assert compile_template(Identity, cache_dir=tmp_path) is not None
@@ -0,0 +1,94 @@
+import asyncio
+from typing import Any, Tuple
+
+import aiohttp
+
+from hrc.core import Core
+from hrc.service.utils import WebSocketConnection, WebSocketServerService
+
+
+class EchoService(WebSocketServerService[Any, None]):
+    name = "echo"
+    host = "127.0.0.1"
+    port = 0
+    url = "/"
+
+    async def handle_ws_response(self, msg: aiohttp.WSMessage) -> None:
+        connection = self.current_connection
+        assert connection is not None
+        await self.broadcast({"from": connection.id, "text": msg.data})
+
+
+async def start(service: WebSocketServerService[Any, None]) -> str:
+    await service.startup()
+    await service.run()
+    host, port = service.runner.addresses[0][:2]
+    return f"ws://{host}:{port}/"
+
+
+def test_broadcast_reaches_every_client():
+    async def main() -> None:
+        service = EchoService(Core(config_dict={}))
+        url = await start(service)
+        async with aiohttp.ClientSession() as session:
+            clients = [await session.ws_connect(url) for _ in range(3)]
+            while len(service.connections) < 3:
+                await asyncio.sleep(0.01)
+
+            await clients[0].send_str("hello")
+            for client in clients:
+                assert await client.receive_json(timeout=5) == {
+                    "from": "1",
+                    "text": "hello",
+                }
+
+            assert await service.send("2", "only you")
+            assert await clients[1].receive_str(timeout=5) == "only you"
+            assert not await service.send("missing", "nobody")
+
+            await clients[2].close()
+            while len(service.connections) > 2:
+                await asyncio.sleep(0.01)
+            assert await service.broadcast(b"bytes", exclude=["1"]) == 1
+            assert await clients[1].receive_bytes(timeout=5) == b"bytes"
+
+            await service.shutdown()
+            assert service.connections == {}
+            for client in clients[:2]:
+                msg = await client.receive(timeout=5)
+                assert msg.type == aiohttp.WSMsgType.CLOSE
+
+    asyncio.run(main())
+
+
+class StalledSocket:
+    closed = False
+
+    async def send_str(self, data: str) -> None:
+        await asyncio.sleep(3600)
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+def test_slow_consumer_policies():
+    async def main(policy: str) -> Tuple[int, bool]:
+        service = EchoService(Core(config_dict={}))
+        service.send_queue_size = 2
+        service.slow_consumer = policy  # type: ignore[assignment]
+        service.connections = {}
+        ws = StalledSocket()
+        connection = WebSocketConnection("1", ws, None, 2)  # type: ignore[arg-type]
+        service.connections["1"] = connection
+        connection._writer = asyncio.create_task(service._write(connection))
+        for n in range(5):
+            await service.broadcast(n)
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        result = (connection.dropped, ws.closed)
+        connection._writer.cancel()
+        return result
+
+    # One frame is being written, two are queued and two are dropped
+    assert asyncio.run(main("drop")) == (2, False)
+    assert asyncio.run(main("disconnect")) == (0, True)
@@ -0,0 +1,87 @@
+from pathlib import Path
+
+import pytest
+
+from hrc.rule.BaseRule.Wiki import (
+    Wiki,
+    WikiIndex,
+    WikiIndexError,
+    build_index,
+    tokenize,
+)
+
+PAGES = [
+    (12, "力量（STR）衡量角色的肌肉力量。\n力量检定使用 STR×5。"),
+    (13, "敏捷(DEX)：角色的灵活与速度。ＤＥＸ检定用于闪避。"),
+    (14, "理智 (SAN) 代表角色的精神状态，理智检定失败会损失理智。"),
+    (20, "Appendix: STR, DEX and POW summary"),
+]
+
+
+@pytest.fixture
+def index(tmp_path: Path):
+    path = tmp_path / "book.wiki"
+    assert build_index(PAGES, path)[0] == 4
+    with WikiIndex(path) as index:
+        yield index
+
+
+def test_tokenize_uses_bigrams_and_normalizes_width():
+    assert list(tokenize("ＤＥＸ检定", unigrams=False)) == [("dex", 0), ("检定", 3)]
+    assert list(tokenize("力 a", unigrams=False)) == [("力", 0), ("a", 2)]
+    assert [t for t, _ in tokenize("力量")] == ["力", "力量", "量"]
+
+
+def test_search_ranks_phrases_first(index: WikiIndex):
+    hits = index.search("力量")
+    assert [hit.page for hit in hits] == [12]
+    assert "力量" in hits[0].snippet
+
+    assert [hit.page for hit in index.search("dex检定")] == [13]
+    assert [hit.page for hit in index.search("str")] == [12, 20]
+    assert [hit.page for hit in index.search("理智")] == [14]
+    assert index.search("不存在") == []
+    assert "检定" in index and "dex" in index
+
+
+def test_postings_hold_character_positions(index: WikiIndex):
+    postings = index.postings("理智")
+    assert list(postings) == [2]
+    text = index.page_text(2)
+    assert all(text[p : p + 2] == "理智" for p in postings[2])
+    assert index.page_number(2) == 14
+
+
+def test_wiki_searches_all_books(tmp_path: Path):
+    build_index(PAGES[:2], tmp_path / "a.wiki")
+    build_index(PAGES[2:], tmp_path / "b.wiki")
+
+    class Books(Wiki):
+        books = {
+            "A": tmp_path / "a.wiki",
+            "B": tmp_path / "b.wiki",
+            "missing": tmp_path / "c.wiki",
+        }
+
+    wiki = Books()
+    assert set(wiki.indexes) == {"A", "B"}
+    assert [(book, hit.page) for book, hit in wiki.search("SAN")] == [("B", 14)]
+
+
+def test_not_an_index(tmp_path: Path):
+    path = tmp_path / "book.wiki"
+    path.write_bytes(b"x" * 100)
+    with pytest.raises(WikiIndexError):
+        WikiIndex(path)
+
+
+def test_wiki_suggests_book_words_without_templates(tmp_path: Path):
+    build_index(PAGES, tmp_path / "a.wiki")
+
+    class Books(Wiki):
+        books = {"A": tmp_path / "a.wiki"}
+
+    wiki = Books()
+    assert len(wiki.terms) > 0
+    assert wiki.suggest("力亮")[0].term == "力量"
+    assert "力" not in wiki.terms
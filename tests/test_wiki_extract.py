@@ -0,0 +1,60 @@
+import json
+from pathlib import Path
+from typing import List
+
+from hrc.rule.BaseRule.Wiki import ExtractedPage, extract_pdf, read_extracted
+
+
+def fake_extractor(path: Path, start: int, end: int) -> List[ExtractedPage]:
+    return [
+        ExtractedPage(n, f"page {n}", [(0.0, 0.0, 10.0, 10.0, f"page {n}")])
+        for n in range(start + 1, end + 1)
+    ]
+
+
+def test_pages_are_written_in_order(tmp_path: Path):
+    output = tmp_path / "book.pages"
+    extracted = extract_pdf(
+        tmp_path / "book.pdf",
+        output,
+        workers=2,
+        chunk_size=3,
+        extractor=fake_extractor,
+        page_count=20,
+    )
+    assert extracted == 20
+    pages = list(read_extracted(output))
+    assert [page.number for page in pages] == list(range(1, 21))
+    assert pages[4].boxes == [(0.0, 0.0, 10.0, 10.0, "page 5")]
+
+
+def test_extraction_resumes_after_the_last_complete_page(tmp_path: Path):
+    output = tmp_path / "book.pages"
+    lines = [json.dumps({"source": "book.pdf", "pages": 10})]
+    lines += [
+        json.dumps({"page": n, "text": f"page {n}", "boxes": []}) for n in (1, 2, 3)
+    ]
+    output.write_text("\n".join(lines) + '\n{"page": 4, "te')
+
+    extracted = extract_pdf(
+        tmp_path / "book.pdf",
+        output,
+        workers=1,
+        chunk_size=4,
+        extractor=fake_extractor,
+        page_count=10,
+    )
+    assert extracted == 7
+    assert [page.number for page in read_extracted(output)] == list(range(1, 11))
+
+    # A different book starts over
+    assert (
+        extract_pdf(
+            tmp_path / "other.pdf",
+            output,
+            workers=1,
+            extractor=fake_extractor,
+            page_count=2,
+        )
+        == 2
+    )
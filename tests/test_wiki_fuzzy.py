@@ -0,0 +1,77 @@
+import random
+from typing import Union
+
+from hrc.rule.BaseRule.Wiki import (
+    FuzzyIndex,
+    Wiki,
+    normalize_term,
+    parse_term,
+    terms_from_template,
+)
+from hrc.rule.BaseRule.Wiki.fuzzy import edit_distance
+
+
+class Template:
+    def t_STR(self) -> Union[int, str]:
+        """力量(STR): 力量就是指角色的气力大小。"""
+
+    def t_DEX(self) -> Union[int, str]:
+        """敏捷(DEX): 敏捷是指角色的反应速度。"""
+
+    def t_first_aid(self) -> int:
+        """急救（30%或智力×1）：处理伤口的技能。"""
+
+    def t_agility(self) -> int:
+        """敏捷检定：敏捷×5。"""
+
+    def helper(self) -> None:
+        """Not a term."""
+
+
+def make_index() -> FuzzyIndex:
+    index = FuzzyIndex()
+    for name, aliases, _ in terms_from_template(Template):
+        index.add(name, aliases)
+    return index
+
+
+def test_parse_term():
+    assert parse_term("力量(STR): 气力大小。") == ("力量", ["STR"], "气力大小。")
+    assert parse_term("急救（30%或智力×1）：处理伤口") == ("急救", [], "处理伤口")
+    assert parse_term("Not a term.") is None
+    assert normalize_term("ＤＥＸ 检定！") == "dex检定"
+
+
+def test_typos_and_aliases_are_found():
+    index = make_index()
+    assert len(index) == 4
+
+    assert index.lookup("力亮")[0].term == "力量"
+    assert index.lookup("ｓｔｒ")[0][::2] == ("力量", 1.0)
+    assert index.lookup("dex检定")[0].term == "敏捷检定"
+    assert index.lookup("急求")[0].term == "急救"
+    assert index.lookup("完全无关的词") == []
+
+
+def test_edit_distance():
+    assert edit_distance("kitten", "sitting") == 3
+    assert edit_distance("力量", "力亮") == 1
+    assert edit_distance("abcdef", "x", limit=2) == 3
+
+
+def test_many_terms_only_compare_candidates():
+    rng = random.Random(0)
+    chars = [chr(c) for c in range(0x4E00, 0x4E00 + 500)]
+    index = make_index()
+    for _ in range(20000):
+        index.add("".join(rng.choice(chars) for _ in range(rng.randint(2, 5))))
+    assert index.lookup("力亮")[0].term == "力量"
+
+
+def test_wiki_suggests_template_terms():
+    class Books(Wiki):
+        templates = (Template,)
+
+    wiki = Books()
+    assert [match.term for match in wiki.suggest("力亮")] == ["力量"]
+    assert wiki.definitions["敏捷"] == "敏捷是指角色的反应速度。"